@@ -0,0 +1,532 @@
+import os
+import time
+import random
+import functools
+import tempfile
+import multiprocessing
+
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from PIL import Image, ImageFilter
+
+import fake_drive
+import download_content
+from download_content import DriveItemInfo, DriveItemType, DriveTree, PARENT_DIRECTORY_ID
+from download_content import MAX_LARGE_IMAGE_SIZE, MAX_MEDIUM_IMAGE_SIZE, MAX_PREVIEW_IMAGE_SIZE, PREVIEW_BLUR_AMOUNT
+from download_content import IMAGE_FORMATS, IMAGE_WIDTHS, IMAGE_CROPS
+
+
+def _generate_drive_items(item_count: int,
+                          albums: int = 500,
+                          seed: int = 0) -> dict[str, DriveItemInfo]:
+    """
+    Generates a synthetic tree of items, laid out like the website content in Google Drive
+
+    :param item_count: the approximate number of items to generate
+    :param albums: the number of portfolio albums
+    :param seed: the random seed
+
+    :return: the items as a dict, keyed by ID
+    """
+
+    rng = random.Random(seed)
+    items = {}
+
+    def add(item_id: str, parent_id: str, name: str, item_type: DriveItemType):
+        items[item_id] = DriveItemInfo(item_id=item_id,
+                                       item_type=item_type,
+                                       parent_id=parent_id,
+                                       name=name,
+                                       description='',
+                                       metadata={})
+
+    for name in ['home', 'portfolio', 'video']:
+        add(name, PARENT_DIRECTORY_ID, name, DriveItemType.DIRECTORY)
+
+    for album in range(albums):
+        add(f'album{album}', 'portfolio', f'album {album}', DriveItemType.DIRECTORY)
+
+    while len(items) < item_count:
+        album = rng.randrange(albums)
+        add(f'photo{len(items)}', f'album{album}', f'photo {len(items)}.jpg', DriveItemType.IMAGE)
+
+    return items
+
+
+def _linear_get_items_in_dir(items: dict[str, DriveItemInfo],
+                             names: list[str]) -> list[str]:
+    """
+    Gets the IDs of the items in the supplied directory by scanning every item (the approach replaced by DriveTree)
+
+    :param items: the dict of all items
+    :param names: the directory names as a list
+
+    :return: the list of items in that directory
+    """
+
+    parent_id = PARENT_DIRECTORY_ID
+    for directory_name in names:
+        parent_id = [
+            item_id
+            for item_id, item_info in items.items()
+            if item_info.name == directory_name
+            and item_info.parent_id == parent_id
+        ][0]
+
+    return [
+        item_id
+        for item_id, item_info in items.items()
+        if item_info.parent_id == parent_id
+    ]
+
+
+def _benchmark_drive_tree(item_count: int):
+    """
+    Compares resolving every portfolio album by scanning all items against resolving it with a DriveTree
+
+    :param item_count: the number of items in the synthetic tree
+    """
+
+    items = _generate_drive_items(item_count)
+    album_names = [
+        items[item_id].name
+        for item_id in items
+        if items[item_id].parent_id == 'portfolio'
+    ]
+
+    start_time = time.perf_counter()
+    tree = DriveTree(items)
+    build_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    indexed = [
+        download_content._get_items_in_dir(tree, ['portfolio', album_name])
+        for album_name in album_names
+    ]
+    indexed_time = time.perf_counter() - start_time
+
+    # The linear scan is far slower, so only a sample of albums is timed
+    sample = album_names[:20]
+    start_time = time.perf_counter()
+    linear = [
+        _linear_get_items_in_dir(items, ['portfolio', album_name])
+        for album_name in sample
+    ]
+    linear_time = (time.perf_counter() - start_time) * len(album_names) / len(sample)
+
+    if linear != indexed[:len(sample)]:
+        raise RuntimeError('DriveTree and the linear scan returned different items')
+
+    print(f'{len(items)} items, {len(album_names)} albums')
+    print(f'- Building the index:  {1000 * build_time:10.1f} ms')
+    print(f'- Indexed lookups:     {1000 * indexed_time:10.1f} ms')
+    print(f'- Linear scans (est.): {1000 * linear_time:10.1f} ms')
+
+
+def _legacy_generate_resized_images(image_file: str):
+    """
+    Generates the resized images by decoding the source once per version and blurring the preview at full size
+    (the approach replaced by download_content._generate_resized_images)
+
+    :param image_file: the path to the image file
+    """
+
+    def save(image: Image.Image, max_size: int, tag: str):
+        base, extension = os.path.splitext(image_file)
+        image.thumbnail(download_content._scaled_size(image.size, max_size))
+        image.save(f'{base}.{tag}{extension}')
+
+    with Image.open(image_file) as image:
+        preview = image.filter(ImageFilter.GaussianBlur(
+            radius=max(2, int(max(image.width, image.height) * PREVIEW_BLUR_AMOUNT))
+        ))
+        save(preview, MAX_PREVIEW_IMAGE_SIZE, 'preview')
+
+    for max_size, tag in [(MAX_MEDIUM_IMAGE_SIZE, 'medium'), (MAX_LARGE_IMAGE_SIZE, 'large')]:
+        with Image.open(image_file) as image:
+            save(image, max_size, tag)
+
+
+def _rss() -> int:
+    """
+    Gets the current resident memory of this process, where the OS reports it (Linux)
+
+    :return: the resident memory in bytes, or 0 if it is not known
+    """
+    try:
+        with open('/proc/self/status', 'r') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return 0
+
+
+def _time_in_process(function, image_file: str) -> tuple[float, float]:
+    """
+    Runs the supplied function, measuring the time it takes and how far it raises the resident memory of the process
+
+    This is submitted to a worker process. The peak is reset first (where the OS supports it), and the memory already
+    in use is subtracted, so that memory used before the function runs, by the worker or by an earlier task on it,
+    is not counted. This is the memory that download_content._estimated_image_memory estimates.
+
+    :param function: the function to run
+    :param image_file: the argument to the function
+
+    :return: the wall time in seconds and the increase in resident memory of the process, at its peak, in MB
+    """
+
+    download_content._reset_peak_rss()
+    rss = _rss()
+    start_time = time.perf_counter()
+    function(image_file)
+    elapsed = time.perf_counter() - start_time
+
+    peak_rss = (download_content._peak_rss() - rss) / (1024 * 1024)
+    return elapsed, peak_rss
+
+
+def _benchmark_images(megapixels: float):
+    """
+    Compares the time and peak memory of creating the resized versions of a large image
+
+    The single decode is run with the large, medium and preview versions only (as made by the approach it replaced),
+    and then with the default widths for responsive loading, as in a build.
+
+    :param megapixels: the size of the image in millions of pixels
+    """
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        image_file = os.path.join(temp_dir, 'image.jpg')
+        fake_drive.write_image(image_file, megapixels, random.Random(0))
+
+        with Image.open(image_file) as image:
+            print(f'{image.width} x {image.height} JPEG, {os.path.getsize(image_file) / 1e6:.1f} MB')
+            widths = download_content._responsive_widths(image.width, IMAGE_WIDTHS)
+            size = image.size
+
+        for name, function, estimated_memory in [
+            ('Decode per version', _legacy_generate_resized_images, None),
+            ('Single decode', download_content._generate_resized_images,
+             download_content._estimated_image_memory(size, 'jpg', [], [])),
+            ('Single decode, widths', functools.partial(download_content._generate_resized_images, widths=widths),
+             download_content._estimated_image_memory(size, 'jpg', widths, []))
+        ]:
+
+            # A fresh (spawned, not forked) process for each run, so that peak memory is not carried over
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                elapsed, peak_rss = executor.submit(_time_in_process, function, image_file).result()
+
+            estimate = f', estimated {estimated_memory / (1024 * 1024):7.1f} MB' if estimated_memory is not None else ''
+            print(f'- {name + ":":23s} {elapsed:6.2f} s, peak RSS +{peak_rss:7.1f} MB{estimate}')
+
+
+class _Stage:
+    """
+    Measures the wall time and peak memory of a stage of the pipeline
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.elapsed = 0.0
+        self.peak_rss = 0.0
+
+    def __enter__(self):
+        download_content._reset_peak_rss()
+        self._start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.elapsed = time.perf_counter() - self._start_time
+        self.peak_rss = download_content._peak_rss() / (1024 * 1024)
+
+    def report(self, details: str):
+        print(f'- {self.name + ":":10s} {self.elapsed:7.2f} s, peak RSS {self.peak_rss:7.1f} MB, {details}')
+
+
+def _benchmark_pipeline(item_count: int,
+                        content_dir: str | None,
+                        megapixels: float,
+                        latency: float,
+                        jobs: int,
+                        workers: int,
+                        image_crops: list[str]):
+    """
+    Runs each stage of download_content.py against a local stand-in for Google Drive
+
+    :param item_count: the number of items in Google Drive
+    :param content_dir: the directory holding the generated content (reused if it exists), or None for a temporary one
+    :param megapixels: the size of each generated image in millions of pixels
+    :param latency: a delay added to every request to the stand-in (in seconds)
+    :param jobs: the number of media files to download at the same time
+    :param workers: the number of processes used to create resized images
+    :param image_crops: the names of the crops of each image that are saved
+    """
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if content_dir is None:
+            content_dir = os.path.join(temp_dir, 'drive')
+
+        if not os.path.isdir(content_dir):
+            print(f'Generating {item_count} items in {content_dir}')
+            fake_drive.generate_content(content_dir, item_count, megapixels)
+
+        output_dir = os.path.join(temp_dir, 'output')
+        cache_dir = os.path.join(output_dir, '.cache')
+        os.makedirs(output_dir)
+
+        with fake_drive.FakeDriveServer(fake_drive.FakeDrive(content_dir), latency) as server:
+            service = download_content.DriveService(None, max_qps=1e6, api_endpoint=server.url)
+
+            with _Stage('Listing') as stage:
+                items = download_content._get_drive_items(service)
+                tree = DriveTree(items)
+            stage.report(f'{len(items)} items, {server.requests.get("/files", 0)} requests')
+
+            with _Stage('Content') as stage:
+                export_cache = download_content.ModifiedTimeCache(os.path.join(cache_dir, 'exports.json'))
+                comment_cache = download_content.ModifiedTimeCache(os.path.join(cache_dir, 'comments.json'))
+                download_content._export_documents(service, tree, export_cache)
+                home = download_content._get_home_content(service, tree, export_cache, comment_cache)
+                portfolio = download_content._get_portfolio_content(tree)
+                video = download_content._get_video_content(tree)
+            stage.report(f'{server.requests.get("/files/{id}/export", 0)} exports, '
+                         f'{server.requests.get("/files/{id}/comments", 0)} comment requests')
+
+            media = list({
+                media_item['file_id']: media_item
+                for media_item in [
+                    *home['photos'],
+                    *[quote['photo'] for quote in home['quotes']],
+                    *[name_check['photo'] for name_check in home['name_checks']],
+                    *[photo for photos in portfolio['photos'].values() for photo in photos],
+                    *video['videos'],
+                ]
+            }.values())
+
+            hash_cache = download_content.HashCache(os.path.join(cache_dir, 'hashes.json'))
+            with _Stage('Download') as stage:
+                with ThreadPoolExecutor(max_workers=jobs) as executor:
+                    downloads = list(executor.map(
+                        lambda media_item: download_content._download_media(service,
+                                                                            media_item['file_id'],
+                                                                            media_item['extension'],
+                                                                            int(media_item['size']),
+                                                                            media_item['sha256'],
+                                                                            output_dir,
+                                                                            hash_cache),
+                        media))
+            total_bytes = sum(int(media_item['size']) for media_item in media)
+            stage.report(f'{len(media)} files, {total_bytes / 1e6:.1f} MB, '
+                         f'{total_bytes / 1e6 / stage.elapsed:.1f} MB/s')
+
+            images = [
+                (file_path, download_content._responsive_widths(int(media_item['width']), IMAGE_WIDTHS))
+                for (file_path, _), media_item in zip(downloads, media)
+                if tree.items[media_item['file_id']].item_type == DriveItemType.IMAGE
+            ]
+            image_formats = download_content._supported_image_formats(list(IMAGE_FORMATS))
+            with _Stage('Resize') as stage:
+                with ProcessPoolExecutor(max_workers=workers,
+                                         mp_context=download_content._worker_context()) as executor:
+                    results = list(executor.map(download_content._process_image,
+                                                [file_path for file_path, _ in images],
+                                                [image_formats] * len(images),
+                                                [widths for _, widths in images],
+                                                [image_crops] * len(images),
+                                                [[0.5, 0.5]] * len(images)))
+            worker_peak_rss = max([result.peak_rss for result in results], default=0) / (1024 * 1024)
+            stage.report(f'{len(images)} images ({", ".join(image_formats) or "no other formats"}), '
+                         f'{len(images) / stage.elapsed:.1f} images/s, '
+                         f'worker peak RSS per image {worker_peak_rss:.1f} MB')
+
+
+def _benchmark_transports(item_count: int,
+                          content_dir: str | None,
+                          latency: float,
+                          connection_latency: float,
+                          jobs: int):
+    """
+    Runs the stages of download_content.py that make requests with each HTTP client, against a local stand-in
+    for Google Drive
+
+    :param item_count: the number of items in Google Drive
+    :param content_dir: the directory holding the generated content (reused if it exists), or None for a temporary one
+    :param latency: a delay added to every request to the stand-in (in seconds)
+    :param connection_latency: a delay added to every new connection to the stand-in (in seconds)
+    :param jobs: the number of media files to download at the same time
+    """
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if content_dir is None:
+            content_dir = os.path.join(temp_dir, 'drive')
+
+        if not os.path.isdir(content_dir):
+            print(f'Generating {item_count} items in {content_dir}')
+            fake_drive.generate_content(content_dir, item_count, 0.1)
+
+        drive = fake_drive.FakeDrive(content_dir)
+
+        for transport in download_content.TRANSPORTS:
+            print(transport)
+
+            output_dir = os.path.join(temp_dir, transport)
+            cache_dir = os.path.join(output_dir, '.cache')
+            os.makedirs(output_dir)
+
+            with fake_drive.FakeDriveServer(drive, latency, connection_latency=connection_latency) as server:
+                service = download_content.DriveService(None, max_qps=1e6, api_endpoint=server.url,
+                                                        transport=transport)
+
+                with _Stage('Listing') as stage:
+                    tree = DriveTree(download_content._get_drive_items(service))
+                stage.report(f'{server.requests.get("/files", 0)} requests, {server.connections} connections')
+                connections = server.connections
+
+                with _Stage('Content') as stage:
+                    export_cache = download_content.ModifiedTimeCache(os.path.join(cache_dir, 'exports.json'))
+                    comment_cache = download_content.ModifiedTimeCache(os.path.join(cache_dir, 'comments.json'))
+                    download_content._export_documents(service, tree, export_cache)
+                    home = download_content._get_home_content(service, tree, export_cache, comment_cache)
+                    portfolio = download_content._get_portfolio_content(tree)
+                    video = download_content._get_video_content(tree)
+                stage.report(f'{server.requests.get("/files/{id}/export", 0)} exports, '
+                             f'{server.requests.get("/files/{id}/comments", 0)} comment requests, '
+                             f'{server.connections - connections} connections')
+                connections = server.connections
+
+                media = list({
+                    media_item['file_id']: media_item
+                    for media_item in download_content._get_media(home, portfolio, video)
+                }.values())
+
+                hash_cache = download_content.HashCache(os.path.join(cache_dir, 'hashes.json'))
+                with _Stage('Download') as stage:
+                    with ThreadPoolExecutor(max_workers=jobs) as executor:
+                        list(executor.map(
+                            lambda media_item: download_content._download_media(service,
+                                                                                media_item['file_id'],
+                                                                                media_item['extension'],
+                                                                                int(media_item['size']),
+                                                                                media_item['sha256'],
+                                                                                output_dir,
+                                                                                hash_cache),
+                            media))
+                total_bytes = sum(int(media_item['size']) for media_item in media)
+                stage.report(f'{len(media)} files, {total_bytes / 1e6:.1f} MB, '
+                             f'{server.connections - connections} connections')
+
+                service.close()
+
+
+def main():
+    """
+    Runs the benchmarks
+    """
+
+    parser = ArgumentParser('benchmark.py',
+                            description='Benchmarks for download_content.py')
+
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    drive_tree_parser = subparsers.add_parser('drive-tree',
+                                              help='Path resolution over a synthetic tree of items')
+    drive_tree_parser.add_argument('--items',
+                                   help='The number of items in the tree',
+                                   type=int,
+                                   default=100_000)
+
+    images_parser = subparsers.add_parser('images',
+                                          help='Creation of the resized versions of a large image')
+    images_parser.add_argument('--megapixels',
+                               help='The size of the image in millions of pixels',
+                               type=float,
+                               default=40)
+
+    pipeline_parser = subparsers.add_parser('pipeline',
+                                            help='Each stage of download_content.py against a local stand-in for '
+                                                 'Google Drive')
+    pipeline_parser.add_argument('--items',
+                                 help='The number of items in Google Drive (several may be given)',
+                                 type=int,
+                                 nargs='+',
+                                 default=[100, 1000, 10000])
+    pipeline_parser.add_argument('--content-dir',
+                                 help='A directory in which to keep the generated content between runs. '
+                                      'A subdirectory is used for each number of items.',
+                                 default=None)
+    pipeline_parser.add_argument('--megapixels',
+                                 help='The size of each generated image in millions of pixels',
+                                 type=float,
+                                 default=1)
+    pipeline_parser.add_argument('--latency',
+                                 help='A delay added to every request (in seconds), to mimic a round trip to Google',
+                                 type=float,
+                                 default=0.02)
+    pipeline_parser.add_argument('--jobs',
+                                 help='The number of media files to download at the same time',
+                                 type=int,
+                                 default=4)
+    pipeline_parser.add_argument('--workers',
+                                 help='The number of processes used to create resized images',
+                                 type=int,
+                                 default=os.cpu_count() or 1)
+    pipeline_parser.add_argument('--crops',
+                                 help='The crops of each image that are saved. As with download_content.py, '
+                                      'none are saved by default.',
+                                 nargs='*',
+                                 choices=list(IMAGE_CROPS),
+                                 default=[])
+
+    transports_parser = subparsers.add_parser('transports',
+                                              help='The stages of download_content.py that make requests, with each '
+                                                   'HTTP client, against a local stand-in for Google Drive')
+    transports_parser.add_argument('--items',
+                                   help='The number of items in Google Drive (several may be given)',
+                                   type=int,
+                                   nargs='+',
+                                   default=[100, 1000])
+    transports_parser.add_argument('--content-dir',
+                                   help='A directory in which to keep the generated content between runs. '
+                                        'A subdirectory is used for each number of items.',
+                                   default=None)
+    transports_parser.add_argument('--latency',
+                                   help='A delay added to every request (in seconds), to mimic a round trip to Google',
+                                   type=float,
+                                   default=0.02)
+    transports_parser.add_argument('--connection-latency',
+                                   help='A delay added to every new connection (in seconds), to mimic the TCP and '
+                                        'TLS handshakes with Google',
+                                   type=float,
+                                   default=0.06)
+    transports_parser.add_argument('--jobs',
+                                   help='The number of media files to download at the same time',
+                                   type=int,
+                                   default=4)
+
+    args = parser.parse_args()
+
+    if args.benchmark in ('pipeline', 'transports'):
+        for item_count in args.items:
+            print(f'{item_count} items')
+            content_dir = None
+            if args.content_dir is not None:
+                content_dir = os.path.join(args.content_dir, str(item_count))
+
+            if args.benchmark == 'pipeline':
+                _benchmark_pipeline(item_count, content_dir, args.megapixels, args.latency, args.jobs, args.workers,
+                                    args.crops)
+            else:
+                _benchmark_transports(item_count, content_dir, args.latency, args.connection_latency, args.jobs)
+
+    elif args.benchmark == 'drive-tree':
+        _benchmark_drive_tree(args.items)
+
+    elif args.benchmark == 'images':
+        _benchmark_images(args.megapixels)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,37 @@
+import io
 import os
+import re
+import ssl
 import csv
+import zlib
 import json
+import base64
+import math
+import time
+import random
+import shutil
+import resource
+import asyncio
 import hashlib
-
-from dataclasses import dataclass
+import threading
+import subprocess
+import multiprocessing
+import http.client
+
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
 from enum import Enum
 from argparse import ArgumentParser
+from urllib.parse import urljoin, urlsplit
 from PIL import Image, ImageFilter
 
+import httplib2
 import google.oauth2.service_account as service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+from googleapiclient.errors import HttpError
 
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
 
@@ -40,6 +61,248 @@ PREVIEW_BLUR_AMOUNT = 0.03
 The amount of blur to apply when generating the preview image
 """
 
+IMAGE_MEMORY_BUDGET = 2048 * 1024 * 1024
+"""
+The default amount of memory (in bytes) that the images being processed at the same time may use between them,
+as estimated from the width and height of each image
+"""
+
+IMAGE_BYTES_PER_PIXEL = 4
+"""
+The memory used by each pixel of a decoded image (Pillow stores RGB images with 4 bytes per pixel)
+"""
+
+IMAGE_MEMORY_OVERHEAD = 1.3
+"""
+The factor by which the memory of the images held while creating the versions of an image is multiplied, to cover
+the buffers of the encoders and the overhead of the allocator. Measured increases in resident memory (with
+benchmark.py images) were up to 1.28 times the memory of the images alone.
+"""
+
+IMAGE_WIDTHS = [320, 640, 960, 1280, 1920, 2560]
+"""
+The widths at which each image is saved for responsive loading (srcset).
+Widths larger than the image are skipped, and a version at the width of the image is added instead.
+A version with the same size as the large or medium version is a copy of it.
+"""
+
+PLACEHOLDER_SIZE = 32
+"""
+The maximum width or height (in pixels) of the placeholder embedded in the media data of each image
+"""
+
+PLACEHOLDER_QUALITY = 60
+"""
+The JPEG quality of the placeholder embedded in the media data of each image
+"""
+
+IMAGE_CROPS = {
+    'hero': {'aspect_ratio': [16, 9], 'width': 1920},
+    'portrait': {'aspect_ratio': [4, 5], 'width': 960},
+    'tile': {'aspect_ratio': [1, 1], 'width': 640},
+}
+"""
+The crops of each image that are saved, centred on the focus point of the image,
+with the aspect ratio and the maximum width of each
+"""
+
+VIDEO_POSTER_TIME = 1.0
+"""
+The time (in seconds) into each video from which its poster frame is taken.
+The first frame is used for shorter videos.
+"""
+
+VIDEO_RENDITION = {
+    'max_height': 720,
+    'crf': 28,
+    'max_bitrate': '2M',
+    'audio_bitrate': '128k'
+}
+"""
+The settings of the smaller H.264 version of each video that is made for the web (with --video-renditions)
+"""
+
+DERIVED_MEDIA_FIELDS = ['formats', 'srcset', 'crops', 'poster', 'preview', 'rendition', 'placeholder', 'color']
+"""
+The fields of the media data that describe the files derived from each image or video, some of which are optional,
+so are removed from media data read from a previous run before the details of the current files are added
+"""
+
+IMAGE_FORMATS = {
+    'avif': {'large': 60, 'medium': 55, 'preview': 40},
+    'webp': {'large': 80, 'medium': 75, 'preview': 50},
+}
+"""
+The formats in which each resized image is saved, as well as the format of the original image,
+in order of preference, with the quality used for each size
+"""
+
+MAX_RETRIES = 6
+"""
+The number of times a failed request to Google Drive is retried before giving up
+"""
+
+RETRY_BASE_DELAY = 1.0
+"""
+The delay before the first retry of a failed request (in seconds). This doubles with each retry.
+"""
+
+RETRY_MAX_DELAY = 64.0
+"""
+The maximum delay before retrying a failed request (in seconds)
+"""
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+"""
+The HTTP statuses for which a request is retried
+"""
+
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+"""
+The reasons given with a 403 status for which a request is retried
+"""
+
+MAX_QUERIES_PER_SECOND = 20.0
+"""
+The default maximum rate at which requests are made to Google Drive, across all threads
+"""
+
+TRANSPORTS = ['httplib2', 'asyncio']
+"""
+The HTTP clients that requests to Google Drive can be made with:
+httplib2 (one client, with its own connections, per thread), or asyncio (a pool of connections shared by all threads)
+"""
+
+ASYNC_MAX_CONNECTIONS = 16
+"""
+The maximum number of connections that the asyncio transport opens to each host
+"""
+
+ASYNC_TIMEOUT = 300.0
+"""
+The time that the asyncio transport waits for each response (in seconds)
+"""
+
+LIST_PAGE_SIZE = 1000
+"""
+The number of items to request per page when listing a directory (the maximum allowed by Google Drive)
+"""
+
+LIST_CONCURRENCY = 8
+"""
+The maximum number of directories to list at the same time
+"""
+
+DOWNLOAD_CHUNK_SIZE = 32 * 1024 * 1024
+"""
+The default number of bytes requested at a time when downloading media
+"""
+
+DOWNLOAD_PROGRESS_STEP = 25
+"""
+The interval, in percent, at which the progress of a download is reported
+"""
+
+DRIVE_ITEM_FIELDS = [
+    'id',
+    'name',
+    'parents',
+    'mimeType',
+    'description',
+    'imageMediaMetadata',
+    'videoMediaMetadata',
+    'fileExtension',
+    'size',
+    'sha256Checksum',
+    'modifiedTime'
+]
+"""
+The fields requested for each item in Google Drive
+"""
+
+SYNC_STATE_FILE = 'sync_state.json'
+"""
+The name of the file, in the cache directory, that stores the state of the last sync with Google Drive
+"""
+
+HASH_CACHE_FILE = 'hash_cache.json'
+"""
+The name of the file, in the cache directory, that stores the hashes of the files in the output directory
+"""
+
+HASH_BUFFER_SIZE = 1024 * 1024
+"""
+The size of the buffer used when hashing files (in bytes)
+"""
+
+EXPORT_CACHE_FILE = 'export_cache.json'
+"""
+The name of the file, in the cache directory, that stores the exported contents of documents and sheets
+"""
+
+EXPORT_CONCURRENCY = 8
+"""
+The maximum number of documents and sheets exported at the same time
+"""
+
+EXPORTED_DOCUMENTS = [
+    (['contact'], 'text/csv'),
+    (['home', 'bio'], 'text/plain'),
+    (['home', 'introduction'], 'text/plain'),
+    (['home', 'quotes'], 'text/csv'),
+    (['home', 'name_checks'], 'text/csv'),
+]
+"""
+The paths of the documents and sheets used by the website, with the type to which each is exported
+"""
+
+COMMENT_CACHE_FILE = 'comment_cache.json'
+"""
+The name of the file, in the cache directory, that stores the comments on each photo
+"""
+
+COMMENT_PAGE_SIZE = 100
+"""
+The number of comments to request per page (the maximum allowed by Google Drive)
+"""
+
+COMMENT_CONCURRENCY = 8
+"""
+The maximum number of photos for which comments are requested at the same time
+"""
+
+BUILD_MANIFEST_FILE = 'build_manifest.json'
+"""
+The name of the file, in the cache directory, that records how each resized image was built
+"""
+
+CONTENT_FILES = ['contact.json', 'home.json', 'portfolio.json', 'video.json']
+"""
+The names of the content files written to the output directory
+"""
+
+BUILD_REPORT_FILE = 'build_report.json'
+"""
+The name of the file, in the output directory, to which the timings and counters of the build are written
+"""
+
+PRUNED_FILE_NAME = re.compile(
+    r'(?P<name>[A-Za-z0-9_-]+)'
+    rf'(?:\.(?:large|medium|preview|poster|web|w\d+|{"|".join(IMAGE_CROPS)}))?'
+    r'\.(?:jpe?g|png|gif|webp|avif|heic|tiff?|mp4|mov|m4v|webm)',
+    re.IGNORECASE
+)
+"""
+The names of the files in the output directory that may be pruned: media, and the files derived from it.
+The name must also be the hash of the media (BLOB_NAME), or the ID of an item in Google Drive, as used by earlier
+versions. Any other file is left alone.
+"""
+
+BLOB_NAME = re.compile(r'[0-9a-f]{64}')
+"""
+The names of the files in which media is stored, which are the sha256 hashes of their contents
+"""
+
 
 class DriveItemType(Enum):
     """
@@ -88,6 +351,11 @@ class DriveItemInfo:
     Arbitrary metadata - depends on the item type
     """
 
+    modified_time: str | None = None
+    """
+    The time at which the item was last modified (RFC 3339)
+    """
+
 
 @dataclass
 class Comment:
@@ -132,6 +400,106 @@ class CommandLineArguments:
     The path to the output directory
     """
 
+    cache_dir: str
+    """
+    The path to the directory in which the state of previous runs is stored
+    """
+
+    incremental: bool
+    """
+    True if only the changes since the previous run should be fetched from Google Drive
+    """
+
+    jobs: int
+    """
+    The number of media files to download at the same time
+    """
+
+    workers: int
+    """
+    The number of processes used to create resized images
+    """
+
+    verify: bool
+    """
+    True if files that have already been downloaded should be hashed again, rather than trusting cached hashes
+    """
+
+    chunk_size: int
+    """
+    The number of bytes requested at a time when downloading media
+    """
+
+    max_qps: float
+    """
+    The maximum rate at which requests are made to Google Drive
+    """
+
+    api_endpoint: str | None
+    """
+    The URL of the Google Drive API, if not the default
+    """
+
+    trace_file: str | None
+    """
+    The path to which a Chrome trace-event file of the build is written, if any
+    """
+
+    image_formats: list[str]
+    """
+    The formats in which each resized image is saved, as well as the format of the original image
+    """
+
+    image_widths: list[int]
+    """
+    The widths at which each image is saved for responsive loading
+    """
+
+    placeholders: bool
+    """
+    True if a tiny placeholder and the dominant colour of each image should be embedded in its media data
+    """
+
+    image_crops: list[str]
+    """
+    The names of the crops of each image that are saved
+    """
+
+    ffmpeg: str
+    """
+    The ffmpeg executable, used to create the poster frames and renditions of videos
+    """
+
+    video_renditions: bool
+    """
+    True if a smaller version of each video should be made for the web
+    """
+
+    prune: bool
+    """
+    True if files in the output directory that no longer belong to any media item should be deleted
+    """
+
+    prune_dry_run: bool
+    """
+    True if the files that would be pruned should be listed, but not deleted
+    """
+
+    plan_file: str | None
+    """
+    The file to which the work that a build would do is written, in which case nothing is built
+    """
+
+    transport: str
+    """
+    The HTTP client used for requests to Google Drive (one of TRANSPORTS)
+    """
+
+    memory_budget: int
+    """
+    The amount of memory (in bytes) that the images being processed at the same time may use between them
+    """
+
 
 def _parse_command_line_arguments() -> CommandLineArguments:
     """
@@ -148,166 +516,1522 @@ def _parse_command_line_arguments() -> CommandLineArguments:
                         help='The output directory',
                         default='./content')
 
+    parser.add_argument('--cache-dir',
+                        help='The directory in which to store the state of previous runs. It is kept out of the '
+                             'output directory, so that it is not bundled with the site.',
+                        default='./.cache')
+
+    parser.add_argument('--incremental', '-i',
+                        help='Only fetch the changes made in Google Drive since the previous run',
+                        action='store_true')
+
+    parser.add_argument('--jobs', '-j',
+                        help='The number of media files to download at the same time',
+                        type=int,
+                        default=4)
+
+    parser.add_argument('--workers', '-w',
+                        help='The number of processes used to create resized images (defaults to the number of CPUs)',
+                        type=int,
+                        default=os.cpu_count() or 1)
+
+    parser.add_argument('--verify',
+                        help='Hash every file that has already been downloaded, rather than trusting cached hashes',
+                        action='store_true')
+
+    parser.add_argument('--chunk-size',
+                        help='The number of megabytes requested at a time when downloading media',
+                        type=int,
+                        default=DOWNLOAD_CHUNK_SIZE // (1024 * 1024))
+
+    parser.add_argument('--max-qps',
+                        help='The maximum number of requests made to Google Drive per second, across all threads',
+                        type=float,
+                        default=MAX_QUERIES_PER_SECOND)
+
+    parser.add_argument('--api-endpoint',
+                        help='The URL of a local stand-in for the Google Drive API (see fake_drive.py). '
+                             'Credentials are not used.',
+                        default=None)
+
+    parser.add_argument('--trace',
+                        help='Also write the timings of the build to this Chrome trace-event file '
+                             '(viewable in chrome://tracing or https://ui.perfetto.dev)',
+                        default=None)
+
+    parser.add_argument('--formats',
+                        help='The formats in which each resized image is saved, as well as the format of the '
+                             'original image. Formats that Pillow cannot save are skipped.',
+                        nargs='*',
+                        choices=list(IMAGE_FORMATS),
+                        default=list(IMAGE_FORMATS))
+
+    parser.add_argument('--widths',
+                        help='The widths at which each image is saved for responsive loading. '
+                             'Widths larger than an image are skipped, and a version at the width of the image '
+                             'is added instead.',
+                        nargs='*',
+                        type=int,
+                        default=IMAGE_WIDTHS)
+
+    parser.add_argument('--placeholders',
+                        help='Embed a tiny placeholder (as a data URI) and the dominant colour of each image in '
+                             'the content, so that pages can be drawn before any image is requested',
+                        action='store_true')
+
+    parser.add_argument('--crops',
+                        help='The crops of each image that are saved, centred on the focus point of the image. '
+                             'None are saved by default, as the website does not use them yet.',
+                        nargs='*',
+                        choices=list(IMAGE_CROPS),
+                        default=[])
+
+    parser.add_argument('--ffmpeg',
+                        help='The ffmpeg executable, used to create the poster frames and renditions of videos. '
+                             'Videos are not processed if it is not found.',
+                        default='ffmpeg')
+
+    parser.add_argument('--video-renditions',
+                        help=f'Also make a smaller version of each video for the web '
+                             f'(H.264, at most {VIDEO_RENDITION["max_height"]} pixels high)',
+                        action='store_true')
+
+    parser.add_argument('--no-prune',
+                        help='Keep files in the output directory that no longer belong to any media item '
+                             '(e.g. photos that have been removed from Google Drive, and their resized versions)',
+                        action='store_true')
+
+    parser.add_argument('--prune-dry-run',
+                        help='List the files that would be pruned from the output directory, without deleting them',
+                        action='store_true')
+
+    parser.add_argument('--memory-budget',
+                        help='The number of megabytes that the images being processed at the same time may use '
+                             'between them, as estimated from their sizes. An image larger than this is processed '
+                             'on its own.',
+                        type=int,
+                        default=IMAGE_MEMORY_BUDGET // (1024 * 1024))
+
+    parser.add_argument('--transport',
+                        help='The HTTP client used for requests to Google Drive: httplib2, with its own connections '
+                             'for each thread, or asyncio, with a pool of kept-alive connections shared by all threads',
+                        choices=TRANSPORTS,
+                        default='httplib2')
+
+    parser.add_argument('--plan',
+                        help='Only list Google Drive and check the caches, then print the downloads, exports, '
+                             'comment requests and derived files that a build would make, and write them to this '
+                             'JSON file. Nothing is downloaded or built.',
+                        default=None)
+
     args = parser.parse_args()
 
+    if args.max_qps <= 0:
+        parser.error('--max-qps must be greater than 0')
+
+    output_dir = os.path.abspath(os.path.expanduser(args.output_dir))
+    cache_dir = os.path.abspath(os.path.expanduser(args.cache_dir))
+
     return CommandLineArguments(
         credentials_file=os.path.abspath(os.path.expanduser(args.credentials)),
-        output_dir=os.path.abspath(os.path.expanduser(args.output_dir))
+        output_dir=output_dir,
+        cache_dir=cache_dir,
+        incremental=args.incremental,
+        jobs=max(1, args.jobs),
+        workers=max(1, args.workers),
+        verify=args.verify,
+        chunk_size=max(1, args.chunk_size) * 1024 * 1024,
+        max_qps=args.max_qps,
+        api_endpoint=args.api_endpoint,
+        trace_file=os.path.abspath(os.path.expanduser(args.trace)) if args.trace else None,
+        image_formats=args.formats,
+        image_widths=sorted({width for width in args.widths if width > 0}),
+        placeholders=args.placeholders,
+        image_crops=args.crops,
+        ffmpeg=args.ffmpeg,
+        video_renditions=args.video_renditions,
+        prune=not args.no_prune,
+        prune_dry_run=args.prune_dry_run,
+        plan_file=os.path.abspath(os.path.expanduser(args.plan)) if args.plan else None,
+        transport=args.transport,
+        memory_budget=max(1, args.memory_budget) * 1024 * 1024
     )
 
 
-def _drive_service(credentials: service_account.Credentials):
+_print_lock = threading.Lock()
+
+
+def _log(message: str):
     """
-    Gets the Google drive service
+    Prints a message, without it being interleaved with messages from other threads
+
+    :param message: the message
     """
-    return build('drive', 'v3', credentials=credentials)
+    with _print_lock:
+        print(message, flush=True)
 
 
-def _get_drive_items(service) -> dict[str, DriveItemInfo]:
+class RateLimiter:
     """
-    Gets the  
+    A token bucket, shared between threads, which limits the rate at which requests are made
     """
 
-    items = []
-    nextPageToken = None
+    def __init__(self,
+                 rate: float,
+                 burst: int | None = None):
+        """
+        :param rate: the maximum average number of requests per second
+        :param burst: the maximum number of requests that can be made at once (defaults to the rate)
+        """
+        self._rate = rate
+        self._capacity = float(burst if burst is not None else max(1, int(rate)))
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Waits until a request can be made
+
+        :return: the time spent waiting (in seconds)
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+
+            # Take the token now, so that waiting threads queue up behind each other
+            self._tokens -= 1
+            delay = -self._tokens / self._rate if self._tokens < 0 else 0.0
+
+        if delay > 0:
+            time.sleep(delay)
+
+        return delay
+
+
+class AsyncHttp:
+    """
+    An HTTP/1.1 client, with the interface of httplib2.Http, that makes every request on one asyncio event loop
 
-    fields = [
-        'id',
-        'name',
-        'parents',
-        'mimeType',
-        'description',
-        'imageMediaMetadata',
-        'videoMediaMetadata',
-        'fileExtension',
-        'size',
-        'sha256Checksum'
-    ]
+    The event loop runs on its own thread, and requests from every thread are handed to it, so that they share a pool
+    of kept-alive connections to each host, rather than each thread opening (and keeping) its own.
+    Responses compressed with gzip or deflate are decompressed, and redirects of GET requests are followed.
+    """
 
-    while True:
+    def __init__(self,
+                 max_connections: int = ASYNC_MAX_CONNECTIONS,
+                 timeout: float = ASYNC_TIMEOUT):
+        """
+        :param max_connections: the maximum number of connections to each host
+        :param timeout: the time to wait for each response (in seconds)
+        """
+        self._max_connections = max_connections
+        self._timeout = timeout
+        self._ssl_context = ssl.create_default_context()
+        self._idle: dict[tuple, list[tuple[asyncio.StreamReader, asyncio.StreamWriter]]] = {}
+        self._slots: dict[tuple, asyncio.Semaphore] = {}
+        self.opened_connections = 0
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='AsyncHttp', daemon=True)
+        self._thread.start()
+
+    def request(self,
+                uri: str,
+                method: str = 'GET',
+                body: bytes | str | None = None,
+                headers: dict | None = None,
+                redirections: int = httplib2.DEFAULT_MAX_REDIRECTS,
+                connection_type=None) -> tuple[httplib2.Response, bytes]:
+        """
+        Makes a request, waiting for the response
+
+        :param uri: the URI
+        :param method: the HTTP method
+        :param body: the body of the request
+        :param headers: the headers of the request
+        :param redirections: the maximum number of redirects to follow
+        :param connection_type: not used, but accepted for compatibility with httplib2
+
+        :return: the response and its content
+        """
+        return asyncio.run_coroutine_threadsafe(self._request(uri, method, body, headers or {}, redirections),
+                                                self._loop).result()
+
+    def close(self):
+        """
+        Closes the idle connections and stops the event loop
+        """
+
+        async def close_connections():
+            for connections in self._idle.values():
+                for _, writer in connections:
+                    writer.close()
+
+            self._idle.clear()
+
+        asyncio.run_coroutine_threadsafe(close_connections(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _request(self,
+                       uri: str,
+                       method: str,
+                       body: bytes | str | None,
+                       headers: dict,
+                       redirections: int) -> tuple[httplib2.Response, bytes]:
+        """
+        Makes a request, following any redirects
+
+        :param uri: the URI
+        :param method: the HTTP method
+        :param body: the body of the request
+        :param headers: the headers of the request
+        :param redirections: the maximum number of redirects to follow
+
+        :return: the response and its content
+        """
+        while True:
+            status, reason, response_headers, content = await asyncio.wait_for(
+                self._send(uri, method, body, headers), self._timeout)
 
-        results = (
-            service.files()
-            .list(pageSize=10,
-                  fields=f"nextPageToken, files({','.join(fields)})",
-                  pageToken=nextPageToken,
-                  orderBy='name_natural,recency',
-                  includeItemsFromAllDrives=True,
-                  supportsAllDrives=True)
-            .execute()
-        )
+            location = response_headers.get('location')
+            if status in (301, 302, 303, 307, 308) and location and method in ('GET', 'HEAD') and redirections > 0:
+                uri = urljoin(uri, location)
+                redirections -= 1
+                continue
 
-        nextPageToken = results.get("nextPageToken", None)
+            response = httplib2.Response({**response_headers, 'status': str(status)})
+            response.reason = reason
+            response['content-location'] = uri
+
+            return response, content
+
+    async def _send(self,
+                    uri: str,
+                    method: str,
+                    body: bytes | str | None,
+                    headers: dict) -> tuple[int, str, dict[str, str], bytes]:
+        """
+        Sends a request on a pooled connection and reads the response
+
+        :param uri: the URI
+        :param method: the HTTP method
+        :param body: the body of the request
+        :param headers: the headers of the request
+
+        :return: the status, the reason, the headers (with lower case names) and the content of the response
+        """
+        url = urlsplit(uri)
+        secure = url.scheme == 'https'
+        key = (url.scheme, url.hostname, url.port or (443 if secure else 80))
+
+        target = url.path or '/'
+        if url.query:
+            target += f'?{url.query}'
+
+        if isinstance(body, str):
+            body = body.encode()
+
+        request_headers = {
+            'host': url.netloc,
+            'accept-encoding': 'gzip, deflate'
+        }
+        request_headers.update({name.lower(): value for name, value in headers.items()})
+        if body or method in ('POST', 'PUT', 'PATCH'):
+            request_headers['content-length'] = str(len(body or b''))
+
+        request = ''.join([
+            f'{method} {target} HTTP/1.1\r\n',
+            *[f'{name}: {value}\r\n' for name, value in request_headers.items()],
+            '\r\n'
+        ]).encode('latin-1') + (body or b'')
+
+        slots = self._slots.setdefault(key, asyncio.Semaphore(self._max_connections))
+        async with slots:
+            idle = self._idle.setdefault(key, [])
+            while True:
+                reused = len(idle) > 0
+                reader, writer = idle.pop() if reused else await self._connect(*key)
+
+                try:
+                    writer.write(request)
+                    await writer.drain()
+                    status, reason, response_headers, content, keep_alive = await self._read_response(reader, method)
+
+                except (ConnectionError, asyncio.IncompleteReadError) as error:
+                    writer.close()
+
+                    # The server may have closed a kept-alive connection, so the request is made again on a new one
+                    if reused:
+                        continue
+
+                    if isinstance(error, asyncio.IncompleteReadError):
+                        raise http.client.IncompleteRead(error.partial, error.expected) from error
+
+                    raise
+
+                except BaseException:
+                    # The connection is left part way through a response, so cannot be used again
+                    writer.close()
+                    raise
+
+                if keep_alive:
+                    idle.append((reader, writer))
+                else:
+                    writer.close()
+
+                return status, reason, response_headers, content
+
+    async def _connect(self,
+                       scheme: str,
+                       host: str,
+                       port: int) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """
+        Opens a connection
+
+        :param scheme: the URI scheme (http or https)
+        :param host: the host name
+        :param port: the port
+
+        :return: the reader and writer of the connection
+        """
+        connection = await asyncio.open_connection(host, port, ssl=self._ssl_context if scheme == 'https' else None)
+        self.opened_connections += 1
+        return connection
+
+    @staticmethod
+    async def _read_response(reader: asyncio.StreamReader,
+                             method: str) -> tuple[int, str, dict[str, str], bytes, bool]:
+        """
+        Reads a response
+
+        :param reader: the reader of the connection
+        :param method: the HTTP method of the request
+
+        :return: the status, the reason, the headers (with lower case names) and the content of the response,
+                 and True if the connection can be used again
+        """
+        while True:
+            status_line = await reader.readline()
+            if not status_line:
+                raise http.client.RemoteDisconnected('Remote end closed connection without response')
 
-        items += results.get("files", [])
+            version, status, *reason = status_line.decode('latin-1').split(maxsplit=2)
+            status = int(status)
 
-        if nextPageToken is None:
-            break
+            headers = {}
+            while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                name, _, value = line.decode('latin-1').partition(':')
+                name = name.strip().lower()
+                headers[name] = f'{headers[name]}, {value.strip()}' if name in headers else value.strip()
 
-    result = {}
-    for item in items:
-        item_id = item['id']
-        name = item['name']
-        mime_type = str(item['mimeType'])
-        metadata = {}
-
-        if mime_type == 'application/vnd.google-apps.document':
-            item_type = DriveItemType.DOCUMENT
-        elif mime_type == 'application/vnd.google-apps.spreadsheet':
-            item_type = DriveItemType.SHEET
-        elif mime_type.startswith('image/'):
-            item_type = DriveItemType.IMAGE
-
-            image_metadata = item['imageMediaMetadata']
-            metadata['width'] = image_metadata['width']
-            metadata['height'] = image_metadata['height']
-            metadata['extension'] = item['fileExtension']
-            metadata['size'] = item['size']
-            metadata['sha256'] = item['sha256Checksum']
-
-        elif mime_type.startswith('video/'):
-            item_type = DriveItemType.VIDEO
-
-            video_metadata = item['videoMediaMetadata']
-            metadata['width'] = video_metadata['width']
-            metadata['height'] = video_metadata['height']
-            metadata['duration_ms'] = video_metadata['durationMillis']
-            metadata['extension'] = item['fileExtension']
-            metadata['size'] = item['size']
-            metadata['sha256'] = item['sha256Checksum']
-
-        elif mime_type == 'application/vnd.google-apps.folder':
-            item_type = DriveItemType.DIRECTORY
-        else:
-            print(
-                f'Skipping {name} ({item_id}) as it has an unknown type: {mime_type}')
+            # Interim responses (e.g. 100 Continue) are followed by the actual response
+            if status >= 200:
+                break
 
-        parent_id = None
-        parents = item['parents'] if 'parents' in item else []
-        if parents:
-            if len(parents) > 1:
-                raise RuntimeError(
-                    f'Google Drive item "{name}" has {len(parents)} parents. Expected 1.')
+        keep_alive = version == 'HTTP/1.1' and 'close' not in headers.get('connection', '').lower()
 
-            parent_id = parents[0]
+        if method == 'HEAD' or status in (204, 304):
+            content = b''
 
-        description = None
-        if 'description' in item:
-            description = item['description']
+        elif 'chunked' in headers.get('transfer-encoding', '').lower():
+            chunks = []
+            while size := int((await reader.readline()).split(b';')[0], 16):
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
 
-        result[item_id] = DriveItemInfo(
-            item_id=item_id,
-            item_type=item_type,
-            parent_id=parent_id,
-            name=name,
-            description=description,
-            metadata=metadata
-        )
+            # Skip the trailers
+            while await reader.readline() not in (b'\r\n', b'\n', b''):
+                pass
 
-    return result
+            content = b''.join(chunks)
 
+        elif 'content-length' in headers:
+            content = await reader.readexactly(int(headers['content-length']))
 
-def _get_comments(service,
-                  item_id: str) -> list[Comment]:
-    """
-    Gets the comments on the supplied item
+        else:
+            content = await reader.read()
+            keep_alive = False
 
-    :param service: the drive service
-    :param item_id: the ID of the item from which comments should be retrieved
+        encoding = headers.pop('content-encoding', '').lower()
+        if encoding in ('gzip', 'deflate') and content:
+            try:
+                # Detects gzip and zlib headers
+                content = zlib.decompress(content, zlib.MAX_WBITS | 32)
+            except zlib.error:
+                content = zlib.decompress(content, -zlib.MAX_WBITS)
 
-    :return: the comments
+            headers['-content-encoding'] = encoding
+            headers['content-length'] = str(len(content))
+
+        return status, ' '.join(reason).strip(), headers, content, keep_alive
+
+
+@dataclass
+class EndpointStatistics:
+    """
+    Counters for the requests made to an endpoint of the Google Drive API
     """
-    
-    comments = []
-    nextPageToken = None
 
-    fields = [
-        'id',
-        'content',
-        'anchor',
-    ]
+    calls: int = 0
+    """
+    The number of requests made, including retries
+    """
 
-    while True:
+    retries: int = 0
+    """
+    The number of requests that were retried
+    """
 
-        results = (
-            service.comments()
-            .list(fileId=item_id,
-                  pageSize=10,
-                  fields=f"nextPageToken, comments({','.join(fields)})",
-                  pageToken=nextPageToken)
-            .execute()
-        )
+    throttled_seconds: float = 0.0
+    """
+    The time spent waiting for the rate limiter or before retrying (in seconds)
+    """
 
-        nextPageToken = results.get("nextPageToken", None)
+    received_bytes: int = 0
+    """
+    The number of bytes of file content received (exports and downloads only)
+    """
 
-        comments += results.get("comments", [])
 
-        if nextPageToken is None:
-            break
+class DriveService:
+    """
+    A thread-safe wrapper around the Google Drive service
 
+    The httplib2 transport used by googleapiclient is not thread-safe,
+    so every thread is given its own authorised HTTP client which is passed to each request.
+    With the asyncio transport, these clients all make their requests through one shared pool of connections.
+
+    Every request goes through a rate limiter shared by all threads,
+    and requests that fail with a transient error are retried with exponential backoff.
+    """
+
+    def __init__(self,
+                 credentials: service_account.Credentials | None,
+                 max_qps: float = MAX_QUERIES_PER_SECOND,
+                 api_endpoint: str | None = None,
+                 transport: str = 'httplib2'):
+        """
+        :param credentials: the service account credentials, or None to make unauthenticated requests
+        :param max_qps: the maximum number of requests per second
+        :param api_endpoint: the URL of the Google Drive API, if not the default (e.g. a local stand-in)
+        :param transport: the HTTP client used for requests (one of TRANSPORTS)
+        """
+        self._credentials = credentials
+        self._async_http = AsyncHttp() if transport == 'asyncio' else None
+
+        client_options = {'api_endpoint': api_endpoint} if api_endpoint else None
+        if credentials is None:
+            self._resource = build('drive', 'v3', http=httplib2.Http(), client_options=client_options)
+        else:
+            self._resource = build('drive', 'v3', credentials=credentials, client_options=client_options)
+
+        self._local = threading.local()
+        self._rate_limiter = RateLimiter(max_qps)
+        self._statistics_lock = threading.Lock()
+        self._statistics: dict[str, EndpointStatistics] = {}
+
+    def files(self):
+        """
+        Gets the files resource
+        """
+        return self._resource.files()
+
+    def comments(self):
+        """
+        Gets the comments resource
+        """
+        return self._resource.comments()
+
+    def changes(self):
+        """
+        Gets the changes resource
+        """
+        return self._resource.changes()
+
+    def http(self) -> httplib2.Http:
+        """
+        Gets the authorised HTTP client for the calling thread
+        """
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._async_http if self._async_http is not None else httplib2.Http()
+            if self._credentials is not None:
+                http = AuthorizedHttp(self._credentials, http=http)
+
+            self._local.http = http
+
+        return http
+
+    def close(self):
+        """
+        Closes the connections of the asyncio transport, if it is used
+        """
+        if self._async_http is not None:
+            self._async_http.close()
+
+    def statistics(self) -> dict[str, EndpointStatistics]:
+        """
+        Gets a copy of the counters for each endpoint
+        """
+        with self._statistics_lock:
+            return {
+                endpoint: EndpointStatistics(**asdict(statistics))
+                for endpoint, statistics in self._statistics.items()
+            }
+
+    def thread_statistics(self) -> EndpointStatistics:
+        """
+        Gets a copy of the counters for the requests made by the calling thread, to all endpoints
+        """
+        statistics = getattr(self._local, 'statistics', None)
+        return EndpointStatistics(**asdict(statistics)) if statistics is not None else EndpointStatistics()
+
+    def _count(self,
+               endpoint: str,
+               retries: int = 0,
+               throttled_seconds: float = 0.0,
+               received_bytes: int = 0):
+        """
+        Adds to the counters for an endpoint, and to those of the calling thread
+
+        :param endpoint: the endpoint
+        :param retries: the number of retries to add
+        :param throttled_seconds: the time spent waiting to add
+        :param received_bytes: the number of bytes of file content received to add
+        """
+        thread_statistics = getattr(self._local, 'statistics', None)
+        if thread_statistics is None:
+            thread_statistics = self._local.statistics = EndpointStatistics()
+
+        with self._statistics_lock:
+            for statistics in [self._statistics.setdefault(endpoint, EndpointStatistics()), thread_statistics]:
+                statistics.calls += 1
+                statistics.retries += retries
+                statistics.throttled_seconds += throttled_seconds
+                statistics.received_bytes += received_bytes
+
+    @staticmethod
+    def _retry_delay(error: Exception,
+                     attempt: int) -> float | None:
+        """
+        Gets how long to wait before retrying a request that failed
+
+        :param error: the error raised by the request
+        :param attempt: the number of attempts made so far
+
+        :return: the delay in seconds, or None if the request should not be retried
+        """
+        if isinstance(error, HttpError):
+            status = error.resp.status
+            reasons = {
+                detail.get('reason')
+                for detail in (error.error_details or [])
+                if isinstance(detail, dict)
+            }
+
+            if status not in RETRY_STATUSES and not (status == 403 and reasons & RATE_LIMIT_REASONS):
+                return None
+
+            retry_after = error.resp.get('retry-after')
+            if retry_after is not None and retry_after.isdigit():
+                return float(retry_after)
+
+        # Full jitter, so that threads that failed together do not retry together
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+    def call(self,
+             endpoint: str,
+             function):
+        """
+        Calls the supplied function, which makes a single request, retrying it if it fails with a transient error
+
+        :param endpoint: the name of the endpoint, used for the counters
+        :param function: the function to call
+
+        :return: the result of the function
+        """
+        attempt = 0
+        while True:
+            throttled_seconds = self._rate_limiter.acquire()
+            try:
+                result = function()
+                self._count(endpoint,
+                            throttled_seconds=throttled_seconds,
+                            received_bytes=len(result) if isinstance(result, bytes) else 0)
+                return result
+
+            except (HttpError, OSError, http.client.HTTPException, httplib2.HttpLib2Error) as error:
+                delay = self._retry_delay(error, attempt)
+                if delay is None or attempt >= MAX_RETRIES:
+                    self._count(endpoint, throttled_seconds=throttled_seconds)
+                    raise
+
+                _log(f'{endpoint}: {error}. Retrying in {delay:.1f}s')
+                self._count(endpoint, retries=1, throttled_seconds=throttled_seconds + delay)
+                time.sleep(delay)
+                attempt += 1
+
+    def execute(self, request) -> dict:
+        """
+        Executes the supplied request using the HTTP client of the calling thread
+
+        :param request: the request to execute
+
+        :return: the response
+        """
+        return self.call(request.methodId,
+                         lambda: request.execute(http=self.http()))
+
+
+def _drive_service(credentials: service_account.Credentials | None,
+                   max_qps: float = MAX_QUERIES_PER_SECOND,
+                   api_endpoint: str | None = None,
+                   transport: str = 'httplib2') -> DriveService:
+    """
+    Gets the Google drive service
+    """
+    return DriveService(credentials, max_qps, api_endpoint, transport)
+
+
+class BuildReport:
+    """
+    Timings and counters for each stage of the build and each media item, written as JSON after the build
+
+    Wall time, CPU time, requests to Google Drive, bytes received and cache hits & misses are recorded
+    for each stage. Downloads (with their requests and retries) and resizes are recorded for each media item,
+    including those that fail, and can also be written as a Chrome trace-event file
+    (viewable in chrome://tracing or https://ui.perfetto.dev).
+    """
+
+    def __init__(self,
+                 service: DriveService,
+                 caches: dict[str, object]):
+        """
+        :param service: the drive service, whose counters are read at the start and end of each stage
+        :param caches: the caches whose hits and misses are counted, keyed by name
+        """
+        self._service = service
+        self._caches = caches
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._started_cpu = self._cpu_time()
+        self._stages: list[dict] = []
+        self._media: dict[str, dict] = {}
+        self._summaries: dict[str, dict] = {}
+        self._events: list[dict] = []
+
+    @staticmethod
+    def _cpu_time() -> float:
+        """
+        Gets the CPU time used by this process, and by worker processes that have finished
+
+        :return: the CPU time in seconds
+        """
+        times = os.times()
+        return times.user + times.system + times.children_user + times.children_system
+
+    def _counters(self) -> dict:
+        """
+        Gets the current values of the request and cache counters
+        """
+        statistics = self._service.statistics().values()
+        return {
+            'requests': sum(endpoint.calls for endpoint in statistics),
+            'retries': sum(endpoint.retries for endpoint in statistics),
+            'received_bytes': sum(endpoint.received_bytes for endpoint in statistics),
+            'caches': {
+                name: {'hits': cache.hits, 'misses': cache.misses}
+                for name, cache in self._caches.items()
+            }
+        }
+
+    def _add_event(self,
+                   name: str,
+                   category: str,
+                   start: float,
+                   wall_seconds: float,
+                   pid: int,
+                   tid: int,
+                   args: dict):
+        """
+        Adds a complete event to the trace
+
+        :param name: the name of the event
+        :param category: the category of the event
+        :param start: the time at which the event started (seconds since the epoch)
+        :param wall_seconds: the duration of the event
+        :param pid: the ID of the process in which the event happened
+        :param tid: the ID of the thread in which the event happened
+        :param args: values shown alongside the event
+        """
+        with self._lock:
+            self._events.append({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': round((start - self._started) * 1e6),
+                'dur': round(wall_seconds * 1e6),
+                'pid': pid,
+                'tid': tid,
+                'args': args
+            })
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Records the timings and counters of the stage run within the context
+
+        :param name: the name of the stage
+        """
+        counters = self._counters()
+        start = time.time()
+        start_wall = time.perf_counter()
+        start_cpu = self._cpu_time()
+
+        try:
+            yield
+
+        finally:
+            wall_seconds = time.perf_counter() - start_wall
+            end_counters = self._counters()
+
+            stage = {
+                'name': name,
+                'start_seconds': round(start - self._started, 6),
+                'wall_seconds': round(wall_seconds, 6),
+                'cpu_seconds': round(self._cpu_time() - start_cpu, 6),
+                'requests': end_counters['requests'] - counters['requests'],
+                'retries': end_counters['retries'] - counters['retries'],
+                'received_bytes': end_counters['received_bytes'] - counters['received_bytes'],
+                'caches': {
+                    cache_name: {
+                        key: value - counters['caches'][cache_name][key]
+                        for key, value in cache_counters.items()
+                    }
+                    for cache_name, cache_counters in end_counters['caches'].items()
+                }
+            }
+
+            with self._lock:
+                self._stages.append(stage)
+
+            self._add_event(name, 'stage', start, wall_seconds, os.getpid(), threading.get_ident(), {
+                key: value
+                for key, value in stage.items()
+                if key not in ('name', 'start_seconds', 'wall_seconds')
+            })
+
+    @contextmanager
+    def task(self,
+             item_id: str,
+             name: str):
+        """
+        Records the timings of a task for a media item, run within the context on the calling thread
+
+        The requests to Google Drive made by the calling thread during the task (e.g. each range of a download),
+        and their retries, are counted. The context value is a dict, to which any other counters for the task can be
+        added. The task is recorded even if it fails, along with the error.
+
+        :param item_id: the ID of the media item
+        :param name: the name of the task
+        """
+        counters = {}
+        start = time.time()
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        start_statistics = self._service.thread_statistics()
+
+        try:
+            yield counters
+
+        except BaseException as error:
+            counters['error'] = f'{type(error).__name__}: {error}'
+            raise
+
+        finally:
+            statistics = self._service.thread_statistics()
+            self.add_task(item_id, name, start,
+                          wall_seconds=time.perf_counter() - start_wall,
+                          cpu_seconds=time.thread_time() - start_cpu,
+                          pid=os.getpid(),
+                          tid=threading.get_ident(),
+                          requests=statistics.calls - start_statistics.calls,
+                          retries=statistics.retries - start_statistics.retries,
+                          throttled_seconds=round(statistics.throttled_seconds - start_statistics.throttled_seconds, 6),
+                          **counters)
+
+    def add_task(self,
+                 item_id: str,
+                 name: str,
+                 start: float,
+                 wall_seconds: float,
+                 cpu_seconds: float,
+                 pid: int,
+                 tid: int,
+                 **counters):
+        """
+        Records the timings of a task for a media item that has already been run (e.g. in a worker process)
+
+        :param item_id: the ID of the media item
+        :param name: the name of the task
+        :param start: the time at which the task started (seconds since the epoch)
+        :param wall_seconds: the time taken by the task
+        :param cpu_seconds: the CPU time used by the task
+        :param pid: the ID of the process that ran the task
+        :param tid: the ID of the thread that ran the task
+        :param counters: any other counters for the task
+        """
+        task = {
+            'start_seconds': round(start - self._started, 6),
+            'wall_seconds': round(wall_seconds, 6),
+            'cpu_seconds': round(cpu_seconds, 6),
+            **counters
+        }
+
+        with self._lock:
+            self._media.setdefault(item_id, {'file_id': item_id})[name] = task
+
+        self._add_event(f'{name} {item_id}', name, start, wall_seconds, pid, tid, task)
+
+    def summarise(self,
+                  name: str,
+                  values: dict):
+        """
+        Adds a section to the report
+
+        :param name: the name of the section
+        :param values: the values in the section, which must be JSON serialisable
+        """
+        with self._lock:
+            self._summaries[name] = values
+
+    def summary(self, name: str) -> dict | None:
+        """
+        Gets a section of the report
+
+        :param name: the name of the section
+
+        :return: the values in the section, or None if it has not been added
+        """
+        with self._lock:
+            return self._summaries.get(name)
+
+    def stages(self) -> list[dict]:
+        """
+        Gets the records of the stages that have finished
+        """
+        with self._lock:
+            return list(self._stages)
+
+    def write(self,
+              file_path: str,
+              trace_file_path: str | None = None):
+        """
+        Writes the report, and optionally the trace
+
+        :param file_path: the path to the report file
+        :param trace_file_path: the path to the trace-event file, or None to not write one
+        """
+        statistics = self._service.statistics()
+
+        with self._lock:
+            report = {
+                'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self._started)),
+                'wall_seconds': round(time.time() - self._started, 6),
+                'cpu_seconds': round(self._cpu_time() - self._started_cpu, 6),
+                'stages': self._stages,
+                'requests': {
+                    endpoint: asdict(endpoint_statistics)
+                    for endpoint, endpoint_statistics in sorted(statistics.items())
+                },
+                'caches': self._counters()['caches'],
+                **self._summaries,
+                'media': list(self._media.values())
+            }
+            events = list(self._events)
+
+        with open(file_path, 'w') as file:
+            json.dump(report, file, indent=4)
+
+        if trace_file_path is not None:
+            with open(trace_file_path, 'w') as file:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+
+def _parse_drive_item(item: dict) -> DriveItemInfo | None:
+    """
+    Converts an item returned by the Google Drive API into a DriveItemInfo
+
+    :param item: the item as returned by the API
+
+    :return: the item info or None if the item has an unknown type
+    """
+    item_id = item['id']
+    name = item['name']
+    mime_type = str(item['mimeType'])
+    metadata = {}
+
+    if mime_type == 'application/vnd.google-apps.document':
+        item_type = DriveItemType.DOCUMENT
+    elif mime_type == 'application/vnd.google-apps.spreadsheet':
+        item_type = DriveItemType.SHEET
+    elif mime_type.startswith('image/'):
+        item_type = DriveItemType.IMAGE
+
+        image_metadata = item['imageMediaMetadata']
+        metadata['width'] = image_metadata['width']
+        metadata['height'] = image_metadata['height']
+        metadata['extension'] = item['fileExtension']
+        metadata['size'] = item['size']
+        metadata['sha256'] = item['sha256Checksum']
+
+    elif mime_type.startswith('video/'):
+        item_type = DriveItemType.VIDEO
+
+        video_metadata = item['videoMediaMetadata']
+        metadata['width'] = video_metadata['width']
+        metadata['height'] = video_metadata['height']
+        metadata['duration_ms'] = video_metadata['durationMillis']
+        metadata['extension'] = item['fileExtension']
+        metadata['size'] = item['size']
+        metadata['sha256'] = item['sha256Checksum']
+
+    elif mime_type == 'application/vnd.google-apps.folder':
+        item_type = DriveItemType.DIRECTORY
+    else:
+        print(
+            f'Skipping {name} ({item_id}) as it has an unknown type: {mime_type}')
+        return None
+
+    parent_id = None
+    parents = item['parents'] if 'parents' in item else []
+    if parents:
+        if len(parents) > 1:
+            raise RuntimeError(
+                f'Google Drive item "{name}" has {len(parents)} parents. Expected 1.')
+
+        parent_id = parents[0]
+
+    description = None
+    if 'description' in item:
+        description = item['description']
+
+    return DriveItemInfo(
+        item_id=item_id,
+        item_type=item_type,
+        parent_id=parent_id,
+        name=name,
+        description=description,
+        metadata=metadata,
+        modified_time=item.get('modifiedTime')
+    )
+
+
+def _list_directory(service: DriveService,
+                    directory_id: str) -> tuple[list[dict], int]:
+    """
+    Lists the items that are directly inside the supplied directory
+
+    :param service: the drive service
+    :param directory_id: the ID of the directory
+
+    :return: the items (as returned by the API) and the number of requests made
+    """
+
+    items = []
+    requests = 0
+    nextPageToken = None
+
+    while True:
+
+        results = service.execute(
+            service.files()
+            .list(q=f"'{directory_id}' in parents and trashed = false",
+                  pageSize=LIST_PAGE_SIZE,
+                  fields=f"nextPageToken, files({','.join(DRIVE_ITEM_FIELDS)})",
+                  pageToken=nextPageToken,
+                  orderBy='name_natural,recency',
+                  includeItemsFromAllDrives=True,
+                  supportsAllDrives=True)
+        )
+        requests += 1
+
+        nextPageToken = results.get("nextPageToken", None)
+
+        items += results.get("files", [])
+
+        if nextPageToken is None:
+            break
+
+    return items, requests
+
+
+def _get_drive_items(service: DriveService,
+                     root_id: str = PARENT_DIRECTORY_ID) -> dict[str, DriveItemInfo]:
+    """
+    Gets all the items below the supplied directory
+
+    Directories are listed one level at a time, with all the directories in a level listed concurrently.
+
+    :param service: the drive service
+    :param root_id: the ID of the top-level directory
+
+    :return: the items as a dict, keyed by ID
+    """
+
+    start_time = time.perf_counter()
+    requests = 0
+    result = {}
+
+    directory_ids = [root_id]
+    with ThreadPoolExecutor(max_workers=LIST_CONCURRENCY) as executor:
+        while directory_ids:
+
+            listings = executor.map(lambda directory_id: _list_directory(service, directory_id),
+                                    directory_ids)
+
+            directory_ids = []
+            for items, directory_requests in listings:
+                requests += directory_requests
+
+                for item in items:
+                    item_info = _parse_drive_item(item)
+                    if item_info is None:
+                        continue
+
+                    result[item_info.item_id] = item_info
+
+                    if item_info.item_type == DriveItemType.DIRECTORY:
+                        directory_ids.append(item_info.item_id)
+
+    elapsed = time.perf_counter() - start_time
+    print(f'Found {len(result)} items in {requests} requests ({elapsed:.2f}s)')
+
+    return result
+
+
+def _get_start_page_token(service: DriveService) -> str:
+    """
+    Gets the page token from which future changes in Google Drive can be listed
+
+    :param service: the drive service
+
+    :return: the page token
+    """
+    result = service.execute(
+        service.changes()
+        .getStartPageToken(supportsAllDrives=True)
+    )
+
+    return result['startPageToken']
+
+
+def _get_changes(service: DriveService,
+                 page_token: str) -> tuple[list[dict], str]:
+    """
+    Gets the changes made in Google Drive since the supplied page token
+
+    :param service: the drive service
+    :param page_token: the page token returned by the previous sync
+
+    :return: the changes (as returned by the API) and the page token for the next sync
+    """
+
+    changes = []
+    nextPageToken = page_token
+
+    while True:
+
+        results = service.execute(
+            service.changes()
+            .list(pageToken=nextPageToken,
+                  pageSize=LIST_PAGE_SIZE,
+                  fields=f"nextPageToken, newStartPageToken, "
+                         f"changes(fileId, removed, file(trashed, {','.join(DRIVE_ITEM_FIELDS)}))",
+                  spaces='drive',
+                  includeItemsFromAllDrives=True,
+                  supportsAllDrives=True)
+        )
+
+        changes += results.get("changes", [])
+
+        if 'newStartPageToken' in results:
+            return changes, results['newStartPageToken']
+
+        nextPageToken = results['nextPageToken']
+
+
+def _remove_unreachable_items(items: dict[str, DriveItemInfo],
+                              root_id: str = PARENT_DIRECTORY_ID):
+    """
+    Removes the items that are not below the supplied directory (e.g. the contents of a deleted directory)
+
+    :param items: the dict of all items, which is modified in place
+    :param root_id: the ID of the top-level directory
+    """
+
+    reachable = {root_id}
+    unresolved = set(items)
+    while True:
+        resolved = {
+            item_id
+            for item_id in unresolved
+            if items[item_id].parent_id in reachable
+        }
+
+        if not resolved:
+            break
+
+        reachable |= resolved
+        unresolved -= resolved
+
+    for item_id in unresolved:
+        del items[item_id]
+
+
+def _apply_changes(service: DriveService,
+                   items: dict[str, DriveItemInfo],
+                   changes: list[dict],
+                   root_id: str = PARENT_DIRECTORY_ID) -> dict[str, DriveItemInfo]:
+    """
+    Updates the items from a previous sync with the supplied changes
+
+    Rather than patching items one at a time, every directory that gained, lost or changed an item is listed again.
+    This keeps the items in each directory in the order returned by Google Drive.
+
+    :param service: the drive service
+    :param items: the dict of all items from the previous sync
+    :param changes: the changes since the previous sync
+    :param root_id: the ID of the top-level directory
+
+    :return: the updated dict of all items
+    """
+
+    previous_ids = set(items)
+    items = dict(items)
+
+    changed_directory_ids = set()
+    for change in changes:
+        previous = items.get(change['fileId'])
+        if previous is not None:
+            changed_directory_ids.add(previous.parent_id)
+
+        file = change.get('file')
+        if not change.get('removed', False) and file and not file.get('trashed', False):
+            changed_directory_ids.update(file.get('parents', []))
+
+    changed_directory_ids = [
+        directory_id
+        for directory_id in changed_directory_ids
+        if directory_id == root_id
+        or (directory_id in items and items[directory_id].item_type == DriveItemType.DIRECTORY)
+    ]
+
+    with ThreadPoolExecutor(max_workers=LIST_CONCURRENCY) as executor:
+        listings = list(executor.map(lambda directory_id: _list_directory(service, directory_id),
+                                     changed_directory_ids))
+
+    previous_tree = DriveTree(items, root_id)
+
+    # Every old listing is removed before any new one is added, as an item moved between two of the directories
+    # would otherwise be removed again with the old contents of its previous directory
+    for directory_id in changed_directory_ids:
+        for item_id in previous_tree.children(directory_id):
+            del items[item_id]
+
+    new_directory_ids = []
+    for directory_items, _ in listings:
+        for item in directory_items:
+            item_info = _parse_drive_item(item)
+            if item_info is None:
+                continue
+
+            if item_info.item_type == DriveItemType.DIRECTORY and item_info.item_id not in previous_ids:
+                new_directory_ids.append(item_info.item_id)
+
+            items[item_info.item_id] = item_info
+
+    # Directories that have been moved in from elsewhere have contents that have not changed, so must be listed in full
+    for directory_id in new_directory_ids:
+        items.update(_get_drive_items(service, directory_id))
+
+    _remove_unreachable_items(items, root_id)
+
+    return items
+
+
+def _drive_item_to_json(item_info: DriveItemInfo) -> dict:
+    """
+    Converts an item into a form that can be written as JSON
+
+    :param item_info: the item
+
+    :return: the item as a dict
+    """
+    return {
+        **asdict(item_info),
+        'item_type': item_info.item_type.value
+    }
+
+
+def _drive_item_from_json(data: dict) -> DriveItemInfo:
+    """
+    Converts an item read from JSON back into a DriveItemInfo
+
+    :param data: the item as a dict
+
+    :return: the item
+    """
+    return DriveItemInfo(**{
+        **data,
+        'item_type': DriveItemType(data['item_type'])
+    })
+
+
+def _sync_drive_items(service: DriveService,
+                      cache_dir: str,
+                      incremental: bool) -> tuple[dict[str, DriveItemInfo], bool, dict]:
+    """
+    Gets all the items in Google Drive, either with a full listing or by applying the changes since the previous run
+
+    The returned state holds the items and a page token for the Changes API. It should only be saved with
+    _save_sync_state once the content has been written, so that a failed run is repeated by the next one.
+
+    :param service: the drive service
+    :param cache_dir: the cache directory
+    :param incremental: True if the changes since the previous run should be applied to its items
+
+    :return: the items as a dict, keyed by ID, True if anything has changed since the previous run, and the state
+    """
+
+    state_file = os.path.join(cache_dir, SYNC_STATE_FILE)
+
+    if incremental and os.path.isfile(state_file):
+        with open(state_file, 'r') as file:
+            state = json.load(file)
+
+        items = {
+            item['item_id']: _drive_item_from_json(item)
+            for item in state['items']
+        }
+
+        changes, page_token = _get_changes(service, state['page_token'])
+        print(f'Found {len(changes)} changes since the previous run')
+
+        changed = len(changes) > 0
+        if changed:
+            items = _apply_changes(service, items, changes)
+
+    else:
+        if incremental:
+            print('No previous run found. Listing all items')
+
+        # The token is fetched first so that changes made while listing are picked up by the next run
+        page_token = _get_start_page_token(service)
+        items = _get_drive_items(service)
+        changed = True
+
+    state = {
+        'page_token': page_token,
+        'items': [_drive_item_to_json(item_info) for item_info in items.values()]
+    }
+
+    return items, changed, state
+
+
+def _save_sync_state(cache_dir: str, state: dict):
+    """
+    Stores the items and page token from _sync_drive_items, for use in the next run
+
+    :param cache_dir: the cache directory
+    :param state: the state
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, SYNC_STATE_FILE), 'w') as file:
+        json.dump(state, file)
+
+
+def _previous_drive_items(cache_dir: str) -> dict[str, dict]:
+    """
+    Gets the items stored by the previous run
+
+    :param cache_dir: the cache directory
+
+    :return: the items as dicts, keyed by ID, or an empty dict if there was no previous run
+    """
+    state_file = os.path.join(cache_dir, SYNC_STATE_FILE)
+    if not os.path.isfile(state_file):
+        return {}
+
+    with open(state_file, 'r') as file:
+        return {
+            item['item_id']: item
+            for item in json.load(file)['items']
+        }
+
+
+class ModifiedTimeCache:
+    """
+    A cache of values derived from items in Google Drive, which are valid until the item is modified
+    """
+
+    def __init__(self, file_path: str):
+        """
+        :param file_path: the path to the cache file, which is read if it exists
+        """
+        self._file_path = file_path
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.isfile(file_path):
+            with open(file_path, 'r') as file:
+                self._entries = json.load(file)
+
+    def get(self,
+            key: str,
+            modified_time: str | None,
+            count: bool = True) -> object | None:
+        """
+        Gets a cached value
+
+        :param key: the key of the value
+        :param modified_time: the time at which the item from which the value is derived was last modified
+        :param count: False if the lookup should not be counted as a hit or a miss, e.g. as it has already been
+                      counted when the value was cached earlier in the run
+
+        :return: the value, or None if it is not cached or the item has been modified since it was cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['modified_time'] != modified_time:
+                self.misses += count
+                return None
+
+            self.hits += count
+
+        return entry['value']
+
+    def modified_time(self, key: str) -> str | None:
+        """
+        Gets the modification time with which a value was cached, without counting a hit or a miss
+
+        :param key: the key of the value
+
+        :return: the time, or None if the value is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+        return entry['modified_time'] if entry is not None else None
+
+    def put(self,
+            key: str,
+            modified_time: str | None,
+            value: object):
+        """
+        Stores a value in the cache
+
+        :param key: the key of the value
+        :param modified_time: the time at which the item from which the value is derived was last modified
+        :param value: the value, which must be JSON serialisable
+        """
+        with self._lock:
+            self._entries[key] = {
+                'modified_time': modified_time,
+                'value': value
+            }
+
+    def save(self):
+        """
+        Writes the cache to its file
+
+        Values for items without a modification time are only valid for the current run, so are not written.
+        """
+        with self._lock:
+            entries = {
+                key: entry
+                for key, entry in self._entries.items()
+                if entry['modified_time'] is not None
+            }
+
+        os.makedirs(os.path.dirname(self._file_path), exist_ok=True)
+        with open(self._file_path, 'w') as file:
+            json.dump(entries, file)
+
+
+def _list_comments(service,
+                   item_id: str,
+                   fields: list[str],
+                   start_modified_time: str | None = None) -> list[dict]:
+    """
+    Lists the comments on the supplied item, including those that have been deleted
+
+    :param service: the drive service
+    :param item_id: the ID of the item from which comments should be retrieved
+    :param fields: the fields requested for each comment
+    :param start_modified_time: if set, only the comments last modified at or after this time are listed
+
+    :return: the comments (as returned by the API)
+    """
+
+    comments = []
+    nextPageToken = None
+
+    while True:
+
+        results = service.execute(
+            service.comments()
+            .list(fileId=item_id,
+                  pageSize=COMMENT_PAGE_SIZE,
+                  fields=f"nextPageToken, comments({','.join(fields)})",
+                  includeDeleted=True,
+                  startModifiedTime=start_modified_time,
+                  pageToken=nextPageToken)
+        )
+
+        nextPageToken = results.get("nextPageToken", None)
+
+        comments += results.get("comments", [])
+
+        if nextPageToken is None:
+            break
+
+    return comments
+
+
+def _get_comments(service,
+                  item_id: str) -> tuple[list[Comment], str | None]:
+    """
+    Gets the comments on the supplied item
+
+    :param service: the drive service
+    :param item_id: the ID of the item from which comments should be retrieved
+
+    :return: the comments, and the time at which a comment (including a deleted one) was last modified,
+             or None if there are none
+    """
+
+    fields = [
+        'id',
+        'content',
+        'anchor',
+        'deleted',
+        'modifiedTime',
+    ]
+
+    comments = _list_comments(service, item_id, fields)
+
+    result = []
+    for comment in comments:
+        if comment.get('deleted', False):
+            continue
 
-    result = []
-    for comment in comments:
         result.append(Comment(
             item_id=item_id,
             comment_id=comment['id'],
@@ -315,547 +2039,2185 @@ def _get_comments(service,
             content=comment['content']
         ))
 
-    return result
+    return result, max((comment['modifiedTime'] for comment in comments), default=None)
+
+
+def _get_valid_cached_comments(service: DriveService,
+                               item_info: DriveItemInfo,
+                               comment_cache: ModifiedTimeCache) -> list[Comment] | None:
+    """
+    Gets the comments on the supplied item from the cache, if none have been added, edited or deleted since they
+    were cached
+
+    Adding a comment does not change the modification time of the item, so the cached comments are checked against
+    their own modification times instead. This needs one request, for the comments modified since they were cached,
+    which are usually none.
+
+    :param service: the drive service
+    :param item_info: the item from which comments should be retrieved
+    :param comment_cache: the cache of comments
+
+    :return: the comments, or None if they are not cached or have changed
+    """
+
+    modified_time = comment_cache.modified_time(item_info.item_id)
+    if modified_time is not None:
+        modified_time = max([
+            modified_time,
+            *[comment['modifiedTime']
+              for comment in _list_comments(service, item_info.item_id, ['modifiedTime'], modified_time)]
+        ])
+
+    cached = comment_cache.get(item_info.item_id, modified_time)
+    if cached is None:
+        return None
+
+    return [Comment(**comment) for comment in cached]
+
+
+def _get_cached_comments(service: DriveService,
+                         item_info: DriveItemInfo,
+                         comment_cache: ModifiedTimeCache) -> list[Comment]:
+    """
+    Gets the comments on the supplied item, from the cache if they have not changed since they were cached
+
+    :param service: the drive service
+    :param item_info: the item from which comments should be retrieved
+    :param comment_cache: the cache of comments
+
+    :return: the comments
+    """
+
+    cached = _get_valid_cached_comments(service, item_info, comment_cache)
+    if cached is not None:
+        return cached
+
+    # An item without comments is cached as of its own modification time, before which no comment can have been
+    # missed, so that it is checked with one request like any other (and is kept when the cache is saved)
+    comments, modified_time = _get_comments(service, item_info.item_id)
+    comment_cache.put(item_info.item_id,
+                      modified_time or item_info.modified_time,
+                      [asdict(comment) for comment in comments])
+
+    return comments
+
+
+class DriveTree:
+    """
+    An index of the items in Google Drive, which allows paths to be resolved without scanning every item
+    """
+
+    def __init__(self,
+                 items: dict[str, DriveItemInfo],
+                 root_id: str = PARENT_DIRECTORY_ID):
+        """
+        :param items: the dict of all items
+        :param root_id: the ID of the top-level directory
+        """
+
+        self.items = items
+        """
+        The dict of all items
+        """
+
+        self.root_id = root_id
+        """
+        The ID of the top-level directory
+        """
+
+        self._children: dict[str, list[str]] = {}
+        self._ids_by_name: dict[tuple[str, str], list[str]] = {}
+
+        for item_id, item_info in items.items():
+            self._children.setdefault(item_info.parent_id, []).append(item_id)
+            self._ids_by_name.setdefault((item_info.parent_id, item_info.name), []).append(item_id)
+
+    def children(self,
+                 parent_id: str) -> list[str]:
+        """
+        Gets the IDs of the items in the supplied directory
+
+        :param parent_id: the ID of the directory
+
+        :return: the item IDs
+        """
+        return self._children.get(parent_id, [])
+
+    def ids_with_name(self,
+                      parent_id: str,
+                      name: str) -> list[str]:
+        """
+        Gets the IDs of the items in the supplied directory that have the supplied name
+
+        :param parent_id: the ID of the directory
+        :param name: the name of the item
+
+        :return: the item IDs
+        """
+        return self._ids_by_name.get((parent_id, name), [])
+
+
+def _get_directory_id(tree: DriveTree,
+                      names: list[str]) -> str:
+    """
+    Gets the ID of a directory with the supplied path
+
+    :param tree: the index of all items
+    :param names: the path (directory names & file name as a list)
+
+    :return: the item ID
+    """
+    parent_id = tree.root_id
+    for directory_name in names:
+
+        matching_directory_ids = tree.ids_with_name(parent_id, directory_name)
+
+        if len(matching_directory_ids) != 1:
+            raise RuntimeError(f'Failed to find in {"/".join(names)}{os.linesep}'
+                               f'Found {len(matching_directory_ids)} directories in Drive matching name: "{directory_name}".')
+
+        parent_id = matching_directory_ids[0]
+
+    return parent_id
+
+
+def _get_file_id(tree: DriveTree,
+                 names: list[str]) -> str:
+    """
+    Gets the ID of a file with the supplied path
+
+    :param tree: the index of all items
+    :param names: the path (directory names & file name as a list)
+
+    :return: the item ID
+    """
+    parent_id = _get_directory_id(tree, names[:-1])
+    file_name = names[-1]
+
+    matching_file_ids = tree.ids_with_name(parent_id, file_name)
+
+    if len(matching_file_ids) != 1:
+        raise RuntimeError(f'Failed to find in {"/".join(names)}{os.linesep}'
+                           f'Found {len(matching_file_ids)} files in Drive matching name: "{file_name}".')
+
+    return matching_file_ids[0]
+
+
+def _get_items_in_dir(tree: DriveTree,
+                      names: list[str]) -> list[str]:
+    """
+    Gets the IDs of the items that are in the supplied directory
+
+    :param tree: the index of all items
+    :param names: the directory names as a list e.g. ['foo', 'bar'] is the path: foo/bar
+
+    :return: the list of items in that directory
+    """
+
+    parent_id = _get_directory_id(tree, names)
+
+    return tree.children(parent_id)
+
+
+def _download_file(service,
+                   item_id: str,
+                   mime_type='text/markdown') -> bytes:
+    """
+    Downloads a file Google drive as raw bytes
+
+    :param service: the service
+    :param item_id: the item ID
+    :param mime_type: the file type
+
+    :return: the file contents
+    """
+
+    result = service.execute(
+        service.files()
+        .export(fileId=item_id,
+                mimeType=mime_type)
+    )
+
+    return result
+
+
+def _export_text(service: DriveService,
+                 item_info: DriveItemInfo,
+                 mime_type: str,
+                 export_cache: ModifiedTimeCache,
+                 count: bool = True) -> str:
+    """
+    Exports a document or sheet from Google drive as text, from the cache if it has not been modified since it was cached
+
+    :param service: the service
+    :param item_info: the item
+    :param mime_type: the type to export to
+    :param export_cache: the cache of exported documents
+    :param count: False if the lookup in the cache should not be counted as a hit or a miss
+
+    :return: the file contents string
+    """
+    key = f'{item_info.item_id}:{mime_type}'
+
+    text = export_cache.get(key, item_info.modified_time, count)
+    if text is None:
+        text = _download_file(service, item_info.item_id,
+                              mime_type=mime_type).decode()
+        export_cache.put(key, item_info.modified_time, text)
+
+    return text
+
+
+def _export_documents(service: DriveService,
+                      tree: DriveTree,
+                      export_cache: ModifiedTimeCache):
+    """
+    Exports all the documents and sheets used by the website into the cache, several at the same time
+
+    :param service: the service
+    :param tree: the index of all items
+    :param export_cache: the cache of exported documents
+    """
+    with ThreadPoolExecutor(max_workers=EXPORT_CONCURRENCY) as executor:
+        exports = [
+            executor.submit(_export_text, service, tree.items[_get_file_id(tree, names)], mime_type, export_cache)
+            for names, mime_type in EXPORTED_DOCUMENTS
+        ]
+
+        for export in exports:
+            export.result()
+
+
+def _download_text(service,
+                   item_info: DriveItemInfo,
+                   export_cache: ModifiedTimeCache) -> str:
+    """
+    Downloads a document from Google drive as text
+
+    The document is usually in the cache, as exported by _export_documents, which counts the hit or miss.
+
+    :param service: the service
+    :param item_info: the item
+    :param export_cache: the cache of exported documents
+
+    :return: the file contents string
+    """
+    return _export_text(service, item_info, 'text/plain', export_cache, count=False)
+
+
+def _download_sheet(service,
+                    item_info: DriveItemInfo,
+                    export_cache: ModifiedTimeCache) -> list[list[str]]:
+    """
+    Downloads a sheet from Google drive
+
+    The sheet is usually in the cache, as exported by _export_documents, which counts the hit or miss.
+
+    :param service: the service
+    :param item_info: the item
+    :param export_cache: the cache of exported documents
+
+    :return: the file contents
+    """
+    csv_text = _export_text(service, item_info, 'text/csv', export_cache, count=False)
+    return list(csv.reader(csv_text.splitlines()))
+
+
+def _hash_file(file_path: str) -> str:
+    """
+    Gets the sha256 hash of the contents of the supplied file
+
+    :param file_path: the file path
+
+    :return: the hash as a hex string
+    """
+
+    hasher = hashlib.sha256()
+    buffer = memoryview(bytearray(HASH_BUFFER_SIZE))
+
+    with open(file_path, 'rb', buffering=0) as file:
+        while True:
+            size = file.readinto(buffer)
+            if not size:
+                break
+
+            hasher.update(buffer[:size])
+
+    return hasher.hexdigest()
+
+
+class HashCache:
+    """
+    A cache of the hashes of files, so that files that have not changed since they were last hashed are not read again
+
+    A cached hash is used only if the size and modification time of the file are unchanged. The inode is not
+    checked, as it changes whenever the cache and output directories are restored onto a new machine (e.g. by CI).
+    A file changed without changing its size or modification time is only found with verify.
+    """
+
+    def __init__(self,
+                 file_path: str,
+                 verify: bool = False):
+        """
+        :param file_path: the path to the cache file, which is read if it exists
+        :param verify: True if cached hashes should be ignored, so every file is hashed again
+        """
+        self._file_path = file_path
+        self._verify = verify
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.isfile(file_path):
+            with open(file_path, 'r') as file:
+                self._entries = json.load(file)
+
+    @staticmethod
+    def _file_key(file_path: str) -> tuple[str, dict]:
+        """
+        Gets the cache key and the file attributes that a cached hash depends on
+
+        :param file_path: the file path
+
+        :return: the key and the attributes
+        """
+        stat = os.stat(file_path)
+        return os.path.abspath(file_path), {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns
+        }
+
+    def hash(self, file_path: str) -> str:
+        """
+        Gets the sha256 hash of the supplied file, reading it only if the cached hash cannot be used
+
+        :param file_path: the file path
+
+        :return: the hash as a hex string
+        """
+        key, attributes = self._file_key(file_path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if not self._verify and entry is not None and entry['attributes'] == attributes:
+                self.hits += 1
+                return entry['sha256']
+
+            self.misses += 1
+
+        sha256 = _hash_file(file_path)
+        self.put(file_path, sha256)
+
+        return sha256
+
+    def put(self,
+            file_path: str,
+            sha256: str):
+        """
+        Records the hash of a file that has just been written
+
+        :param file_path: the file path
+        :param sha256: the sha256 hash of the file
+        """
+        key, attributes = self._file_key(file_path)
+
+        with self._lock:
+            self._entries[key] = {
+                'attributes': attributes,
+                'sha256': sha256
+            }
+
+    def save(self):
+        """
+        Writes the cache to its file, dropping the entries for files that no longer exist
+        """
+        with self._lock:
+            entries = {
+                key: entry
+                for key, entry in self._entries.items()
+                if os.path.isfile(key)
+            }
+
+        os.makedirs(os.path.dirname(self._file_path), exist_ok=True)
+        with open(self._file_path, 'w') as file:
+            json.dump(entries, file)
+
+
+def _check_file_exists(file_path: str,
+                       file_size: int,
+                       sha256: str,
+                       hash_cache: HashCache) -> bool:
+    """
+    Check that the file with the supplied path exists, and has the expected size and hash
+
+    :param file_path: the file path
+    :param file_size: the size of the file in bytes
+    :param sha256: the sha256 hash of the file contents
+    :param hash_cache: the cache of file hashes
+
+    :return: True if the file exists, False otherwise
+    """
+    file_name = os.path.basename(file_path)
+    if not os.path.isfile(file_path):
+        return False
+
+    if os.path.getsize(file_path) != file_size:
+        _log(f'{file_name} exists, but has the wrong size. Overwriting.')
+        return False
+
+    if not hash_cache.hash(file_path) == sha256:
+        _log(f'{file_name} exists, but has the wrong hash. Overwriting.')
+        return False
+
+    return True
+
+
+def _download_range(service: DriveService,
+                    uri: str,
+                    start: int,
+                    end: int) -> bytes:
+    """
+    Downloads part of a file
+
+    :param service: the drive service
+    :param uri: the URI of the file contents
+    :param start: the offset of the first byte to download
+    :param end: the offset of the last byte to download (inclusive)
+
+    :return: the bytes
+    """
+
+    def request() -> bytes:
+        # Each thread must use its own HTTP client
+        response, content = service.http().request(uri, headers={'range': f'bytes={start}-{end}'})
+
+        if response.status not in (200, 206):
+            raise HttpError(response, content, uri=uri)
+
+        # A server that ignores the range returns the whole file
+        if response.status == 200:
+            content = content[start:end + 1]
+
+        return content
+
+    return service.call('drive.files.get_media', request)
+
+
+def _download_media(service: DriveService,
+                    item_id: str,
+                    extension: str,
+                    file_size: int,
+                    sha256: str,
+                    output_dir: str,
+                    hash_cache: HashCache,
+                    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                    name: str | None = None) -> tuple[str, int]:
+    """
+    Downloads the image or video with the supplied ID and writes the file into the output directory
+
+    The file is downloaded in chunks to a temporary file, which is kept if the download is interrupted,
+    so the next run can continue from where it stopped.
+    The file is hashed as it is downloaded, and only moved into place once its size and hash have been checked.
+
+    :param service: the service
+    :param item_id: the item ID
+    :param extension: the file extension
+    :param file_size: the size of the file to download (in bytes)
+    :param sha256: the sha256 digest of the media file (used to check if file is already downloaded)
+    :param ouput_dir: the output directory
+    :param hash_cache: the cache of file hashes
+    :param chunk_size: the number of bytes to request at a time
+    :param name: the name of the file, without the extension (defaults to the item ID)
+
+    :return: the path to the downloaded file, and the number of bytes downloaded
+    """
+    name = name or item_id
+    file_path = os.path.join(output_dir, f'{name}.{extension}')
+    if _check_file_exists(file_path, file_size, sha256, hash_cache):
+        _log(f'{item_id}: already downloaded. Skipping.')
+        return file_path, 0
+
+    temp_file_path = os.path.join(output_dir, f'.{name}.{extension}.part')
+    progress_file_path = f'{temp_file_path}.json'
+    expected = {
+        'size': file_size,
+        'sha256': sha256
+    }
+
+    # Only continue a previous download of the same version of the file
+    hasher = hashlib.sha256()
+    offset = 0
+    if os.path.isfile(temp_file_path) and os.path.isfile(progress_file_path):
+        with open(progress_file_path, 'r') as file:
+            previous = json.load(file)
+
+        if previous == expected and os.path.getsize(temp_file_path) <= file_size:
+            with open(temp_file_path, 'rb') as file:
+                while data := file.read(HASH_BUFFER_SIZE):
+                    hasher.update(data)
+                    offset += len(data)
+
+            _log(f'{item_id}: continuing from {offset / 1e6:.1f} MB of {file_size / 1e6:.1f} MB')
+
+    with open(progress_file_path, 'w') as file:
+        json.dump(expected, file)
+
+    uri = service.files().get_media(fileId=item_id).uri
+    resumed_offset = offset
+
+    with open(temp_file_path, 'r+b' if offset else 'wb') as file:
+        file.truncate(offset)
+        file.seek(offset)
+
+        reported_progress = 100 * offset // max(file_size, 1)
+        while offset < file_size:
+            data = _download_range(service, uri, offset, min(offset + chunk_size, file_size) - 1)
+
+            # The file is smaller than Google Drive said it would be
+            if not data:
+                break
+
+            file.write(data)
+            file.flush()
+            hasher.update(data)
+            offset += len(data)
+
+            progress = 100 * offset // max(file_size, 1)
+            if offset < file_size and progress >= reported_progress + DOWNLOAD_PROGRESS_STEP:
+                reported_progress = progress - progress % DOWNLOAD_PROGRESS_STEP
+                _log(f'{item_id}: {progress:3d}% of {file_size / 1e6:.1f} MB')
+
+    try:
+        if offset != file_size:
+            raise RuntimeError(f'Downloaded {offset} bytes of {item_id}. Expected {file_size}.')
+
+        if hasher.hexdigest() != sha256:
+            raise RuntimeError(f'Downloaded {item_id}, but it has the wrong hash.')
+
+        os.replace(temp_file_path, file_path)
+
+    finally:
+        # A complete download that is wrong cannot be continued, so is removed along with its progress
+        for path in [temp_file_path, progress_file_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    hash_cache.put(file_path, sha256)
+
+    return file_path, file_size - resumed_offset
+
+
+def _add_focus_points(service: DriveService,
+                      tree: DriveTree,
+                      photos: list,
+                      comment_cache: ModifiedTimeCache):
+    """
+    Looks for a comment on the supplied photos, and adds the position of the comment as the "focal point" of the image
+
+    The comments on several photos are requested at the same time.
+
+    :param service: the service
+    :param tree: the index of all items
+    :param photos: the list of photo data  
+    :param comment_cache: the cache of comments
+    """
+
+    with ThreadPoolExecutor(max_workers=COMMENT_CONCURRENCY) as executor:
+        photo_comments = executor.map(
+            lambda photo: _get_cached_comments(service, tree.items[photo['file_id']], comment_cache),
+            photos)
+
+        _apply_focus_points(photos, photo_comments)
+
+
+def _apply_focus_points(photos: list,
+                        photo_comments: Iterable[list[Comment] | None]):
+    """
+    Adds the position of the "focus" comment on each of the supplied photos as the "focal point" of the image
+
+    A focus point read from a previous run is removed if the photo no longer has a "focus" comment.
+
+    :param photos: the list of photo data
+    :param photo_comments: the comments on each photo, or None if they are not known, in which case the photo's
+                           focus point is left as it is
+    """
+
+    for photo, comments in zip(photos, photo_comments):
+        if comments is None:
+            continue
+
+        photo.pop('focus', None)
+        for comment in comments:
+            if comment.content.strip().lower() != 'focus':
+                continue
+
+            if not comment.anchor:
+                continue
+
+            # Anchors have the form:
+            # [null,[null,[0.3835125448028674,0.10618279569892473,0.4829749103942652,0.24193548387096775]],null,"0BwUS5sqIvorgNUJqbXowdXV0Z0UwYVY1S3B3VkE1ekdXYzZ3PQ"
+            anchor = json.loads(comment.anchor)
+            print(photo['name'], anchor[1][1])
+            x_lower, y_lower, x_upper, y_upper = anchor[1][1]
+
+            focus_x = (x_lower + x_upper) / 2
+            focus_y = (y_lower + y_upper) / 2
+
+            photo['focus'] = [focus_x, focus_y]
+
+
+def _get_contact_details(service,
+                         tree: DriveTree,
+                         export_cache: ModifiedTimeCache) -> dict:
+    """
+    Gets the contact details
+
+    :param service: the service
+    :param tree: the index of all items
+    :param export_cache: the cache of exported documents
+
+    :return: contact details as a dict
+    """
+
+    required_keys = ['email', 'instagram']
+    result = {
+        key: value
+        for key, value in _download_sheet(service,
+                                          tree.items[_get_file_id(tree, ['contact'])],
+                                          export_cache)
+        if key in required_keys
+    }
+
+    for key in required_keys:
+        if key not in result:
+            raise RuntimeError(f'Contact details are missing: {key}')
+
+    return result
+
+
+def _get_media_list(tree: DriveTree,
+                    names: list[str],
+                    item_type: DriveItemType) -> list[dict]:
+    """
+    Get a list of media data (image or video) at the supplied path
+
+    :param tree: the index of all items
+    :param names: the names in the path to the directory containing the media items
+    :param item_type: the type of item (image or video)
+
+    :return: the media data as a list
+    """
+    return [
+        {
+            'file_id': photo_info.item_id,
+            'name': photo_info.name,
+            'description': (photo_info.description or '').strip(),
+            **photo_info.metadata
+        }
+        for photo_info in [
+            tree.items[item_id]
+            for item_id in _get_items_in_dir(tree, names)
+        ]
+        if photo_info.item_type == item_type
+    ]
+
+
+def _get_quote_content(service,
+                       tree: DriveTree,
+                       export_cache: ModifiedTimeCache) -> list[dict]:
+    """
+    Gets the quote content
+
+    :param service: the service
+    :param tree: the index of all items
+    :param export_cache: the cache of exported documents
+
+    :return: the quote contents as a list of dicts - one per quote
+    """
+
+    profile_photos = _get_media_list(tree, ['home', 'profile_photos'], DriveItemType.IMAGE)
+
+    photos_dict = {
+        photo_data['name']: photo_data 
+        for photo_data in profile_photos
+    }
+
+    return [
+        {
+            'quote': quote,
+            'name': name,
+            'url': url,
+            'photo': photos_dict[image_name]
+        }
+        for quote, name, image_name, url in _download_sheet(service,
+                                                            tree.items[_get_file_id(tree, ['home', 'quotes'])],
+                                                            export_cache)
+    ]
+
+def _get_name_check_content(service,
+                            tree: DriveTree,
+                            export_cache: ModifiedTimeCache) -> list[dict]:
+    """
+    Gets the name check content
+
+    :param service: the service
+    :param tree: the index of all items
+    :param export_cache: the cache of exported documents
+
+    :return: the name check contents as a list of dicts - one per name check
+    """
+
+    logos = _get_media_list(tree, ['home', 'logos'], DriveItemType.IMAGE)
+
+    photos_dict = {
+        photo_data['name']: photo_data 
+        for photo_data in logos
+    }
+
+    return [
+        {
+            'name': name,
+            'url': url,
+            'photo': photos_dict[image_name]
+        }
+        for name, url, image_name in _download_sheet(service,
+                                                     tree.items[_get_file_id(tree, ['home', 'name_checks'])],
+                                                     export_cache)
+    ]
+
+def _get_home_content(service,
+                      tree: DriveTree,
+                      export_cache: ModifiedTimeCache,
+                      comment_cache: ModifiedTimeCache) -> dict:
+    """
+    Gets the content of the home page
+
+    :param service: the service
+    :param tree: the index of all items
+    :param export_cache: the cache of exported documents
+    :param comment_cache: the cache of comments
+
+    :return: the home page contents as a dict
+    """
+    result = {}
+    result['bio'] = _download_text(service,
+                                   tree.items[_get_file_id(tree, ['home', 'bio'])],
+                                   export_cache)
+
+    result['introduction'] = _download_text(service,
+                                            tree.items[_get_file_id(tree, ['home', 'introduction'])],
+                                            export_cache)
+
+    result['quotes'] = _get_quote_content(service, tree, export_cache)
+    result['name_checks'] = _get_name_check_content(service, tree, export_cache)
+    result['photos'] = _get_media_list(tree, ['home', 'images'], DriveItemType.IMAGE)
+    _add_focus_points(service, tree, result['photos'], comment_cache)
+
+    return result
+
+
+def _get_portfolio_content(tree: DriveTree) -> dict:
+    """
+    Gets the content of the portfolio page
+
+    :param tree: the index of all items
+
+    :return: the portfolio page contents as a dict
+    """
+
+    portfolio_items = [
+        tree.items[item_id]
+        for item_id in _get_items_in_dir(tree, ['portfolio'])
+    ]
+
+    photos = {}
+    for item in portfolio_items:
+        if item.item_type != DriveItemType.DIRECTORY:
+            continue
+
+        album_name = (item.description or '').strip()
+        if not album_name:
+            album_name = item.name
+
+        photos[album_name] = _get_media_list(tree, ['portfolio', item.name], DriveItemType.IMAGE)
+
+    return {
+        'photos': photos
+    }
+
 
+def _get_video_content(tree: DriveTree) -> list:
+    """
+    Gets the content of the video page
 
-def _get_directory_id(items: dict[str, DriveItemInfo],
-                      names: list[str]) -> str:
+    :param tree: the index of all items
+
+    :return: the video page contents as a list
     """
-    Gets the ID of a directory with the supplied path
+    return {
+        'videos': _get_media_list(tree, ['video'], DriveItemType.VIDEO)
+    }
 
-    :param items: the dict of all items
-    :param names: the path (directory names & file name as a list)
 
-    :return: the item ID
+def _write_json_file(content: object,
+                     output_dir: str,
+                     name: str):
     """
-    parent_id = PARENT_DIRECTORY_ID
-    for directory_name in names:
+    Writes out data in JSON format
 
-        matching_directory_ids = [
-            item_id
-            for item_id, item_info in items.items()
-            if item_info.name == directory_name
-            and item_info.parent_id == parent_id
-        ]
+    :param content: the content of to write to the file
+    :param output_dir: the output directory
+    :param name: the name of the file
+    """
+    with open(os.path.join(output_dir, name), 'w') as file:
+        json.dump(content,
+                  file,
+                  indent=4)
 
-        if len(matching_directory_ids) != 1:
-            raise RuntimeError(f'Failed to find in {"/".join(names)}{os.linesep}'
-                               f'Found {len(matching_directory_ids)} directories in Drive matching name: "{directory_name}".')
 
-        parent_id = matching_directory_ids[0]
+def _read_json_file(output_dir: str,
+                    name: str) -> object:
+    """
+    Reads data in JSON format
 
-    return parent_id
+    :param output_dir: the output directory
+    :param name: the name of the file
 
+    :return: the content of the file
+    """
+    with open(os.path.join(output_dir, name), 'r') as file:
+        return json.load(file)
 
-def _get_file_id(items: dict[str, DriveItemInfo],
-                 names: list[str]) -> str:
+
+class BuildManifest:
+    """
+    A record of the inputs used to build each derived file, so that files that are up to date are not rebuilt
     """
-    Gets the ID of a file with the supplied path
 
-    :param items: the dict of all items
-    :param names: the path (directory names & file name as a list)
+    def __init__(self,
+                 file_path: str,
+                 hash_cache: HashCache):
+        """
+        :param file_path: the path to the manifest file, which is read if it exists
+        :param hash_cache: the cache of file hashes, used to check that outputs are unchanged
+        """
+        self._file_path = file_path
+        self._hash_cache = hash_cache
+        self._entries: dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.isfile(file_path):
+            with open(file_path, 'r') as file:
+                self._entries = json.load(file)
+
+    def is_up_to_date(self,
+                      output_dir: str,
+                      output_names: list[str],
+                      source_sha256: str,
+                      settings: dict) -> bool:
+        """
+        Checks if the supplied outputs were built from the same source, with the same settings, and are unchanged
+
+        :param output_dir: the directory containing the outputs
+        :param output_names: the file names of the outputs
+        :param source_sha256: the sha256 hash of the source file
+        :param settings: the settings used to build the outputs
+
+        :return: True if none of the outputs need to be rebuilt
+        """
+        up_to_date = all(
+            self._is_output_up_to_date(output_dir, output_name, source_sha256, settings)
+            for output_name in output_names
+        )
 
-    :return: the item ID
+        if up_to_date:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        return up_to_date
+
+    def _is_output_up_to_date(self,
+                              output_dir: str,
+                              output_name: str,
+                              source_sha256: str,
+                              settings: dict) -> bool:
+        """
+        Checks if the supplied output was built from the same source, with the same settings, and is unchanged
+
+        :param output_dir: the directory containing the output
+        :param output_name: the file name of the output
+        :param source_sha256: the sha256 hash of the source file
+        :param settings: the settings used to build the output
+
+        :return: True if the output does not need to be rebuilt
+        """
+        entry = self._entries.get(output_name)
+        if entry is None:
+            return False
+
+        if entry['source_sha256'] != source_sha256 or entry['settings'] != settings:
+            return False
+
+        output_path = os.path.join(output_dir, output_name)
+        return os.path.isfile(output_path) and self._hash_cache.hash(output_path) == entry['sha256']
+
+    def record(self,
+               output_dir: str,
+               outputs: dict[str, str],
+               source_sha256: str,
+               settings: dict):
+        """
+        Records that the supplied outputs have been built
+
+        :param output_dir: the directory containing the outputs
+        :param outputs: the sha256 hash of each output, keyed by file name
+        :param source_sha256: the sha256 hash of the source file
+        :param settings: the settings used to build the outputs
+        """
+        for output_name, sha256 in outputs.items():
+            self._hash_cache.put(os.path.join(output_dir, output_name), sha256)
+            self._entries[output_name] = {
+                'source_sha256': source_sha256,
+                'settings': settings,
+                'sha256': sha256
+            }
+
+    def forget(self, output_names: list[str]):
+        """
+        Removes the supplied outputs, e.g. once they have been deleted
+
+        :param output_names: the file names of the outputs
+        """
+        for output_name in output_names:
+            self._entries.pop(output_name, None)
+
+    def save(self):
+        """
+        Writes the manifest to its file
+        """
+        os.makedirs(os.path.dirname(self._file_path), exist_ok=True)
+        with open(self._file_path, 'w') as file:
+            json.dump(self._entries, file, indent=4)
+
+
+def _supported_image_formats(image_formats: list[str]) -> list[str]:
     """
-    parent_id = _get_directory_id(items, names[:-1])
-    file_name = names[-1]
+    Gets the supplied image formats that the installed version of Pillow can save
 
-    matching_file_ids = [
-        item_id
-        for item_id, item_info in items.items()
-        if item_info.name == file_name
-        and item_info.parent_id == parent_id
+    :param image_formats: the names of the formats (keys of IMAGE_FORMATS)
+
+    :return: the names of the supported formats, in the same order
+    """
+    Image.init()
+    return [
+        image_format
+        for image_format in image_formats
+        if image_format.upper() in Image.SAVE
     ]
 
-    if len(matching_file_ids) != 1:
-        raise RuntimeError(f'Failed to find in {"/".join(names)}{os.linesep}'
-                           f'Found {len(matching_file_ids)} files in Drive matching name: "{file_name}".')
 
-    return matching_file_ids[0]
+def _image_derivative_settings(image_formats: list[str],
+                               image_widths: list[int],
+                               image_crops: list[str]) -> dict:
+    """
+    Gets the settings that affect the resized versions of an image
 
+    :param image_formats: the additional formats in which the resized images are saved
+    :param image_widths: the widths at which the image is saved for responsive loading
+    :param image_crops: the names of the crops of the image that are saved
 
-def _get_items_in_dir(items: dict[str, DriveItemInfo],
-                      names: list[str]) -> list[str]:
+    :return: the settings as a dict
     """
-    Gets the IDs of the items that are in the supplied directory
+    return {
+        'large_size': MAX_LARGE_IMAGE_SIZE,
+        'medium_size': MAX_MEDIUM_IMAGE_SIZE,
+        'preview_size': MAX_PREVIEW_IMAGE_SIZE,
+        'preview_blur': PREVIEW_BLUR_AMOUNT,
+        'widths': image_widths,
+        'crops': {
+            crop: IMAGE_CROPS[crop]
+            for crop in image_crops
+        },
+        'formats': {
+            image_format: IMAGE_FORMATS[image_format]
+            for image_format in image_formats
+        }
+    }
 
-    :param items: the dict of all items
-    :param names: the directory names as a list e.g. ['foo', 'bar'] is the path: foo/bar
 
-    :return: the list of items in that directory
+def _derived_file_path(file_name: str,
+                       tag: str,
+                       image_format: str | None = None) -> str:
+    """
+    Gets the path of a file derived from the supplied file
+
+    :param file_name: the input file name
+    :param tag: a tag to include in the file name
+    :param image_format: the format of the derived file, if not the same as the input file
+
+    :return: the path of the derived file
     """
 
-    parent_id = _get_directory_id(items, names)
+    output_dir = os.path.dirname(file_name)
+    file_name_base, extension = os.path.splitext(os.path.basename(file_name))
+    if image_format is not None:
+        extension = f'.{image_format}'
+
+    return os.path.join(
+        output_dir, f'{file_name_base}.{tag}{extension}')
+
+
+def _responsive_widths(width: int,
+                       image_widths: list[int]) -> list[int]:
+    """
+    Gets the widths at which an image is saved for responsive loading
+
+    :param width: the width of the image
+    :param image_widths: the widths at which images are saved
+
+    :return: the widths that are no larger than the image, followed by the width of the image if it is between widths
+    """
+    widths = [
+        image_width
+        for image_width in image_widths
+        if image_width <= width
+    ]
+
+    # So that the full resolution of an image narrower than the largest width is available
+    if image_widths and width < max(image_widths) and width not in widths:
+        widths.append(width)
+
+    return widths
+
+
+def _width_tag(width: int) -> str:
+    """
+    Gets the tag included in the file name of the version of an image with the supplied width
+
+    :param width: the width
+
+    :return: the tag
+    """
+    return f'w{width}'
+
+
+def _crop_box(size: tuple[int, int],
+              aspect_ratio: list[int],
+              focus: list[float]) -> tuple[float, float, float, float]:
+    """
+    Gets the largest region of an image with the supplied aspect ratio, centred as close to the focus point as possible
+
+    :param size: the width and height of the image
+    :param aspect_ratio: the width and height of the aspect ratio (e.g. [16, 9])
+    :param focus: the x & y fractional position of the focus point
+
+    :return: the left, top, right and bottom of the region
+    """
+    width, height = size
+    aspect_width, aspect_height = aspect_ratio
+
+    crop_width = min(width, height * aspect_width / aspect_height)
+    crop_height = crop_width * aspect_height / aspect_width
+
+    focus_x, focus_y = focus
+    left = min(max(focus_x * width - crop_width / 2, 0), width - crop_width)
+    top = min(max(focus_y * height - crop_height / 2, 0), height - crop_height)
+
+    return left, top, left + crop_width, top + crop_height
+
+
+def _crop_size(size: tuple[int, int],
+               crop: dict) -> tuple[int, int]:
+    """
+    Gets the size at which a crop of an image is saved
+
+    :param size: the width and height of the image
+    :param crop: the aspect ratio and maximum width of the crop (a value of IMAGE_CROPS)
 
+    :return: the width and height of the saved crop
+    """
+    aspect_width, aspect_height = crop['aspect_ratio']
+    left, _, right, _ = _crop_box(size, crop['aspect_ratio'], [0.5, 0.5])
+
+    width = max(1, min(crop['width'], round(right - left)))
+    return width, max(1, round(width * aspect_height / aspect_width))
+
+
+def _derived_file_names(file_name: str,
+                        image_formats: list[str],
+                        widths: list[int],
+                        image_crops: list[str]) -> list[str]:
+    """
+    Gets the names of all of the resized versions of the supplied image
+
+    :param file_name: the image file name
+    :param image_formats: the additional formats in which the resized images are saved
+    :param widths: the widths at which the image is saved for responsive loading
+    :param image_crops: the names of the crops of the image that are saved
+
+    :return: the file names
+    """
     return [
-        item_id
-        for item_id, item_info in items.items()
-        if item_info.parent_id == parent_id
+        os.path.basename(_derived_file_path(file_name, tag, image_format))
+        for tag in ['large', 'medium', 'preview', *map(_width_tag, widths), *image_crops]
+        for image_format in [None, *image_formats]
     ]
 
 
-def _download_file(service,
-                   item_id: str,
-                   mime_type='text/markdown') -> bytes:
+def _scaled_size(size: tuple[int, int],
+                 max_size: int) -> tuple[int, int]:
     """
-    Downloads a file Google drive as raw bytes
+    Gets the size of an image scaled so that its width or height (whichever is larger) is the supplied size
 
-    :param service: the service
-    :param item_id: the item ID
-    :param mime_type: the file type
+    :param size: the width and height of the image
+    :param max_size: the size of the larger of the width or height after scaling
 
-    :return: the file contents
+    :return: the scaled width and height
     """
+    width, height = size
+    scale = max_size / max(width, height)
+    return int(scale * width), int(scale * height)
 
-    result = (
-        service.files()
-        .export(fileId=item_id,
-                mimeType=mime_type)
-        .execute()
-    )
 
-    return result
+def _resize_image(image: Image.Image,
+                  max_size: int) -> Image.Image:
+    """
+    Gets a copy of the supplied image, scaled down so that its width and height are no larger than the supplied size
 
+    :param image: the image to resize
+    :param max_size: the maximum size of the width or height of the image
 
-def _download_text(service,
-                   item_id: str) -> str:
+    :return: the resized image
     """
-    Downloads a document from Google drive as text
+    resized = image.copy()
+    resized.thumbnail(_scaled_size(image.size, max_size))
+    return resized
 
-    :param service: the service
-    :param item_id: the item ID
 
-    :return: the file contents string
+def _save_image(image: Image.Image,
+                file_name: str,
+                tag: str) -> str:
     """
-    return _download_file(service, item_id,
-                          mime_type='text/plain').decode()
+    Save the supplied image alongside the input file
 
+    :param image: the image to save
+    :param file_name: the input file name
+    :param tag: a tag to include in the file name
 
-def _download_sheet(service,
-                    item_id: str) -> list[list[str]]:
+    :return: the path of the saved image
     """
-    Downloads a sheet from Google drive
 
-    :param service: the service
-    :param item_id: the item ID
+    output_file = _derived_file_path(file_name, tag)
+    image.save(output_file)
 
-    :return: the file contents
+    return output_file
+
+
+def _save_image_formats(image: Image.Image,
+                        file_name: str,
+                        tag: str,
+                        image_formats: list[str]) -> list[str]:
     """
-    csv_text = _download_file(service, item_id,
-                              mime_type='text/csv').decode()
-    return list(csv.reader(csv_text.splitlines()))
+    Save the supplied image alongside the input file, in each of the supplied formats
 
+    :param image: the image to save
+    :param file_name: the input file name
+    :param tag: a tag to include in the file name
+    :param image_formats: the formats in which to save the image
 
-def _check_file_exists(file_path: str,
-                       file_size: int,
-                       sha256: str) -> bool:
+    :return: the paths of the saved images
     """
-    Check that the file with the supplied path exists, and has the expected size and hash
+    if image_formats and image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
 
-    :param file_path: the file path
-    :param file_size: the size of the file in bytes
-    :param sha256: the sha256 hash of the file contents
+    # The versions used for responsive loading are displayed at the large and medium sizes
+    quality_tag = tag
+    if quality_tag not in ('large', 'medium', 'preview'):
+        quality_tag = 'large' if image.width > MAX_MEDIUM_IMAGE_SIZE else 'medium'
 
-    :return: True if the file exists, False otherwise
+    output_files = []
+    for image_format in image_formats:
+        output_file = _derived_file_path(file_name, tag, image_format)
+        image.save(output_file, format=image_format.upper(), quality=IMAGE_FORMATS[image_format][quality_tag])
+        output_files.append(output_file)
+
+    return output_files
+
+
+def _image_versions(size: tuple[int, int],
+                    widths: list[int],
+                    image_crops: list[str],
+                    focus: list[float]) -> tuple[list, list, tuple[int, int]]:
     """
-    file_name = os.path.basename(file_path)
-    if not os.path.isfile(file_path):
-        return False
+    Gets the versions and crops of an image that are saved, and the size to which it can be decoded to make them
 
-    if os.path.getsize(file_path) != file_size:
-        print(f'{file_name} exists, but has the wrong size. Overwriting.')
-        return False
+    :param size: the width and height of the image
+    :param widths: the widths at which to save the image for responsive loading
+    :param image_crops: the names of the crops to save
+    :param focus: the x & y fractional position of the focus point of the image
 
-    buffer_size = 65536  # Read input media file in 64 kb chunks
-    hasher = hashlib.sha256()
+    :return: the tag and size of each version (largest first), the name, box and size of each crop,
+             and the smallest size from which they can all be made
+    """
+    width, height = size
+
+    versions = [
+        ('large', _scaled_size(size, min(MAX_LARGE_IMAGE_SIZE, max(size)))),
+        ('medium', _scaled_size(size, min(MAX_MEDIUM_IMAGE_SIZE, max(size)))),
+        *[
+            (_width_tag(version_width), (version_width, max(1, round(version_width * height / width))))
+            for version_width in widths
+        ]
+    ]
+    versions.sort(key=lambda version: version[1][0], reverse=True)
 
-    with open(file_path, 'rb') as file:
-        while True:
-            data = file.read(buffer_size)
-            if not data:
-                break
+    crops = [
+        (crop,
+         _crop_box(size, IMAGE_CROPS[crop]['aspect_ratio'], focus),
+         _crop_size(size, IMAGE_CROPS[crop]))
+        for crop in image_crops
+    ]
 
-            hasher.update(data)
+    # The JPEG decoder scales down by dropping the highest frequencies, which does not alias, so the image need only
+    # be decoded at the size of the largest version or crop. Keeping twice that size (as Image.thumbnail does) would
+    # decode most photos at full size once the ladder of widths goes beyond the large version.
+    scale = max([
+        versions[0][1][0] / width,
+        *[
+            crop_size[0] / (box[2] - box[0])
+            for _, box, crop_size in crops
+        ]
+    ])
 
-    if not hasher.hexdigest() == sha256:
-        print(f'{file_name} exists, but has the wrong hash. Overwriting.')
-        return False
+    return versions, crops, (math.ceil(scale * width), math.ceil(scale * height))
 
-    return True
 
+def _estimated_image_memory(size: tuple[int, int],
+                            extension: str,
+                            widths: list[int],
+                            image_crops: list[str]) -> int:
+    """
+    Estimates the memory used to create the versions and crops of an image, without opening it
+
+    The decoded image is held in memory while each crop is made, and while each version is scaled down from the one
+    before it, so the decoded image, the largest crop, and the two largest versions are counted. The largest version
+    is counted again for the copy of it held by an encoder while it is saved.
+    JPEG images are decoded at a reduced size (by a factor of 2, 4 or 8, as chosen by Pillow's draft mode)
+    when the versions and crops are small enough.
 
-def _download_media(service,
-                    item_id: str,
-                    extension: str,
-                    file_size: int,
-                    sha256: str,
-                    output_dir: str) -> str:
+    :param size: the width and height of the image
+    :param extension: the file extension of the image
+    :param widths: the widths at which the image is saved for responsive loading
+    :param image_crops: the names of the crops that are saved
+
+    :return: the estimated memory in bytes
     """
-    Downloads the image or video with the supplied ID and writes the file into the output directory
+    width, height = size
+    versions, crops, draft_size = _image_versions(size, widths, image_crops, [0.5, 0.5])
+
+    reduction = 1
+    if extension.lower() in ('jpg', 'jpeg'):
+        reduction = max(1, min(width // max(1, draft_size[0]), height // max(1, draft_size[1])))
+        reduction = next(factor for factor in (8, 4, 2, 1) if reduction >= factor)
+
+    decoded_pixels = -(-width // reduction) * -(-height // reduction)
+
+    # Versions with the same size as a larger one are copied, so are never held in memory
+    version_pixels = sorted({
+        version_width * version_height
+        for _, (version_width, version_height) in versions
+    }, reverse=True)
+    largest_pixels = version_pixels[0]
+    next_largest_pixels = version_pixels[1] if len(version_pixels) > 1 else 0
+    crop_pixels = max([crop_width * crop_height for _, _, (crop_width, crop_height) in crops], default=0)
+
+    return round(IMAGE_MEMORY_OVERHEAD * IMAGE_BYTES_PER_PIXEL *
+                 (decoded_pixels + 2 * largest_pixels + next_largest_pixels + crop_pixels))
+
+
+def _generate_resized_images(image_file: str,
+                             image_formats: list[str] = (),
+                             widths: list[int] = (),
+                             image_crops: list[str] = (),
+                             focus: list[float] = (0.5, 0.5)) -> list[str]:
+    """
+    Generates the large, medium and preview versions of the supplied image, a version at each supplied width,
+    and each supplied crop
 
-    :param service: the service
-    :param item_id: the item ID
-    :param extension: the file extension
-    :param file_size: the size of the file to download (in bytes)
-    :param sha256: the sha256 digest of the media file (used to check if file is already downloaded)
-    :param ouput_dir: the output directory
+    The image is decoded once, and each version is scaled down from the next larger one. A version with the same
+    size as a larger one (e.g. the large version and the version at its width) is copied rather than encoded again.
+    The crops are cut from the decoded image, centred on the focus point.
+    Each version is saved in the format of the original image, and in each of the supplied formats.
+
+    :param image_file: the path to the image file
+    :param image_formats: the additional formats in which to save each version
+    :param widths: the widths at which to save the image for responsive loading
+    :param image_crops: the names of the crops to save
+    :param focus: the x & y fractional position of the focus point of the image
 
-    :return: the path to the downloaded file
+    :return: the paths of the resized images
     """
-    file_path = os.path.join(output_dir, f'{item_id}.{extension}')
-    if _check_file_exists(file_path, file_size, sha256):
-        print(f'{file_path} already exists. Skipping.')
-        return file_path
 
-    request = service.files().get_media(fileId=item_id)
-    with open(file_path, 'wb') as file:
-        downloader = MediaIoBaseDownload(file, request)
+    with Image.open(image_file) as image:
+        size = image.size
+        versions, crops, draft_size = _image_versions(size, widths, image_crops, focus)
+
+        # Let the JPEG decoder skip detail that would be lost when scaling down to the largest version or crop
+        image.draft(image.mode, draft_size)
+        image.load()
+
+        output_files = []
+
+        # The decoded image may be smaller than the original, so the crops are scaled to match
+        decoded_scale = image.width / size[0]
+        for crop, box, crop_size in crops:
+            cropped = image.resize(crop_size, box=tuple(decoded_scale * value for value in box), reducing_gap=2.0)
+            output_files += [_save_image(cropped, image_file, crop),
+                             *_save_image_formats(cropped, image_file, crop, image_formats)]
+
+        resized = image
+        saved_versions = {}
+        for tag, version_size in versions:
+            if version_size in saved_versions:
+                for image_format in [None, *image_formats]:
+                    output_file = _derived_file_path(image_file, tag, image_format)
+                    shutil.copyfile(_derived_file_path(image_file, saved_versions[version_size], image_format),
+                                    output_file)
+                    output_files.append(output_file)
+                continue
+
+            resized = resized.resize(version_size, reducing_gap=2.0)
+            output_files += [_save_image(resized, image_file, tag),
+                             *_save_image_formats(resized, image_file, tag, image_formats)]
+            saved_versions[version_size] = tag
 
-        done = False
-        show_progress_bar = False
-        while done is False:
-            status, done = downloader.next_chunk()
+    # Blur after scaling down, with the radius scaled to match
+    preview = _resize_image(resized, MAX_PREVIEW_IMAGE_SIZE)
+    preview = preview.filter(ImageFilter.GaussianBlur(
+        radius=max(preview.width, preview.height) * PREVIEW_BLUR_AMOUNT
+    ))
+    output_files += [_save_image(preview, image_file, 'preview'),
+                     *_save_image_formats(preview, image_file, 'preview', image_formats)]
 
-            if not done:
-                show_progress_bar = True
+    return output_files
 
-            if show_progress_bar:
-                progress = int(100 * status.progress())
-                print(f"{progress:3d}% {progress * '='}",
-                      end='\r',
-                      flush=True)
 
-                if done:
-                    print()
+def _reset_peak_rss():
+    """
+    Resets the peak resident memory of this process, where the OS supports it (Linux)
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
 
-    return file_path
 
+def _peak_rss() -> int:
+    """
+    Gets the peak resident memory of this process since it was last reset, or since it started where the OS
+    does not support resetting it
 
-def _add_focus_points(service,
-                      photos: list):
+    :return: the peak resident memory in bytes
     """
-    Looks for a comment on the supplied photos, and adds the position of the comment as the "focal point" of the image
+    try:
+        with open('/proc/self/status', 'r') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@dataclass
+class MediaProcessingResult:
+    """
+    The result of creating the files derived from a media item in a worker process
+    """
+
+    outputs: dict[str, str]
+    """
+    The sha256 hash of each derived file, keyed by file name
+    """
+
+    start: float
+    """
+    The time at which processing started (seconds since the epoch)
+    """
+
+    wall_seconds: float
+    """
+    The time taken to process the media item
+    """
+
+    cpu_seconds: float
+    """
+    The CPU time used to process the media item, including any programs that were run
+    """
+
+    pid: int
+    """
+    The ID of the worker process
+    """
+
+    peak_rss: int
+    """
+    The peak resident memory of the worker process (in bytes) while processing the media item,
+    not including any programs that were run
+    """
+
+
+def _process_image(file_path: str,
+                   image_formats: list[str],
+                   widths: list[int],
+                   image_crops: list[str],
+                   focus: list[float]) -> MediaProcessingResult:
+    """
+    Creates the preview, medium and large versions of the supplied image, a version at each supplied width,
+    and each supplied crop
+
+    This is run in a worker process, so must only use its arguments and module-level state.
+
+    :param file_path: the path to the image file
+    :param image_formats: the additional formats in which to save each version
+    :param widths: the widths at which to save the image for responsive loading
+    :param image_crops: the names of the crops to save
+    :param focus: the x & y fractional position of the focus point of the image
+
+    :return: the hashes of the resized images, and the time taken
+    """
+    start = time.time()
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    _reset_peak_rss()
+
+    outputs = {
+        os.path.basename(output_file): _hash_file(output_file)
+        for output_file in _generate_resized_images(file_path, image_formats, widths, image_crops, focus)
+    }
+
+    return MediaProcessingResult(
+        outputs=outputs,
+        start=start,
+        wall_seconds=time.perf_counter() - start_wall,
+        cpu_seconds=time.process_time() - start_cpu,
+        pid=os.getpid(),
+        peak_rss=_peak_rss()
+    )
+
+
+def _srcset(file_path: str,
+            width: int,
+            height: int,
+            image_formats: list[str],
+            widths: list[int]) -> list[dict]:
+    """
+    Gets the details of the versions of an image saved for responsive loading
+
+    :param file_path: the path to the image file
+    :param width: the width of the image
+    :param height: the height of the image
+    :param image_formats: the additional formats in which each version is saved
+    :param widths: the widths of the versions
+
+    :return: the width, height and size in bytes (of each format) of each version
+    """
+    extension = os.path.splitext(file_path)[1][1:]
+    return [
+        {
+            'width': version_width,
+            'height': max(1, round(version_width * height / width)),
+            'bytes': {
+                image_format or extension: os.path.getsize(
+                    _derived_file_path(file_path, _width_tag(version_width), image_format))
+                for image_format in [None, *image_formats]
+            }
+        }
+        for version_width in widths
+    ]
+
+
+def _image_placeholder(preview_file: str) -> dict:
+    """
+    Gets a tiny version of the supplied preview image to embed in the content, and the dominant colour of the image
+
+    :param preview_file: the path to the (blurred) preview image
+
+    :return: the placeholder as a JPEG data URI, and the dominant colour as a CSS hex colour
+    """
+    with Image.open(preview_file) as preview:
+        placeholder = _resize_image(preview.convert('RGB'), PLACEHOLDER_SIZE)
+
+    buffer = io.BytesIO()
+    placeholder.save(buffer, format='JPEG', quality=PLACEHOLDER_QUALITY, optimize=True)
+
+    # The most common of a few representative colours
+    quantized = placeholder.quantize(colors=4)
+    _, index = max(quantized.getcolors())
+    red, green, blue = quantized.getpalette()[3 * index:3 * index + 3]
+
+    return {
+        'placeholder': f'data:image/jpeg;base64,{base64.b64encode(buffer.getvalue()).decode("ascii")}',
+        'color': f'#{red:02x}{green:02x}{blue:02x}'
+    }
+
+
+def _video_derivative_settings(image_formats: list[str],
+                               rendition: bool) -> dict:
+    """
+    Gets the settings that affect the files derived from a video
+
+    :param image_formats: the additional formats in which the poster and preview are saved
+    :param rendition: True if a smaller version of the video is made for the web
+
+    :return: the settings as a dict
+    """
+    return {
+        'poster_time': VIDEO_POSTER_TIME,
+        'poster_size': MAX_LARGE_IMAGE_SIZE,
+        'preview_size': MAX_PREVIEW_IMAGE_SIZE,
+        'preview_blur': PREVIEW_BLUR_AMOUNT,
+        'formats': {
+            image_format: IMAGE_FORMATS[image_format]
+            for image_format in image_formats
+        },
+        'rendition': VIDEO_RENDITION if rendition else None
+    }
+
 
-    :param service: the service
-    :param photos: the list of photo data  
+def _video_derived_file_names(file_name: str,
+                              image_formats: list[str],
+                              rendition: bool) -> list[str]:
     """
+    Gets the names of all of the files derived from the supplied video
 
-    for photo in photos:
-        photo_id = photo['file_id']
-        comments = _get_comments(service, photo_id)
-        for comment in comments:
-            if comment.content.strip().lower() != 'focus':
-                continue
+    :param file_name: the video file name
+    :param image_formats: the additional formats in which the poster and preview are saved
+    :param rendition: True if a smaller version of the video is made for the web
 
-            if not comment.anchor:
-                continue
+    :return: the file names
+    """
+    file_names = [
+        os.path.basename(_derived_file_path(file_name, tag, image_format))
+        for tag in ['poster', 'preview']
+        for image_format in ['jpg', *image_formats]
+    ]
 
-            # Anchors have the form:
-            # [null,[null,[0.3835125448028674,0.10618279569892473,0.4829749103942652,0.24193548387096775]],null,"0BwUS5sqIvorgNUJqbXowdXV0Z0UwYVY1S3B3VkE1ekdXYzZ3PQ"
-            anchor = json.loads(comment.anchor)
-            print(photo['name'], anchor[1][1])
-            x_lower, y_lower, x_upper, y_upper = anchor[1][1]
+    if rendition:
+        file_names.append(os.path.basename(_derived_file_path(file_name, 'web', 'mp4')))
 
-            focus_x = (x_lower + x_upper) / 2
-            focus_y = (y_lower + y_upper) / 2
+    return file_names
 
-            photo['focus'] = [focus_x, focus_y]
 
-def _get_contact_details(service,
-                         items: dict[str, DriveItemInfo]) -> dict:
+def _extract_video_frame(ffmpeg: str,
+                         video_file: str,
+                         frame_file: str):
     """
-    Gets the contact details
+    Extracts the poster frame of a video
 
-    :param service: the service
-    :param items: the dict of items
-
-    :return: contact details as a dict
+    :param ffmpeg: the ffmpeg executable
+    :param video_file: the path to the video
+    :param frame_file: the path of the image to which the frame is written
     """
+    for seconds in [VIDEO_POSTER_TIME, 0]:
+        subprocess.run([ffmpeg, '-v', 'error', '-y',
+                        '-ss', str(seconds), '-i', video_file,
+                        '-frames:v', '1', frame_file],
+                       check=True)
 
-    required_keys = ['email', 'instagram']
-    result = {
-        key: value
-        for key, value in _download_sheet(service,
-                                          _get_file_id(items, ['contact']))
-        if key in required_keys
-    }
-
-    for key in required_keys:
-        if key not in result:
-            raise RuntimeError(f'Contact details are missing: {key}')
+        # Nothing is written if the video is shorter than the poster time
+        if os.path.isfile(frame_file) and os.path.getsize(frame_file) > 0:
+            return
 
-    return result
+    raise RuntimeError(f'No frames could be extracted from {os.path.basename(video_file)}')
 
 
-def _get_media_list(items: dict[str, DriveItemInfo],
-                    names: list[str],
-                    item_type: DriveItemType) -> list[dict]:
+def _transcode_video(ffmpeg: str,
+                     video_file: str,
+                     output_file: str):
     """
-    Get a list of media data (image or video) at the supplied path
+    Makes a smaller version of a video for the web, with the settings in VIDEO_RENDITION
 
-    :param items: the dict of items
-    :param names: the names in the path to the directory containing the media items
-    :param item_type: the type of item (image or video)
+    The video is written to a temporary file, which is only moved into place once it is complete.
 
-    :return: the media data as a list
+    :param ffmpeg: the ffmpeg executable
+    :param video_file: the path to the video
+    :param output_file: the path of the smaller version
     """
-    return [
-        {
-            'file_id': photo_info.item_id,
-            'name': photo_info.name,
-            'description': (photo_info.description or '').strip(),
-            **photo_info.metadata
-        }
-        for photo_info in [
-            items[item_id]
-            for item_id in _get_items_in_dir(items, names)
-        ]
-        if photo_info.item_type == item_type
-    ]
+    temp_file = os.path.join(os.path.dirname(output_file), f'.{os.path.basename(output_file)}.part.mp4')
+    max_bitrate = VIDEO_RENDITION['max_bitrate']
+
+    try:
+        subprocess.run([ffmpeg, '-v', 'error', '-y', '-i', video_file,
+                        '-vf', f'scale=-2:min({VIDEO_RENDITION["max_height"]}\\,ih)',
+                        '-c:v', 'libx264', '-preset', 'medium', '-pix_fmt', 'yuv420p',
+                        '-crf', str(VIDEO_RENDITION['crf']),
+                        '-maxrate', max_bitrate, '-bufsize', max_bitrate,
+                        '-c:a', 'aac', '-b:a', VIDEO_RENDITION['audio_bitrate'],
+                        '-movflags', '+faststart',
+                        temp_file],
+                       check=True)
+
+        os.replace(temp_file, output_file)
+
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+def _process_video(file_path: str,
+                   ffmpeg: str,
+                   image_formats: list[str],
+                   rendition: bool) -> MediaProcessingResult:
+    """
+    Creates the poster and preview images of the supplied video, and optionally a smaller version for the web
 
+    This is run in a worker process, so must only use its arguments and module-level state.
 
-def _get_quote_content(service,
-                       items: dict[str, DriveItemInfo]) -> list[dict]:
+    :param file_path: the path to the video file
+    :param ffmpeg: the ffmpeg executable
+    :param image_formats: the additional formats in which to save the poster and preview
+    :param rendition: True if a smaller version of the video should be made for the web
+
+    :return: the hashes of the derived files, and the time taken
     """
-    Gets the quote content
+    start = time.time()
+    start_wall = time.perf_counter()
+    start_times = os.times()
+    _reset_peak_rss()
+
+    frame_file = os.path.join(os.path.dirname(file_path), f'.{os.path.basename(file_path)}.frame.png')
+    try:
+        _extract_video_frame(ffmpeg, file_path, frame_file)
+        with Image.open(frame_file) as frame:
+            poster = _resize_image(frame.convert('RGB'), min(MAX_LARGE_IMAGE_SIZE, max(frame.size)))
+
+    finally:
+        if os.path.exists(frame_file):
+            os.remove(frame_file)
+
+    poster_file = _derived_file_path(file_path, 'poster', 'jpg')
+    poster.save(poster_file)
+    output_files = [poster_file, *_save_image_formats(poster, file_path, 'poster', image_formats)]
+
+    # Blur after scaling down, with the radius scaled to match
+    preview = _resize_image(poster, MAX_PREVIEW_IMAGE_SIZE)
+    preview = preview.filter(ImageFilter.GaussianBlur(
+        radius=max(preview.width, preview.height) * PREVIEW_BLUR_AMOUNT
+    ))
+    preview_file = _derived_file_path(file_path, 'preview', 'jpg')
+    preview.save(preview_file)
+    output_files += [preview_file, *_save_image_formats(preview, file_path, 'preview', image_formats)]
+
+    if rendition:
+        rendition_file = _derived_file_path(file_path, 'web', 'mp4')
+        _transcode_video(ffmpeg, file_path, rendition_file)
+        output_files.append(rendition_file)
+
+    outputs = {
+        os.path.basename(output_file): _hash_file(output_file)
+        for output_file in output_files
+    }
 
-    :param service: the service
-    :param items: the dict of items
+    end_times = os.times()
+    return MediaProcessingResult(
+        outputs=outputs,
+        start=start,
+        wall_seconds=time.perf_counter() - start_wall,
+        cpu_seconds=sum(end_times[:4]) - sum(start_times[:4]),
+        pid=os.getpid(),
+        peak_rss=_peak_rss()
+    )
 
-    :return: the quote contents as a list of dicts - one per quote
+
+def _video_details(file_path: str,
+                   image_formats: list[str],
+                   rendition: bool) -> dict:
     """
+    Gets the details of the files derived from a video, to add to its media data
 
-    profile_photos = _get_media_list(items, ['home', 'profile_photos'], DriveItemType.IMAGE)
+    :param file_path: the path to the video file
+    :param image_formats: the additional formats in which the poster and preview are saved
+    :param rendition: True if a smaller version of the video was made for the web
 
-    photos_dict = {
-        photo_data['name']: photo_data 
-        for photo_data in profile_photos
+    :return: the file name, size and formats of the poster, the file name of the preview,
+             and the file name and size in bytes of the smaller version
+    """
+    poster_file = _derived_file_path(file_path, 'poster', 'jpg')
+    with Image.open(poster_file) as poster:
+        width, height = poster.size
+
+    details = {
+        'poster': {
+            'file': os.path.basename(poster_file),
+            'width': width,
+            'height': height,
+            'formats': list(image_formats)
+        },
+        'preview': os.path.basename(_derived_file_path(file_path, 'preview', 'jpg'))
     }
 
-    return [
-        {
-            'quote': quote,
-            'name': name,
-            'url': url,
-            'photo': photos_dict[image_name]
+    if rendition:
+        rendition_file = _derived_file_path(file_path, 'web', 'mp4')
+        details['rendition'] = {
+            'file': os.path.basename(rendition_file),
+            'bytes': os.path.getsize(rendition_file)
         }
-        for quote, name, image_name, url in _download_sheet(service,
-                                                            _get_file_id(items, ['home', 'quotes']))
-    ]
 
-def _get_name_check_content(service,
-                            items: dict[str, DriveItemInfo]) -> list[dict]:
-    """
-    Gets the name check content
+    return details
 
-    :param service: the service
-    :param items: the dict of items
 
-    :return: the name check contents as a list of dicts - one per name check
+def _blob_name(media_item: dict) -> str:
     """
+    Gets the name (without the extension) of the file in which the content of a media item is stored
 
-    logos = _get_media_list(items, ['home', 'logos'], DriveItemType.IMAGE)
+    Items with the same content are stored in the same file.
 
-    photos_dict = {
-        photo_data['name']: photo_data 
-        for photo_data in logos
-    }
+    :param media_item: the media data
 
-    return [
-        {
-            'name': name,
-            'url': url,
-            'photo': photos_dict[image_name]
-        }
-        for name, url, image_name in _download_sheet(service,
-                                                     _get_file_id(items, ['home', 'name_checks']))
-    ]
+    :return: the name
+    """
+    return media_item['sha256']
 
-def _get_home_content(service,
-                      items: dict[str, DriveItemInfo]) -> dict:
+
+@dataclass
+class MediaOptions:
+    """
+    Options for the files derived from each media item
     """
-    Gets the content of the home page
 
-    :param service: the service
-    :param items: the dict of items
+    image_formats: list[str]
+    """
+    The formats in which each resized image is saved, as well as the format of the original image
+    """
 
-    :return: the home page contents as a dict
+    image_widths: list[int]
+    """
+    The widths at which each image is saved for responsive loading
     """
-    result = {}
-    result['bio'] = _download_text(service,
-                                   _get_file_id(items, ['home', 'bio']))
 
-    result['introduction'] = _download_text(service,
-                                            _get_file_id(items, ['home', 'introduction']))
+    image_crops: list[str]
+    """
+    The names of the crops of each image that are saved
+    """
 
-    result['quotes'] = _get_quote_content(service, items)
-    result['name_checks'] = _get_name_check_content(service, items)
-    result['photos'] = _get_media_list(items, ['home', 'images'], DriveItemType.IMAGE)
-    _add_focus_points(service, result['photos'])
+    placeholders: bool
+    """
+    True if a placeholder and the dominant colour should be added to the media data of each image and video
+    """
 
-    return result
+    ffmpeg: str | None
+    """
+    The ffmpeg executable, or None if videos are not processed
+    """
 
+    video_renditions: bool
+    """
+    True if a smaller version of each video should be made for the web
+    """
 
-def _get_portfolio_content(items: dict[str, DriveItemInfo]) -> dict:
+    memory_budget: int
+    """
+    The amount of memory (in bytes) that the images being processed at the same time may use between them
     """
-    Gets the content of the portfolio page
 
-    :param items: the dict of items
 
-    :return: the portfolio page contents as a dict
+class MemoryBudget:
+    """
+    An amount of memory, shared between threads, which limits how much work is done at the same time
     """
 
-    portfolio_items = [
-        items[item_id]
-        for item_id in _get_items_in_dir(items, ['portfolio'])
-    ]
+    def __init__(self, capacity: int):
+        """
+        :param capacity: the amount of memory in bytes
+        """
+        self._capacity = capacity
+        self._used = 0
+        self._condition = threading.Condition()
+        self.peak = 0
 
-    photos = {}
-    for item in portfolio_items:
-        if item.item_type != DriveItemType.DIRECTORY:
-            continue
+    def acquire(self, amount: int) -> float:
+        """
+        Waits until the supplied amount of memory is free, and takes it
 
-        album_name = item.description.strip()
-        if not album_name:
-            album_name = item.name
+        An amount larger than the whole budget is taken once nothing else is using any memory.
 
-        photos[album_name] = _get_media_list(items, ['portfolio', item.name], DriveItemType.IMAGE)
+        :param amount: the amount of memory in bytes
 
-    return {
-        'photos': photos
-    }
+        :return: the time spent waiting (in seconds)
+        """
+        start = time.perf_counter()
+        with self._condition:
+            self._condition.wait_for(lambda: self._used == 0 or self._used + amount <= self._capacity)
+            self._used += amount
+            self.peak = max(self.peak, self._used)
+
+        return time.perf_counter() - start
 
+    def release(self, amount: int):
+        """
+        Frees memory taken with acquire
 
-def _get_video_content(items: dict[str, DriveItemInfo]) -> list:
+        :param amount: the amount of memory in bytes
+        """
+        with self._condition:
+            self._used -= amount
+            self._condition.notify_all()
+
+
+def _image_outputs(media_item: dict,
+                   file_path: str,
+                   options: MediaOptions) -> tuple[list[int], list[str], list[str], dict]:
     """
-    Gets the content of the video page
+    Gets the files that are derived from an image
 
-    :param items: the dict of items
+    :param media_item: the media data of the image
+    :param file_path: the path to the downloaded image
+    :param options: the options for the derived files
 
-    :return: the video page contents as a list
+    :return: the widths at which the image is saved, the names of its crops, the names of the derived files,
+             and the settings used to build them
     """
-    return {
-        'videos': _get_media_list(items, ['video'], DriveItemType.VIDEO)
+    widths = []
+    crops = []
+    if media_item.get('width') and media_item.get('height'):
+        widths = _responsive_widths(int(media_item['width']), options.image_widths)
+        crops = options.image_crops
+
+    # The crops depend on the focus point, which can change without the image changing
+    settings = {
+        **_image_derivative_settings(options.image_formats, options.image_widths, options.image_crops),
+        'focus': media_item.get('focus') or [0.5, 0.5]
     }
 
+    return widths, crops, _derived_file_names(file_path, options.image_formats, widths, crops), settings
 
-def _write_json_file(content: object,
-                     output_dir: str,
-                     name: str):
-    """
-    Writes out data in JSON format
 
-    :param content: the content of to write to the file
-    :param output_dir: the output directory
-    :param name: the name of the file
+def _worker_context() -> multiprocessing.context.BaseContext:
     """
-    with open(os.path.join(output_dir, name), 'w') as file:
-        json.dump(content,
-                  file,
-                  indent=4)
+    Gets the context in which the worker processes that create derived files are started
 
+    Workers are started by a fork server (or spawned where that is not available) rather than forked, as the pool is
+    started while download threads, and the event loop of the asyncio transport, are running.
 
-def _save_resized_image(image: Image,
-                        file_name: str,
-                        max_size: int,
-                        tag: str):
+    :return: the multiprocessing context
     """
-    Save the supplied image at the supplied scale
-
-    :param image: the image to save
-    :param file_name: the input file name
-    :param max_size: the maximum size of the width or height of the image
-    :param tag: a tag to include in the file name
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+
+    return multiprocessing.get_context('spawn')
+
+
+def _download_and_process_media(service: DriveService,
+                                tree: DriveTree,
+                                media: list[dict],
+                                output_dir: str,
+                                hash_cache: HashCache,
+                                manifest: BuildManifest,
+                                jobs: int,
+                                workers: int,
+                                chunk_size: int,
+                                options: MediaOptions,
+                                report: BuildReport) -> set[str]:
     """
+    Downloads the supplied media items, creates the resized versions of the images,
+    and the posters (and optionally smaller versions) of the videos
 
-    output_dir = os.path.dirname(file_name)
-    file_name_base, extension = os.path.splitext(os.path.basename(file_name))
+    Downloads run on a pool of threads, and each item is handed to a pool of processes as soon as it is
+    downloaded, so that processing overlaps with the remaining downloads and uses every CPU.
+    Items whose derived files are recorded as up to date in the manifest are not processed again.
 
-    output_file = os.path.join(
-        output_dir, f'{file_name_base}.{tag}{extension}')
+    Media is stored by content: items with the same sha256 hash (e.g. the same photo in several albums)
+    are downloaded and processed once, to files named after the hash, and the media data of each
+    points to these files.
 
-    scale = max_size / max(image.width, image.height)
-    width = int(scale * image.width)
-    height = int(scale * image.height)
-    image.thumbnail((width, height))
-    image.save(output_file)
+    Images are only handed to the pool while their estimated memory fits within the memory budget,
+    so that several very large images are not processed at once.
 
+    The formats of the resized versions, the widths and sizes of the versions for responsive loading,
+    the sizes of the crops, and optionally a placeholder and the dominant colour, are added to each image's media data.
+    The derived files are added to each video's media data. A video that cannot be processed (e.g. ffmpeg
+    cannot read it) is logged and left without derived files, rather than failing the build.
 
-def _generate_image_preview(image_file: str):
+    :param service: the drive service
+    :param tree: the index of all items
+    :param media: the media data
+    :param output_dir: the output directory
+    :param hash_cache: the cache of file hashes
+    :param manifest: the record of previously derived files, which is updated
+    :param jobs: the number of media files to download at the same time
+    :param workers: the number of processes used to create derived files
+    :param chunk_size: the number of bytes requested at a time when downloading media
+    :param options: the options for the derived files
+    :param report: the report to which the timings of each download and each item's processing are added
+
+    :return: the names of the media files, and the files derived from them, that the media data refers to
     """
-    Generates a down-sized copy of the supplied image
 
-    :param image_file: the path to the image file
-    """
+    video_settings = _video_derivative_settings(options.image_formats, options.video_renditions)
+
+    def download_media_item(media_item: dict) -> str:
+        blob = media_item['blob']
+        file_path = os.path.join(output_dir, f'{blob}.{media_item["extension"]}')
+
+        # Reuse a copy named after its item ID, as downloaded by earlier versions of this script
+        if not os.path.isfile(file_path):
+            for file_id in copies[file_path]:
+                legacy_file_path = os.path.join(output_dir, f'{file_id}.{media_item["extension"]}')
+                if _check_file_exists(legacy_file_path, int(media_item['size']), media_item['sha256'], hash_cache):
+                    os.replace(legacy_file_path, file_path)
+                    hash_cache.put(file_path, media_item['sha256'])
+                    break
+
+        with report.task(media_item['file_id'], 'download') as counters:
+            file_path, counters['received_bytes'] = _download_media(service,
+                                                                    media_item['file_id'],
+                                                                    media_item['extension'],
+                                                                    int(media_item['size']),
+                                                                    media_item['sha256'],
+                                                                    output_dir,
+                                                                    hash_cache,
+                                                                    chunk_size,
+                                                                    blob)
+        return file_path
 
-    with Image.open(image_file) as image:
+    # The same content may be referenced more than once, by one or more items, but must only be downloaded once.
+    # The references to, and the sizes of the copies of, each file are keyed by its path.
+    references = {}
+    copies = {}
+    for media_item in media:
+        media_item['blob'] = _blob_name(media_item)
+        file_path = os.path.join(output_dir, f'{media_item["blob"]}.{media_item["extension"]}')
+        references.setdefault(file_path, []).append(media_item)
+        copies.setdefault(file_path, {})[media_item['file_id']] = int(media_item['size'])
+
+    media = [
+        media_items[0]
+        for media_items in references.values()
+    ]
 
-        # Blur the full image
-        max_size = max(image.width, image.height)
-        preview = image.filter(ImageFilter.GaussianBlur(
-            radius=max(2, int(max_size * PREVIEW_BLUR_AMOUNT))
-        ))
+    with ThreadPoolExecutor(max_workers=jobs) as download_executor, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=_worker_context()) as processing_executor:
 
-        _save_resized_image(preview,
-                            image_file,
-                            MAX_PREVIEW_IMAGE_SIZE,
-                            'preview')
+        downloads = {
+            download_executor.submit(download_media_item, media_item): media_item
+            for media_item in media
+        }
 
+        images = []
+        videos = {}
+        processing = {}
+        file_names = set()
+        memory_budget = MemoryBudget(options.memory_budget)
+        estimated_memory = {}
+        memory_wait_seconds = 0.0
+        failed_videos = []
+        for completed, download in enumerate(as_completed(downloads), start=1):
+            media_item = downloads[download]
+            file_path = download.result()
+            _log(f'[{completed}/{len(media)}] {media_item["file_id"]}: {media_item["description"]}')
+
+            file_names.add(os.path.basename(file_path))
+
+            item_type = tree.items[media_item['file_id']].item_type
+            if item_type == DriveItemType.VIDEO:
+                # The derived files are kept even if they cannot be rebuilt, as the media data still refers to them
+                output_names = _video_derived_file_names(file_path, options.image_formats, options.video_renditions)
+                file_names.update(output_names)
+                if options.ffmpeg is None:
+                    continue
+
+                videos[file_path] = media_item, output_names
+
+                if manifest.is_up_to_date(output_dir, output_names, media_item['sha256'], video_settings):
+                    continue
+
+                processing[processing_executor.submit(_process_video, file_path, options.ffmpeg,
+                                                      options.image_formats, options.video_renditions)] = \
+                    media_item, file_path, video_settings
+                continue
 
-def _generate_resised_image(image_file: str,
-                            max_size: int,
-                            tag: str):
-    """
-    Save the supplied image at the supplied scale
+            if item_type != DriveItemType.IMAGE:
+                continue
 
-    :param image_file: the input file name
-    :param max_size: the maximum size of the width or height of the image
-    :param tag: a tag to include in the file name
-    """
+            widths, crops, output_names, item_settings = _image_outputs(media_item, file_path, options)
+            images.append((media_item, file_path, widths, crops))
 
-    with Image.open(image_file) as image:
-        _save_resized_image(image,
-                            image_file,
-                            max_size,
-                            tag)
+            file_names.update(output_names)
+            if manifest.is_up_to_date(output_dir, output_names, media_item['sha256'], item_settings):
+                continue
 
+            memory = 0
+            if media_item.get('width') and media_item.get('height'):
+                memory = _estimated_image_memory((int(media_item['width']), int(media_item['height'])),
+                                                 media_item['extension'], widths, crops)
+
+            # Processing finishes on other threads and frees memory, so waiting here cannot block forever
+            memory_wait_seconds += memory_budget.acquire(memory)
+            estimated_memory[file_path] = memory
+
+            future = processing_executor.submit(_process_image, file_path, options.image_formats, widths,
+                                                crops, item_settings['focus'])
+            future.add_done_callback(lambda _, memory=memory: memory_budget.release(memory))
+            processing[future] = media_item, file_path, item_settings
+
+        # Any error raised while processing an image is re-raised here
+        processing_cpu_seconds = {}
+        peak_rss = 0
+        for future in as_completed(processing):
+            media_item, file_path, item_settings = processing[future]
+            try:
+                result = future.result()
+
+            except Exception as error:
+                # The timings are lost with the worker's result, but the report still shows which item failed
+                report.add_task(media_item['file_id'], 'process', time.time(),
+                                wall_seconds=0.0,
+                                cpu_seconds=0.0,
+                                pid=0,
+                                tid=0,
+                                error=f'{type(error).__name__}: {error}')
+
+                if file_path not in videos or \
+                        not isinstance(error, (subprocess.CalledProcessError, RuntimeError, OSError)):
+                    raise
+
+                # A video that ffmpeg cannot read is shown without a poster, rather than failing the build
+                _log(f'{media_item["file_id"]}: could not process video: {error}')
+                file_names.difference_update(videos.pop(file_path)[1])
+                failed_videos.append(file_path)
+                continue
 
-def main():
+            processing_cpu_seconds[file_path] = result.cpu_seconds
+            peak_rss = max(peak_rss, result.peak_rss)
+            manifest.record(output_dir, result.outputs, media_item['sha256'], item_settings)
+            report.add_task(media_item['file_id'], 'process', result.start,
+                            wall_seconds=result.wall_seconds,
+                            cpu_seconds=result.cpu_seconds,
+                            pid=result.pid,
+                            tid=0,
+                            outputs=len(result.outputs),
+                            peak_rss_bytes=result.peak_rss,
+                            estimated_memory_bytes=estimated_memory.get(file_path, 0))
+            _log(f'{media_item["file_id"]}: processed')
+
+    # Each copy of the same content, beyond the first, would otherwise have been downloaded and processed again
+    duplicates = {
+        file_path: len(file_ids) - 1
+        for file_path, file_ids in copies.items()
+        if len(file_ids) > 1
+    }
+    report.summarise('memory', {
+        'budget_bytes': options.memory_budget,
+        'peak_estimated_bytes': memory_budget.peak,
+        'wait_seconds': round(memory_wait_seconds, 6),
+        'peak_worker_rss_bytes': peak_rss
+    })
+    report.summarise('deduplication', {
+        'items': sum(len(file_ids) for file_ids in copies.values()),
+        'blobs': len(copies),
+        'bytes_saved': sum(
+            sum(copies[file_path].values()) - max(copies[file_path].values())
+            for file_path in duplicates
+        ),
+        'cpu_seconds_saved': round(sum(
+            count * processing_cpu_seconds.get(file_path, 0.0)
+            for file_path, count in duplicates.items()
+        ), 6)
+    })
+
+    # The details of the derived files, and the blurred preview, of each item
+    details = {}
+    for media_item, file_path, widths, crops in images:
+        size = int(media_item.get('width') or 0), int(media_item.get('height') or 0)
+        details[file_path] = {
+            'formats': list(options.image_formats),
+            'srcset': _srcset(file_path, *size, options.image_formats, widths),
+            'crops': {
+                crop: dict(zip(['width', 'height'], _crop_size(size, IMAGE_CROPS[crop])))
+                for crop in crops
+            }
+        }, _derived_file_path(file_path, 'preview')
+
+    for file_path in videos:
+        details[file_path] = (_video_details(file_path, options.image_formats, options.video_renditions),
+                              _derived_file_path(file_path, 'preview', 'jpg'))
+
+    # Media data read from a previous run may refer to derived files that could not be made this time
+    for file_path in failed_videos:
+        for reference in references[file_path]:
+            for field in DERIVED_MEDIA_FIELDS:
+                reference.pop(field, None)
+
+    for file_path, (item_details, preview_file) in details.items():
+        if options.placeholders:
+            item_details.update(_image_placeholder(preview_file))
+
+        for reference in references[file_path]:
+            # Media data read from a previous run may refer to files, such as a rendition, that are no longer made
+            for field in DERIVED_MEDIA_FIELDS:
+                reference.pop(field, None)
+
+            reference.update(item_details)
+
+    return file_names
+
+
+def _prune_output_dir(output_dir: str,
+                      keep: set[str],
+                      dry_run: bool,
+                      item_ids: set[str] = frozenset()) -> dict[str, int]:
     """
-    Downloads the content from Google Drive
+    Deletes the files in the output directory that are not in use, such as the media of items that have been
+    removed from Google Drive and their derived files, or derived files that are no longer made
+
+    Only files named like those this script writes (PRUNED_FILE_NAME), after the hash of their content or the ID of
+    a known item, are deleted, so that other files in the output directory are never lost.
+    Hidden files (including partial downloads) are never deleted.
+
+    :param output_dir: the output directory
+    :param keep: the names of the files that are in use
+    :param dry_run: True if the files should only be found, not deleted
+    :param item_ids: the IDs of the items in Google Drive, now or in the previous run, after which files downloaded
+                     by earlier versions of this script are named
+
+    :return: the size in bytes of each file that was (or would be) deleted, keyed by name
     """
+    orphans = {}
+    for entry in os.scandir(output_dir):
+        if not entry.is_file(follow_symlinks=False) or entry.name in keep:
+            continue
 
-    args = _parse_command_line_arguments()
-    print('Authenticating with Google Drive')
-    print(args.credentials_file)
-    credentials = service_account.Credentials.from_service_account_file(
-        args.credentials_file)
+        match = PRUNED_FILE_NAME.fullmatch(entry.name)
+        if match is None or not (BLOB_NAME.fullmatch(match['name']) or match['name'] in item_ids):
+            continue
 
-    print('Searching Google Drive for content')
-    service = _drive_service(credentials)
-    items = _get_drive_items(service)
+        orphans[entry.name] = entry.stat().st_size
 
-    print('Creating output directory')
-    print(args.output_dir)
-    os.makedirs(args.output_dir, exist_ok=True)
+    if not dry_run:
+        for file_name in orphans:
+            os.remove(os.path.join(output_dir, file_name))
 
-    print('Downloading contact details')
-    contact_details = _get_contact_details(service, items)
-    _write_json_file(contact_details, args.output_dir, 'contact.json')
+    return orphans
 
-    print('Downloading content for home page')
-    home = _get_home_content(service, items)
-    _write_json_file(home, args.output_dir, 'home.json')
 
-    print('Downloading content for portfolio page')
-    portfolio = _get_portfolio_content(items)
-    _write_json_file(portfolio, args.output_dir, 'portfolio.json')
+def _get_media(home: dict,
+               portfolio: dict,
+               video: dict) -> list[dict]:
+    """
+    Gets the media data of every photo and video on the website
 
-    print('Downloading content for video page')
-    video = _get_video_content(items)
-    _write_json_file(video, args.output_dir, 'video.json')
+    :param home: the home page contents
+    :param portfolio: the portfolio page contents
+    :param video: the video page contents
 
-    print('Downloading media & creating previews')
+    :return: the media data
+    """
     media = []
     media += [
         media_item
@@ -879,21 +4241,404 @@ def main():
         for media_item in video['videos']
     ]
 
-    for media_item in media:
-        print(f"{media_item['file_id']}: {media_item['description']}")
-        print('- Downloading')
-        file_path = _download_media(service,
-                                    media_item['file_id'],
-                                    media_item['extension'],
-                                    int(media_item['size']),
-                                    media_item['sha256'],
-                                    args.output_dir)
-
-        if items[media_item['file_id']].item_type == DriveItemType.IMAGE:
-            print('- Resizing')
-            _generate_image_preview(file_path)
-            _generate_resised_image(file_path, MAX_MEDIUM_IMAGE_SIZE, 'medium')
-            _generate_resised_image(file_path, MAX_LARGE_IMAGE_SIZE, 'large')
+    return media
+
+
+def _planned_sheet_photos(tree: DriveTree,
+                          export_cache: ModifiedTimeCache,
+                          sheet_names: list[str],
+                          photo_names: list[str]) -> list[dict]:
+    """
+    Gets the media data of the photos named in the third column of a sheet, without exporting the sheet
+
+    :param tree: the index of all items
+    :param export_cache: the cache of exported documents
+    :param sheet_names: the names in the path to the sheet
+    :param photo_names: the names in the path to the directory containing the photos
+
+    :return: the media data of the photos named in the cached sheet,
+             or of every photo in the directory if the sheet is not cached
+    """
+    photos = _get_media_list(tree, photo_names, DriveItemType.IMAGE)
+
+    item_info = tree.items[_get_file_id(tree, sheet_names)]
+    csv_text = export_cache.get(f'{item_info.item_id}:text/csv', item_info.modified_time)
+    if csv_text is None:
+        return photos
+
+    photos_dict = {
+        photo_data['name']: photo_data
+        for photo_data in photos
+    }
+
+    return [
+        photos_dict[row[2]]
+        for row in csv.reader(csv_text.splitlines())
+    ]
+
+
+def _planned_focus_points(service: DriveService,
+                          tree: DriveTree,
+                          photos: list,
+                          comment_cache: ModifiedTimeCache) -> list[dict]:
+    """
+    Adds the focus points of the supplied photos from the cache of comments, for those whose comments have not
+    changed since they were cached
+
+    The focus points of the other photos are left as they are.
+
+    :param service: the drive service
+    :param tree: the index of all items
+    :param photos: the list of photo data
+    :param comment_cache: the cache of comments
+
+    :return: the photos whose comments would be requested
+    """
+    comments = []
+    photo_comments = []
+    for photo in photos:
+        item_info = tree.items[photo['file_id']]
+        cached = _get_valid_cached_comments(service, item_info, comment_cache)
+        if cached is None:
+            comments.append({
+                'file_id': item_info.item_id,
+                'name': item_info.name
+            })
+
+        photo_comments.append(cached)
+
+    _apply_focus_points(photos, photo_comments)
+
+    return comments
+
+
+def _plan_build(service: DriveService,
+                tree: DriveTree,
+                rebuild_content: bool,
+                output_dir: str,
+                export_cache: ModifiedTimeCache,
+                comment_cache: ModifiedTimeCache,
+                hash_cache: HashCache,
+                manifest: BuildManifest,
+                options: MediaOptions) -> dict:
+    """
+    Works out what a build would download, export, request and create, using only the listing and the caches
+
+    Media is not downloaded and no images are opened. The photos used by the quotes and name checks, and the
+    focus points of the photos on the home page, are taken from the caches. When they are not cached, every photo
+    in the directory is assumed to be used, with its focus point in the centre, so the plan may include more work
+    than the build does. The only requests made are to check that cached comments have not changed.
+
+    :param service: the drive service
+    :param tree: the index of all items
+    :param rebuild_content: True if the content would be rebuilt from Google Drive, rather than read from the
+                            content files of the previous run
+    :param output_dir: the output directory
+    :param export_cache: the cache of exported documents
+    :param comment_cache: the cache of comments
+    :param hash_cache: the cache of file hashes
+    :param manifest: the record of previously derived files
+    :param options: the options for the derived files
+
+    :return: the plan, which can be written as JSON
+    """
+    exports = []
+
+    if rebuild_content:
+        for names, mime_type in EXPORTED_DOCUMENTS:
+            item_info = tree.items[_get_file_id(tree, names)]
+            if export_cache.get(f'{item_info.item_id}:{mime_type}', item_info.modified_time) is None:
+                exports.append({
+                    'file_id': item_info.item_id,
+                    'name': '/'.join(names),
+                    'mime_type': mime_type
+                })
+
+        photos = _get_media_list(tree, ['home', 'images'], DriveItemType.IMAGE)
+        comments = _planned_focus_points(service, tree, photos, comment_cache)
+
+        home = {
+            'photos': photos,
+            'quotes': [
+                {'photo': photo}
+                for photo in _planned_sheet_photos(tree, export_cache,
+                                                   ['home', 'quotes'], ['home', 'profile_photos'])
+            ],
+            'name_checks': [
+                {'photo': photo}
+                for photo in _planned_sheet_photos(tree, export_cache,
+                                                   ['home', 'name_checks'], ['home', 'logos'])
+            ]
+        }
+        portfolio = _get_portfolio_content(tree)
+        video = _get_video_content(tree)
+
+    else:
+        home = _read_json_file(output_dir, 'home.json')
+        portfolio = _read_json_file(output_dir, 'portfolio.json')
+        video = _read_json_file(output_dir, 'video.json')
+
+        # As in a build, comments can change without any change to the items, so are still checked
+        comments = _planned_focus_points(service, tree, home['photos'], comment_cache)
+
+    # As in a build, each file is downloaded and processed once, however many items use it
+    references = {}
+    for media_item in _get_media(home, portfolio, video):
+        file_path = os.path.join(output_dir, f'{_blob_name(media_item)}.{media_item["extension"]}')
+        references.setdefault(file_path, []).append(media_item)
+
+    video_settings = _video_derivative_settings(options.image_formats, options.video_renditions)
+
+    downloads = []
+    derived_files = []
+    for file_path, media_items in references.items():
+        media_item = media_items[0]
+        file_size = int(media_item['size'])
+
+        # Files downloaded by earlier versions of this script, named after their item IDs, are reused
+        downloaded = any(
+            _check_file_exists(path, file_size, media_item['sha256'], hash_cache)
+            for path in [file_path] + [
+                os.path.join(output_dir, f'{item["file_id"]}.{item["extension"]}')
+                for item in media_items
+            ]
+        )
+        if not downloaded:
+            downloads.append({
+                'file_id': media_item['file_id'],
+                'name': media_item['name'],
+                'file': os.path.basename(file_path),
+                'bytes': file_size
+            })
+
+        item_type = tree.items[media_item['file_id']].item_type
+        if item_type == DriveItemType.VIDEO and options.ffmpeg is not None:
+            output_names = _video_derived_file_names(file_path, options.image_formats, options.video_renditions)
+            settings = video_settings
+        elif item_type == DriveItemType.IMAGE:
+            _, _, output_names, settings = _image_outputs(media_item, file_path, options)
+        else:
+            continue
+
+        if not manifest.is_up_to_date(output_dir, output_names, media_item['sha256'], settings):
+            derived_files.append({
+                'file_id': media_item['file_id'],
+                'name': media_item['name'],
+                'file': os.path.basename(file_path),
+                'outputs': output_names
+            })
+
+    return {
+        'content_changed': rebuild_content,
+        'up_to_date': not (rebuild_content or downloads or exports or comments or derived_files),
+        'download_bytes': sum(download['bytes'] for download in downloads),
+        'downloads': downloads,
+        'exports': exports,
+        'comments': comments,
+        'derived_files': derived_files
+    }
+
+
+def _print_plan(plan: dict):
+    """
+    Prints a summary of what a build would do
+
+    :param plan: the plan
+    """
+    print('Plan')
+    print(f'- content: {"changed" if plan["content_changed"] else "unchanged"}')
+    print(f'- downloads: {len(plan["downloads"])} files, {plan["download_bytes"] / 1e6:.1f} MB')
+    print(f'- exports: {len(plan["exports"])} documents')
+    print(f'- comments: {len(plan["comments"])} photos')
+    print(f'- derived files: {len(plan["derived_files"])} media items, '
+          f'{sum(len(item["outputs"]) for item in plan["derived_files"])} files')
+
+    if plan['up_to_date']:
+        print('Nothing to do')
+
+
+def main():
+    """
+    Downloads the content from Google Drive
+    """
+
+    args = _parse_command_line_arguments()
+
+    credentials = None
+    if args.api_endpoint is None:
+        print('Authenticating with Google Drive')
+        print(args.credentials_file)
+        credentials = service_account.Credentials.from_service_account_file(
+            args.credentials_file)
+
+    service = _drive_service(credentials, args.max_qps, args.api_endpoint, args.transport)
+    export_cache = ModifiedTimeCache(os.path.join(args.cache_dir, EXPORT_CACHE_FILE))
+    comment_cache = ModifiedTimeCache(os.path.join(args.cache_dir, COMMENT_CACHE_FILE))
+    hash_cache = HashCache(os.path.join(args.cache_dir, HASH_CACHE_FILE), args.verify)
+    manifest = BuildManifest(os.path.join(args.cache_dir, BUILD_MANIFEST_FILE), hash_cache)
+    report = BuildReport(service, {
+        'exports': export_cache,
+        'comments': comment_cache,
+        'hashes': hash_cache,
+        'resized_images': manifest
+    })
+
+    options = MediaOptions(
+        image_formats=_supported_image_formats(args.image_formats),
+        image_widths=args.image_widths,
+        image_crops=args.image_crops,
+        placeholders=args.placeholders,
+        ffmpeg=shutil.which(args.ffmpeg),
+        video_renditions=args.video_renditions,
+        memory_budget=args.memory_budget
+    )
+
+    for image_format in args.image_formats:
+        if image_format not in options.image_formats:
+            print(f'This version of Pillow cannot save {image_format} images. Skipping.')
+
+    if options.ffmpeg is None:
+        print(f'{args.ffmpeg} was not found. Skipping video posters and renditions.')
+
+    try:
+        previous_items = _previous_drive_items(args.cache_dir)
+
+        print('Searching Google Drive for content')
+        with report.stage('listing'):
+            items, changed, sync_state = _sync_drive_items(service, args.cache_dir, args.incremental)
+            tree = DriveTree(items)
+
+        content_exists = all(
+            os.path.isfile(os.path.join(args.output_dir, name))
+            for name in CONTENT_FILES
+        )
+
+        if args.plan_file is not None:
+            # A full listing always counts as a change, but a plan can tell if anything is actually different
+            changed = changed and previous_items != {
+                item_id: _drive_item_to_json(item_info)
+                for item_id, item_info in items.items()
+            }
+
+            plan = _plan_build(service, tree, changed or not content_exists, args.output_dir, export_cache,
+                               comment_cache, hash_cache, manifest, options)
+            _print_plan(plan)
+
+            with open(args.plan_file, 'w') as file:
+                json.dump(plan, file, indent=4)
+
+            return
+
+        print('Creating output directory')
+        print(args.output_dir)
+        os.makedirs(args.output_dir, exist_ok=True)
+
+        if not changed and content_exists:
+            print('Nothing has changed in Google Drive. Using existing content')
+            home = _read_json_file(args.output_dir, 'home.json')
+            portfolio = _read_json_file(args.output_dir, 'portfolio.json')
+            video = _read_json_file(args.output_dir, 'video.json')
+
+            # Adding or editing a comment is not a change to the item, so the focus points are still checked
+            print('Checking the focus points of the photos on the home page')
+            with report.stage('home'):
+                _add_focus_points(service, tree, home['photos'], comment_cache)
+                comment_cache.save()
+
+        else:
+            print('Downloading documents')
+            with report.stage('exports'):
+                _export_documents(service, tree, export_cache)
+                export_cache.save()
+
+            print('Downloading contact details')
+            with report.stage('contact'):
+                contact_details = _get_contact_details(service, tree, export_cache)
+                _write_json_file(contact_details, args.output_dir, 'contact.json')
+
+            print('Downloading content for home page')
+            with report.stage('home'):
+                home = _get_home_content(service, tree, export_cache, comment_cache)
+                comment_cache.save()
+
+            print('Downloading content for portfolio page')
+            with report.stage('portfolio'):
+                portfolio = _get_portfolio_content(tree)
+
+            print('Downloading content for video page')
+            with report.stage('video'):
+                video = _get_video_content(tree)
+
+        print('Downloading media & creating previews')
+        media = _get_media(home, portfolio, video)
+
+        with report.stage('media'):
+            try:
+                file_names = _download_and_process_media(service, tree, media, args.output_dir, hash_cache, manifest,
+                                                         args.jobs, args.workers, args.chunk_size, options, report)
+            finally:
+                manifest.save()
+                hash_cache.save()
+
+        # Written once the media has been processed, as details of the resized images are added to the media data
+        _write_json_file(home, args.output_dir, 'home.json')
+        _write_json_file(portfolio, args.output_dir, 'portfolio.json')
+        _write_json_file(video, args.output_dir, 'video.json')
+
+        # Only stored once the content is written, as the next run would otherwise find no changes and keep stale content
+        _save_sync_state(args.cache_dir, sync_state)
+
+        if args.prune or args.prune_dry_run:
+            print('Finding files that are no longer in use')
+            with report.stage('prune'):
+                orphans = _prune_output_dir(args.output_dir, file_names, args.prune_dry_run,
+                                            set(items) | set(previous_items))
+                report.summarise('prune', {
+                    'files': len(orphans),
+                    'bytes': sum(orphans.values()),
+                    'dry_run': args.prune_dry_run
+                })
+
+                if not args.prune_dry_run:
+                    manifest.forget(list(orphans))
+                    manifest.save()
+                    hash_cache.save()
+
+            if args.prune_dry_run:
+                for file_name in sorted(orphans):
+                    print(f'- {file_name} ({orphans[file_name] / 1e6:.1f} MB)')
+
+            print(f'{"Would remove" if args.prune_dry_run else "Removed"} {len(orphans)} unused files, '
+                  f'{sum(orphans.values()) / 1e6:.1f} MB')
+
+        print('Requests to Google Drive')
+        for endpoint, statistics in sorted(service.statistics().items()):
+            print(f'- {endpoint}: {statistics.calls} requests, {statistics.retries} retries, '
+                  f'{statistics.throttled_seconds:.1f}s throttled')
+
+        deduplication = report.summary('deduplication')
+        if deduplication is not None and deduplication['items'] > deduplication['blobs']:
+            print(f'Stored {deduplication["items"]} media items in {deduplication["blobs"]} files, saving '
+                  f'{deduplication["bytes_saved"] / 1e6:.1f} MB and {deduplication["cpu_seconds_saved"]:.1f}s CPU')
+
+        memory = report.summary('memory')
+        if memory is not None and memory['peak_worker_rss_bytes']:
+            print(f'Processing used up to {memory["peak_worker_rss_bytes"] / 1e6:.0f} MB per worker, and an estimated '
+                  f'{memory["peak_estimated_bytes"] / 1e6:.0f} MB of the {memory["budget_bytes"] / 1e6:.0f} MB budget '
+                  f'at once (waited {memory["wait_seconds"]:.1f}s)')
+
+        print('Stages')
+        for stage in report.stages():
+            print(f'- {stage["name"]}: {stage["wall_seconds"]:.1f}s, {stage["cpu_seconds"]:.1f}s CPU, '
+                  f'{stage["requests"]} requests, {stage["received_bytes"] / 1e6:.1f} MB')
+
+    finally:
+        # Also written if the build fails, which is when it is most needed. A plan builds nothing, so has no report.
+        if args.plan_file is None:
+            os.makedirs(args.output_dir, exist_ok=True)
+            report.write(os.path.join(args.output_dir, BUILD_REPORT_FILE), args.trace_file)
+
+        service.close()
 
 
 if __name__ == '__main__':
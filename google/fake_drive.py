@@ -0,0 +1,641 @@
+import os
+import re
+import json
+import random
+import shutil
+import hashlib
+import datetime
+import threading
+import subprocess
+
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+from PIL import Image
+
+from download_content import PARENT_DIRECTORY_ID
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+"""
+The MIME type of a directory in Google Drive
+"""
+
+DOCUMENT_EXTENSIONS = {
+    '.txt': 'application/vnd.google-apps.document',
+    '.csv': 'application/vnd.google-apps.spreadsheet',
+}
+"""
+The extensions of local files that stand in for Google documents and sheets, with the MIME type of each
+"""
+
+MEDIA_MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.png': 'image/png',
+    '.mp4': 'video/mp4',
+}
+"""
+The extensions of local media files, with the MIME type of each
+"""
+
+COMMENTS_SUFFIX = '.comments.json'
+"""
+The suffix of a file containing the comments on the file with the same name
+"""
+
+VIDEO_SIZE = (640, 360)
+"""
+The width and height of the generated videos, which are small so that they are quick to encode
+"""
+
+VIDEO_SECONDS = 10
+"""
+The length of the generated videos
+"""
+
+
+@dataclass
+class FakeItem:
+    """
+    An item served by the fake Google Drive
+    """
+
+    path: str
+    """
+    The path to the local file or directory
+    """
+
+    resource: dict
+    """
+    The item in the form returned by the Google Drive API
+    """
+
+
+class FakeDrive:
+    """
+    A local directory tree presented as the Google Drive content of the website
+
+    Directories become folders, .txt and .csv files become documents and sheets (named without the extension),
+    and images and videos keep their names. A file named "<name>.comments.json" holds the comments on "<name>".
+
+    Changes made to the local directory tree are found by rescan, which compares the modification times of the
+    files with those from the previous scan. As IDs are derived from paths, a moved file is a new item.
+    """
+
+    def __init__(self,
+                 root_dir: str,
+                 root_id: str = PARENT_DIRECTORY_ID):
+        """
+        :param root_dir: the local directory that stands in for the top-level directory in Google Drive
+        :param root_id: the ID given to the top-level directory
+        """
+        self.root_dir = root_dir
+        self.root_id = root_id
+        self.items: dict[str, FakeItem] = {}
+        self.children: dict[str, list[str]] = {}
+        self.changes: list[dict] = []
+        self._lock = threading.Lock()
+
+        self._add_directory(root_dir, root_id, self.items, self.children, {})
+
+    def rescan(self):
+        """
+        Reads the local directory tree again, and adds a change (in the form returned by the Google Drive API)
+        to `changes` for each item that has been added, modified or removed since the previous scan
+        """
+        with self._lock:
+            items, children = {}, {}
+            self._add_directory(self.root_dir, self.root_id, items, children, self.items)
+
+            self.changes += [
+                {'fileId': item_id, 'removed': False, 'file': item.resource}
+                for item_id, item in items.items()
+                if item_id not in self.items or self.items[item_id].resource != item.resource
+            ]
+            self.changes += [
+                {'fileId': item_id, 'removed': True}
+                for item_id in self.items
+                if item_id not in items
+            ]
+
+            self.items, self.children = items, children
+
+    @staticmethod
+    def _item_id(path: str) -> str:
+        """
+        Gets a stable ID for a local path
+        """
+        return hashlib.sha1(path.encode()).hexdigest()[:33]
+
+    def _add_directory(self,
+                       directory: str,
+                       directory_id: str,
+                       items: dict[str, FakeItem],
+                       children: dict[str, list[str]],
+                       previous: dict[str, FakeItem]):
+        """
+        Adds the contents of a local directory, recursively
+
+        :param directory: the local directory
+        :param directory_id: the ID of the directory
+        :param items: the items, to which those in the directory are added
+        :param children: the IDs of the items in each directory, to which those in the directory are added
+        :param previous: the items from the previous scan, which are reused if they have not been modified
+        """
+        directory_children = []
+        for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+            if entry.name.endswith(COMMENTS_SUFFIX):
+                continue
+
+            item_id = self._item_id(entry.path)
+            name, extension = os.path.splitext(entry.name)
+            stat = entry.stat()
+            resource = {
+                'id': item_id,
+                'parents': [directory_id],
+                'modifiedTime': datetime.datetime.fromtimestamp(stat.st_mtime, datetime.timezone.utc).isoformat()
+            }
+
+            # Media files are only hashed again if they have been modified
+            if item_id in previous and previous[item_id].resource['modifiedTime'] == resource['modifiedTime']:
+                resource = previous[item_id].resource
+
+            elif entry.is_dir():
+                resource.update(name=entry.name, mimeType=FOLDER_MIME_TYPE)
+
+            elif extension in DOCUMENT_EXTENSIONS:
+                resource.update(name=name, mimeType=DOCUMENT_EXTENSIONS[extension])
+
+            elif extension in MEDIA_MIME_TYPES:
+                with open(entry.path, 'rb') as file:
+                    sha256 = hashlib.file_digest(file, 'sha256').hexdigest()
+
+                resource.update(name=entry.name,
+                                mimeType=MEDIA_MIME_TYPES[extension],
+                                fileExtension=extension[1:],
+                                size=str(stat.st_size),
+                                sha256Checksum=sha256)
+
+                if resource['mimeType'].startswith('image/'):
+                    with Image.open(entry.path) as image:
+                        resource['imageMediaMetadata'] = {'width': image.width, 'height': image.height}
+                else:
+                    resource['videoMediaMetadata'] = {'width': VIDEO_SIZE[0], 'height': VIDEO_SIZE[1],
+                                                      'durationMillis': str(VIDEO_SECONDS * 1000)}
+
+            else:
+                continue
+
+            items[item_id] = FakeItem(path=entry.path, resource=resource)
+            directory_children.append(item_id)
+
+            if entry.is_dir():
+                self._add_directory(entry.path, item_id, items, children, previous)
+
+        children[directory_id] = directory_children
+
+    def comments(self, item_id: str) -> list[dict]:
+        """
+        Gets the comments on an item
+
+        Comments without a modification time were last modified when the file containing them was.
+        As in Google Drive, changing the comments does not change the modification time of the item.
+
+        :param item_id: the item ID
+
+        :return: the comments, in the form returned by the Google Drive API
+        """
+        comments_path = self.items[item_id].path + COMMENTS_SUFFIX
+        if not os.path.isfile(comments_path):
+            return []
+
+        modified_time = datetime.datetime.fromtimestamp(os.path.getmtime(comments_path), datetime.timezone.utc)
+        with open(comments_path, 'r') as file:
+            return [
+                {'modifiedTime': modified_time.isoformat(), 'deleted': False, **comment}
+                for comment in json.load(file)
+            ]
+
+
+class _FakeDriveRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles requests to the subset of the Google Drive API used by download_content.py
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    server: 'FakeDriveServer'
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.count_connection()
+        if self.server.connection_latency:
+            self.server.sleep(self.server.connection_latency)
+
+    def _send(self,
+              status: int,
+              body: bytes,
+              content_type: str = 'application/json',
+              headers: dict | None = None):
+        headers = {'Content-Length': str(len(body)), **(headers or {})}
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, content: object):
+        self._send(200, json.dumps(content).encode())
+
+    def _send_error(self, status: int, message: str):
+        self._send(status, json.dumps({'error': {'code': status, 'message': message, 'errors': []}}).encode())
+
+    @staticmethod
+    def _page(items: list, query: dict, key: str) -> dict:
+        """
+        Gets a page of results, using the offset of the page as the page token
+        """
+        offset = int(query.get('pageToken', ['0'])[0])
+        page_size = int(query.get('pageSize', ['100'])[0])
+        result = {key: items[offset:offset + page_size]}
+        if offset + page_size < len(items):
+            result['nextPageToken'] = str(offset + page_size)
+
+        return result
+
+    def do_GET(self):
+        drive = self.server.drive
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        path = unquote(url.path).removeprefix('/drive/v3')
+
+        self.server.count(path)
+        if self.server.latency:
+            self.server.sleep(self.server.latency)
+
+        if self.server.should_fail():
+            self._send_error(503, 'Injected error')
+            return
+
+        if path == '/files':
+            parent_id = re.match(r"'([^']+)' in parents", query['q'][0]).group(1)
+            files = [drive.items[item_id].resource for item_id in drive.children.get(parent_id, [])]
+            self._send_json(self._page(files, query, 'files'))
+
+        # Page tokens are offsets into the changes found since the server started
+        elif path == '/changes/startPageToken':
+            drive.rescan()
+            self._send_json({'startPageToken': str(len(drive.changes))})
+
+        elif path == '/changes':
+            drive.rescan()
+            result = self._page(drive.changes, query, 'changes')
+            if 'nextPageToken' not in result:
+                result['newStartPageToken'] = str(len(drive.changes))
+
+            self._send_json(result)
+
+        elif match := re.fullmatch(r'/files/([^/]+)/export', path):
+            with open(drive.items[match.group(1)].path, 'rb') as file:
+                self._send(200, file.read(), query['mimeType'][0])
+
+        elif match := re.fullmatch(r'/files/([^/]+)/comments', path):
+            comments = drive.comments(match.group(1))
+            if query.get('includeDeleted') != ['true']:
+                comments = [comment for comment in comments if not comment['deleted']]
+
+            if 'startModifiedTime' in query:
+                start = datetime.datetime.fromisoformat(query['startModifiedTime'][0])
+                comments = [
+                    comment
+                    for comment in comments
+                    if datetime.datetime.fromisoformat(comment['modifiedTime']) >= start
+                ]
+
+            self._send_json(self._page(comments, query, 'comments'))
+
+        elif (match := re.fullmatch(r'/files/([^/]+)', path)) and query.get('alt') == ['media']:
+            self._send_media(drive.items[match.group(1)].path)
+
+        else:
+            self._send_error(404, f'Not found: {path}')
+
+    def _send_media(self, file_path: str):
+        """
+        Sends the contents of a file, or the part of it in the Range header
+        """
+        size = os.path.getsize(file_path)
+        start, end = 0, size - 1
+        status = 200
+
+        if match := re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', '')):
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else end, end)
+            status = 206
+
+        with open(file_path, 'rb') as file:
+            file.seek(start)
+            body = file.read(end - start + 1)
+
+        headers = {'Content-Range': f'bytes {start}-{end}/{size}'} if status == 206 else None
+        drop_after = self.server.drop_after
+        if drop_after is None or end < drop_after:
+            self._send(status, body, 'application/octet-stream', headers)
+            return
+
+        # The headers promise the whole body, but the connection is closed once the file reaches drop_after bytes
+        self._send(status, body[:max(0, drop_after - start)], 'application/octet-stream',
+                   {**(headers or {}), 'Content-Length': str(len(body))})
+        self.close_connection = True
+
+
+class FakeDriveServer(ThreadingHTTPServer):
+    """
+    A local HTTP server that stands in for the Google Drive API
+
+    Pass `url` as the API endpoint of download_content.DriveService (or --api-endpoint) to use it.
+    """
+
+    daemon_threads = True
+
+    def __init__(self,
+                 drive: FakeDrive,
+                 latency: float = 0.0,
+                 error_rate: float = 0.0,
+                 seed: int = 0,
+                 connection_latency: float = 0.0,
+                 drop_after: int | None = None):
+        """
+        :param drive: the content to serve
+        :param latency: a delay added to every request (in seconds)
+        :param error_rate: the fraction of requests that fail with a 503 error
+        :param seed: the random seed used to choose which requests fail
+        :param connection_latency: a delay added to every new connection (in seconds), to mimic the TCP and TLS
+                                   handshakes with Google
+        :param drop_after: if set, the connection is dropped part way through any download of media that goes
+                           past this many bytes into the file, to mimic an unreliable network
+        """
+        super().__init__(('127.0.0.1', 0), _FakeDriveRequestHandler)
+        self.drive = drive
+        self.latency = latency
+        self.error_rate = error_rate
+        self.connection_latency = connection_latency
+        self.drop_after = drop_after
+        self.requests: dict[str, int] = {}
+        self.connections = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        """
+        The URL of the API
+        """
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/drive/v3'
+
+    def count(self, path: str):
+        """
+        Counts a request, grouping the paths of requests for individual files together
+        """
+        endpoint = re.sub(r'/files/[^/]+', '/files/{id}', path)
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def count_connection(self):
+        """
+        Counts a new connection
+        """
+        with self._lock:
+            self.connections += 1
+
+    def should_fail(self) -> bool:
+        """
+        Decides if the current request should fail
+        """
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    @staticmethod
+    def sleep(seconds: float):
+        threading.Event().wait(seconds)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+_noise_images: dict[tuple[int, int], Image.Image] = {}
+
+
+def write_image(file_path: str,
+                megapixels: float,
+                rng: random.Random):
+    """
+    Writes a synthetic photo-like JPEG
+
+    :param file_path: the output path
+    :param megapixels: the size of the image in millions of pixels
+    :param rng: the random number generator
+    """
+    width = int((megapixels * 1e6 * 3 / 2) ** 0.5)
+    height = int(width * 2 / 3)
+    if rng.random() < 0.3:
+        width, height = height, width
+
+    # Noise is slow to generate, so a slightly larger noise image is made once and a random part of it used
+    size = max(width, height) + 64
+    if (size, size) not in _noise_images:
+        _noise_images[(size, size)] = Image.effect_noise((size, size), 48)
+    noise = _noise_images[(size, size)]
+    x, y = rng.randrange(size - width), rng.randrange(size - height)
+
+    image = Image.merge('RGB', [
+        Image.linear_gradient('L').rotate(rng.randrange(360)).resize((width, height)),
+        Image.radial_gradient('L').resize((width, height)),
+        noise.crop((x, y, x + width, y + height)),
+    ])
+    image.save(file_path, quality=85)
+
+
+def write_video(file_path: str,
+                size: int,
+                ffmpeg: str,
+                rng: random.Random):
+    """
+    Writes a synthetic video, with noise over a test pattern so that it is close to the supplied size
+
+    :param file_path: the output path
+    :param size: the approximate size of the video in bytes
+    :param ffmpeg: the ffmpeg executable
+    :param rng: the random number generator
+    """
+    bitrate = str(size * 8 // VIDEO_SECONDS)
+    subprocess.run([ffmpeg, '-v', 'error', '-y',
+                    '-f', 'lavfi', '-i', f'testsrc2=size={VIDEO_SIZE[0]}x{VIDEO_SIZE[1]}:duration={VIDEO_SECONDS}',
+                    '-vf', f'noise=alls=60:allf=t:all_seed={rng.randrange(2 ** 31)}',
+                    '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
+                    '-b:v', bitrate, '-maxrate', bitrate, '-bufsize', bitrate,
+                    file_path],
+                   check=True)
+
+
+def generate_content(root_dir: str,
+                     item_count: int,
+                     image_megapixels: float = 1.0,
+                     video_size: int = 4 * 1024 * 1024,
+                     seed: int = 0,
+                     ffmpeg: str = 'ffmpeg'):
+    """
+    Generates a local directory tree laid out like the website content in Google Drive
+
+    Videos are only playable if ffmpeg is found. Otherwise they are random bytes, which are downloaded like any
+    other video, but that the build cannot make posters from, so logs and skips.
+
+    :param root_dir: the directory in which to write the content
+    :param item_count: the approximate number of items to generate
+    :param image_megapixels: the size of each image in millions of pixels
+    :param video_size: the approximate size of each video in bytes
+    :param seed: the random seed
+    :param ffmpeg: the ffmpeg executable, used to encode the videos
+    """
+
+    rng = random.Random(seed)
+
+    def directory(*names: str) -> str:
+        path = os.path.join(root_dir, *names)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def write_text(path: str, text: str):
+        with open(path, 'w') as file:
+            file.write(text)
+
+    # Fixed content
+    write_text(os.path.join(directory(), 'contact.csv'), 'email,hello@example.com\ninstagram,example\n')
+    write_text(os.path.join(directory('home'), 'bio.txt'), 'A short biography.\n')
+    write_text(os.path.join(directory('home'), 'introduction.txt'), 'An introduction.\n')
+
+    home_images = max(1, item_count // 50)
+    profile_photos = max(1, item_count // 200)
+    logos = max(1, item_count // 200)
+    videos = max(1, item_count // 100)
+    albums = max(1, item_count // 50)
+    portfolio_images = max(1, item_count - home_images - profile_photos - logos - videos - albums - 12)
+
+    for index in range(profile_photos):
+        write_image(os.path.join(directory('home', 'profile_photos'), f'profile {index}.jpg'),
+                     image_megapixels / 4, rng)
+
+    write_text(os.path.join(directory('home'), 'quotes.csv'), ''.join(
+        f'"Quote {index}",Person {index},profile {index}.jpg,https://example.com/{index}\n'
+        for index in range(profile_photos)
+    ))
+
+    for index in range(logos):
+        write_image(os.path.join(directory('home', 'logos'), f'logo {index}.jpg'),
+                     image_megapixels / 8, rng)
+
+    write_text(os.path.join(directory('home'), 'name_checks.csv'), ''.join(
+        f'Client {index},https://example.com/{index},logo {index}.jpg\n'
+        for index in range(logos)
+    ))
+
+    for index in range(home_images):
+        image_path = os.path.join(directory('home', 'images'), f'home {index}.jpg')
+        write_image(image_path, image_megapixels, rng)
+
+        if rng.random() < 0.5:
+            x, y = rng.random() * 0.8, rng.random() * 0.8
+            anchor = json.dumps([None, [None, [x, y, x + 0.1, y + 0.1]], None, 'anchor'])
+            write_text(image_path + COMMENTS_SUFFIX,
+                       json.dumps([{'id': f'comment{index}', 'content': 'focus', 'anchor': anchor}]))
+
+    for index in range(portfolio_images):
+        album = directory('portfolio', f'album {index % albums}')
+        write_image(os.path.join(album, f'photo {index}.jpg'), image_megapixels, rng)
+
+    ffmpeg = shutil.which(ffmpeg)
+    for index in range(videos):
+        video_path = os.path.join(directory('video'), f'video {index}.mp4')
+        if ffmpeg is not None:
+            write_video(video_path, video_size, ffmpeg, rng)
+            continue
+
+        with open(video_path, 'wb') as file:
+            file.write(rng.randbytes(video_size))
+
+
+def main():
+    """
+    Generates content and serves it as a stand-in for the Google Drive API until interrupted
+    """
+
+    parser = ArgumentParser('fake_drive.py',
+                            description='Serves a local directory as a stand-in for the Google Drive API')
+
+    parser.add_argument('content_dir',
+                        help='The directory containing the content (generated if it does not exist)')
+
+    parser.add_argument('--items',
+                        help='The number of items to generate',
+                        type=int,
+                        default=100)
+
+    parser.add_argument('--latency',
+                        help='A delay added to every request (in seconds)',
+                        type=float,
+                        default=0.0)
+
+    parser.add_argument('--error-rate',
+                        help='The fraction of requests that fail with a 503 error',
+                        type=float,
+                        default=0.0)
+
+    parser.add_argument('--connection-latency',
+                        help='A delay added to every new connection (in seconds)',
+                        type=float,
+                        default=0.0)
+
+    parser.add_argument('--drop-after',
+                        help='Drop the connection part way through any download of media that goes past this many '
+                             'bytes into the file',
+                        type=int,
+                        default=None)
+
+    parser.add_argument('--ffmpeg',
+                        help='The ffmpeg executable, used to encode the generated videos. Without it, the videos '
+                             'are random bytes.',
+                        default='ffmpeg')
+
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.content_dir):
+        print(f'Generating {args.items} items in {args.content_dir}')
+        if shutil.which(args.ffmpeg) is None:
+            print(f'{args.ffmpeg} was not found. The videos will be random bytes, which cannot be played.')
+
+        generate_content(args.content_dir, args.items, ffmpeg=args.ffmpeg)
+
+    with FakeDriveServer(FakeDrive(args.content_dir), args.latency, args.error_rate,
+                         connection_latency=args.connection_latency, drop_after=args.drop_after) as server:
+        print(f'Serving on {server.url}')
+        print(f'python download_content.py --api-endpoint {server.url} --output-dir ./content')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
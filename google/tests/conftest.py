@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# The scripts are run from the google/ directory, rather than installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_drive
+
+
+@pytest.fixture(scope='session')
+def drive_content(tmp_path_factory) -> str:
+    """
+    A small tree of generated content, for a fake_drive.FakeDriveServer to serve
+
+    The videos are random bytes, so that ffmpeg is not needed to generate them.
+    """
+    content_dir = str(tmp_path_factory.mktemp('drive'))
+    fake_drive.generate_content(content_dir, 20, image_megapixels=0.05, video_size=64 * 1024,
+                                ffmpeg='no-such-ffmpeg')
+    return content_dir
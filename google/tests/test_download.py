@@ -0,0 +1,287 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import http.client
+
+import pytest
+
+import download_content
+from download_content import DriveItemType, DriveTree, HashCache, ModifiedTimeCache, RateLimiter
+import fake_drive
+from fake_drive import FakeDrive, FakeDriveServer
+
+
+def _video(drive: FakeDrive) -> dict:
+    return next(
+        item.resource
+        for item in drive.items.values()
+        if item.resource['mimeType'].startswith('video/')
+    )
+
+
+def test_interrupted_download_resumes_from_part_file(monkeypatch, tmp_path, drive_content):
+    drive = FakeDrive(drive_content)
+    video = _video(drive)
+    size = int(video['size'])
+    chunk_size = size // 4
+    hash_cache = HashCache(str(tmp_path / 'hash_cache.json'))
+
+    # Fail on the first dropped connection, rather than retrying it
+    monkeypatch.setattr(download_content, 'MAX_RETRIES', 0)
+
+    def download(server: FakeDriveServer) -> tuple[str, int]:
+        service = download_content._drive_service(None, api_endpoint=server.url)
+        return download_content._download_media(service, video['id'], video['fileExtension'], size,
+                                                video['sha256Checksum'], str(tmp_path), hash_cache, chunk_size)
+
+    # The connection drops during the third chunk, so two chunks are kept
+    with FakeDriveServer(drive, drop_after=chunk_size * 2 + 100) as server:
+        with pytest.raises(http.client.IncompleteRead):
+            download(server)
+
+    part_file = tmp_path / f'.{video["id"]}.mp4.part'
+    assert part_file.stat().st_size == chunk_size * 2
+
+    with FakeDriveServer(drive) as server:
+        file_path, received_bytes = download(server)
+
+    assert received_bytes == size - chunk_size * 2
+    assert not part_file.exists()
+    with open(file_path, 'rb') as file:
+        assert hashlib.sha256(file.read()).hexdigest() == video['sha256Checksum']
+
+
+@pytest.mark.parametrize('corruption', ['truncated', 'changed'])
+def test_download_that_does_not_match_is_discarded(tmp_path, drive_content, corruption):
+    content_dir = tmp_path / 'drive'
+    shutil.copytree(drive_content, content_dir)
+    output_dir = tmp_path / 'content'
+    output_dir.mkdir()
+
+    drive = FakeDrive(str(content_dir))
+    video = _video(drive)
+    size = int(video['size'])
+
+    # The served file no longer matches the size and hash listed for it
+    with open(drive.items[video['id']].path, 'r+b') as file:
+        if corruption == 'truncated':
+            file.truncate(size // 2)
+        else:
+            file.write(b'\0' * 1024)
+
+    file_path = output_dir / f'{video["id"]}.mp4'
+    file_path.write_bytes(b'previous version')
+
+    with FakeDriveServer(drive) as server:
+        service = download_content._drive_service(None, api_endpoint=server.url)
+        with pytest.raises(RuntimeError):
+            download_content._download_media(service, video['id'], video['fileExtension'], size,
+                                             video['sha256Checksum'], str(output_dir),
+                                             HashCache(str(tmp_path / 'hash_cache.json')), size // 4)
+
+    assert file_path.read_bytes() == b'previous version'
+    assert sorted(path.name for path in output_dir.iterdir()) == [file_path.name]
+
+
+def test_report_counts_the_requests_of_each_download(monkeypatch, tmp_path, drive_content):
+    drive = FakeDrive(drive_content)
+    video = _video(drive)
+    size = int(video['size'])
+    monkeypatch.setattr(download_content, 'RETRY_BASE_DELAY', 0.001)
+
+    with FakeDriveServer(drive, error_rate=0.3, seed=1) as server:
+        service = download_content._drive_service(None, api_endpoint=server.url)
+        report = download_content.BuildReport(service, {})
+
+        with report.task(video['id'], 'download'):
+            download_content._download_media(service, video['id'], video['fileExtension'], size,
+                                             video['sha256Checksum'], str(tmp_path),
+                                             HashCache(str(tmp_path / 'hash_cache.json')), size // 4)
+
+        # A task that fails is still recorded
+        with pytest.raises(RuntimeError):
+            with report.task('failed', 'download'):
+                raise RuntimeError('No such file')
+
+    report.write(str(tmp_path / 'report.json'))
+    media = {
+        media_item['file_id']: media_item
+        for media_item in json.loads((tmp_path / 'report.json').read_text())['media']
+    }
+
+    # Each range is requested once, plus any retries
+    statistics = service.statistics()['drive.files.get_media']
+    download = media[video['id']]['download']
+    assert statistics.retries > 0
+    assert (download['requests'], download['retries']) == (statistics.calls, statistics.retries)
+    assert download['requests'] - download['retries'] == 4
+
+    assert media['failed']['download']['error'] == 'RuntimeError: No such file'
+    assert media['failed']['download']['requests'] == 0
+
+
+def test_failed_requests_are_retried(monkeypatch, drive_content):
+    drive = FakeDrive(drive_content)
+    monkeypatch.setattr(download_content, 'RETRY_BASE_DELAY', 0.001)
+
+    with FakeDriveServer(drive) as server:
+        expected = download_content._get_drive_items(download_content._drive_service(None, api_endpoint=server.url))
+
+    with FakeDriveServer(drive, error_rate=0.3, seed=1) as server:
+        service = download_content._drive_service(None, api_endpoint=server.url)
+        items = download_content._get_drive_items(service)
+
+    statistics = service.statistics()['drive.files.list']
+    assert items == expected
+    assert statistics.retries > 0
+    assert statistics.calls == server.requests['/files']
+
+
+def test_rate_limiter_throttles_requests_beyond_the_burst():
+    rate_limiter = RateLimiter(100, burst=1)
+
+    start = time.monotonic()
+    throttled_seconds = sum(rate_limiter.acquire() for _ in range(11))
+
+    assert throttled_seconds == pytest.approx(0.1, abs=0.02)
+    assert time.monotonic() - start >= 0.09
+
+
+@pytest.mark.parametrize('max_qps', ['0', '-1'])
+def test_max_qps_must_be_positive(monkeypatch, max_qps):
+    monkeypatch.setattr(sys, 'argv', ['download_content.py', '--max-qps', max_qps])
+
+    with pytest.raises(SystemExit):
+        download_content._parse_command_line_arguments()
+
+
+def test_cached_hashes_survive_a_restore_and_verify_hashes_again(monkeypatch, tmp_path):
+    file_path = tmp_path / 'media.jpg'
+    file_path.write_bytes(b'media')
+    cache_file = str(tmp_path / 'hash_cache.json')
+
+    hashed = []
+    hash_file = download_content._hash_file
+    monkeypatch.setattr(download_content, '_hash_file', lambda path: (hashed.append(path), hash_file(path))[1])
+
+    hash_cache = HashCache(cache_file)
+    sha256 = hash_cache.hash(str(file_path))
+    hash_cache.save()
+
+    # Restoring a cache (e.g. on a new CI runner) writes a new file, with a new inode, but keeps the modification time
+    restored_path = tmp_path / 'restored.jpg'
+    shutil.copy2(file_path, restored_path)
+    os.replace(restored_path, file_path)
+
+    hash_cache = HashCache(cache_file)
+    assert hash_cache.hash(str(file_path)) == sha256
+    assert (hash_cache.hits, hash_cache.misses) == (1, 0)
+    assert hashed == [str(file_path)]
+
+    hash_cache = HashCache(cache_file, verify=True)
+    assert hash_cache.hash(str(file_path)) == sha256
+    assert (hash_cache.hits, hash_cache.misses) == (0, 1)
+    assert hashed == [str(file_path)] * 2
+
+
+def _write_focus_comment(photo_path: str, x: float, y: float, modified: float):
+    """
+    Writes a "focus" comment on a photo served by a FakeDrive, last modified at the supplied time
+    """
+    anchor = json.dumps([None, [None, [x, y, x, y]], None, 'anchor'])
+    with open(photo_path + fake_drive.COMMENTS_SUFFIX, 'w') as file:
+        json.dump([{'id': 'focus', 'content': 'focus', 'anchor': anchor}], file)
+
+    os.utime(photo_path + fake_drive.COMMENTS_SUFFIX, (modified, modified))
+
+
+def test_comments_are_fetched_again_only_once_they_change(tmp_path, drive_content):
+    content_dir = tmp_path / 'drive'
+    shutil.copytree(drive_content, content_dir)
+    cache_file = str(tmp_path / 'comment_cache.json')
+
+    photo_paths = sorted(str(path) for path in (content_dir / 'home' / 'images').glob('*.jpg'))
+    for photo_path in photo_paths:
+        _write_focus_comment(photo_path, 0.25, 0.25, 1_700_000_000)
+
+    # A photo without comments
+    shutil.copy(photo_paths[0], content_dir / 'home' / 'images' / 'home without comments.jpg')
+    photo_paths.append(str(content_dir / 'home' / 'images' / 'home without comments.jpg'))
+
+    drive = FakeDrive(str(content_dir))
+
+    def add_focus_points() -> tuple[list[dict], ModifiedTimeCache, dict[str, int]]:
+        with FakeDriveServer(drive) as server:
+            service = download_content._drive_service(None, api_endpoint=server.url)
+            tree = DriveTree(download_content._get_drive_items(service))
+            photos = download_content._get_media_list(tree, ['home', 'images'], DriveItemType.IMAGE)
+
+            comment_cache = ModifiedTimeCache(cache_file)
+            download_content._add_focus_points(service, tree, photos, comment_cache)
+            comment_cache.save()
+
+        return photos, comment_cache, server.requests
+
+    photos, comment_cache, _ = add_focus_points()
+    assert [photo.get('focus') for photo in photos] == [[0.25, 0.25]] * (len(photo_paths) - 1) + [None]
+    assert comment_cache.misses == len(photo_paths)
+
+    # Each photo's comments, or lack of them, are checked with one request, and nothing has changed
+    photos, comment_cache, requests = add_focus_points()
+    assert [photo.get('focus') for photo in photos] == [[0.25, 0.25]] * (len(photo_paths) - 1) + [None]
+    assert (comment_cache.hits, comment_cache.misses) == (len(photo_paths), 0)
+    assert requests['/files/{id}/comments'] == len(photo_paths)
+
+    # Editing a comment does not change the photo's modification time, but its comments are fetched again
+    _write_focus_comment(photo_paths[0], 0.75, 0.75, 1_700_000_100)
+
+    photos, comment_cache, _ = add_focus_points()
+    assert photos[0]['focus'] == [0.75, 0.75]
+    assert (comment_cache.hits, comment_cache.misses) == (len(photo_paths) - 1, 1)
+
+
+def test_documents_are_exported_again_only_once_they_change(tmp_path, drive_content):
+    content_dir = tmp_path / 'drive'
+    shutil.copytree(drive_content, content_dir)
+    cache_file = str(tmp_path / 'export_cache.json')
+
+    def export() -> tuple[str, ModifiedTimeCache, dict[str, int]]:
+        with FakeDriveServer(FakeDrive(str(content_dir))) as server:
+            service = download_content._drive_service(None, api_endpoint=server.url)
+            tree = DriveTree(download_content._get_drive_items(service))
+
+            export_cache = ModifiedTimeCache(cache_file)
+            download_content._export_documents(service, tree, export_cache)
+            export_cache.save()
+
+            bio = download_content._download_text(service,
+                                                  tree.items[download_content._get_file_id(tree, ['home', 'bio'])],
+                                                  export_cache)
+
+        return bio, export_cache, server.requests
+
+    documents = len(download_content.EXPORTED_DOCUMENTS)
+
+    # Reading the exported documents is not counted again
+    bio, export_cache, requests = export()
+    assert bio == 'A short biography.\n'
+    assert requests['/files/{id}/export'] == documents
+    assert (export_cache.hits, export_cache.misses) == (0, documents)
+
+    bio, export_cache, requests = export()
+    assert bio == 'A short biography.\n'
+    assert '/files/{id}/export' not in requests
+    assert (export_cache.hits, export_cache.misses) == (documents, 0)
+
+    # Editing a document changes its modification time
+    bio_file = content_dir / 'home' / 'bio.txt'
+    bio_file.write_text('A longer biography.\n')
+    os.utime(bio_file, (1_900_000_000, 1_900_000_000))
+
+    bio, export_cache, requests = export()
+    assert bio == 'A longer biography.\n'
+    assert requests['/files/{id}/export'] == 1
+    assert (export_cache.hits, export_cache.misses) == (documents - 1, 1)
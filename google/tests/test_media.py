@@ -0,0 +1,460 @@
+import os
+import json
+import random
+import shutil
+import sys
+import functools
+import threading
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from PIL import Image
+
+import benchmark
+import download_content
+import fake_drive
+from fake_drive import FakeDrive, FakeDriveServer
+
+
+def _build(monkeypatch, server: FakeDriveServer, output_dir, *args: str):
+    monkeypatch.setattr(sys, 'argv', [
+        'download_content.py',
+        '--api-endpoint', server.url,
+        '--output-dir', str(output_dir),
+        '--cache-dir', str(output_dir.parent / 'cache'),
+        '--workers', '1',
+        *args
+    ])
+    download_content.main()
+
+
+def _output_files(output_dir) -> dict[str, bytes]:
+    """
+    Gets the contents of the files written to the output directory, other than the build report (which has timings)
+    """
+    return {
+        path.name: path.read_bytes()
+        for path in output_dir.iterdir()
+        if path.name != download_content.BUILD_REPORT_FILE
+    }
+
+
+def test_video_that_cannot_be_processed_is_skipped(monkeypatch, tmp_path, drive_content):
+    output_dir = tmp_path / 'content'
+
+    # The generated videos are random bytes, and this "ffmpeg" fails every time, as it would on a corrupt video
+    with FakeDriveServer(FakeDrive(drive_content)) as server:
+        _build(monkeypatch, server, output_dir, '--ffmpeg', 'false')
+
+    videos = json.loads((output_dir / 'video.json').read_text())['videos']
+    assert videos
+    for video in videos:
+        assert 'poster' not in video and 'preview' not in video
+        assert (output_dir / f'{video["blob"]}.{video["extension"]}').is_file()
+
+    manifest = json.loads((output_dir.parent / 'cache' / download_content.BUILD_MANIFEST_FILE).read_text())
+    assert not any(name.startswith(video['blob']) for video in videos for name in manifest)
+
+
+def test_report_is_written_when_the_build_fails(monkeypatch, tmp_path, drive_content):
+    content_dir = tmp_path / 'drive'
+    shutil.copytree(drive_content, content_dir)
+    output_dir = tmp_path / 'content'
+
+    # The served video no longer matches the size listed for it, which is kept as its modification time is unchanged
+    drive = FakeDrive(str(content_dir))
+    video = next(item for item in drive.items.values() if item.resource['mimeType'].startswith('video/'))
+    stat = os.stat(video.path)
+    with open(video.path, 'r+b') as file:
+        file.truncate(1024)
+
+    os.utime(video.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    with FakeDriveServer(drive) as server:
+        with pytest.raises(RuntimeError, match='Downloaded 1024 bytes'):
+            _build(monkeypatch, server, output_dir)
+
+    report = json.loads((output_dir / download_content.BUILD_REPORT_FILE).read_text())
+    failed = next(media_item for media_item in report['media'] if media_item['file_id'] == video.resource['id'])
+
+    assert failed['download']['error'].startswith('RuntimeError: Downloaded 1024 bytes')
+    assert report['stages'][-1]['name'] == 'media'
+
+
+def _fake_ffmpeg(tmp_path) -> str:
+    """
+    Writes a stand-in for ffmpeg, which saves a blank frame, and copies a video rather than transcoding it
+    """
+    ffmpeg = tmp_path / 'ffmpeg'
+    ffmpeg.write_text(f'''#!{sys.executable}
+import shutil
+import sys
+
+from PIL import Image
+
+if sys.argv[-1].endswith('.png'):
+    Image.new('RGB', (64, 36), 'blue').save(sys.argv[-1])
+else:
+    shutil.copy(sys.argv[sys.argv.index('-i') + 1], sys.argv[-1])
+''')
+    ffmpeg.chmod(0o755)
+    return str(ffmpeg)
+
+
+def test_renditions_that_are_turned_off_are_removed(monkeypatch, tmp_path, drive_content):
+    output_dir = tmp_path / 'content'
+    ffmpeg = _fake_ffmpeg(tmp_path)
+
+    def build(*args: str) -> list[dict]:
+        with FakeDriveServer(FakeDrive(drive_content)) as server:
+            _build(monkeypatch, server, output_dir, '--incremental', '--ffmpeg', ffmpeg, *args)
+
+        return json.loads((output_dir / 'video.json').read_text())['videos']
+
+    videos = build('--video-renditions')
+    assert videos
+    for video in videos:
+        assert (output_dir / video['rendition']['file']).is_file()
+
+    # Nothing has changed in Google Drive, so the media data of the videos is read from the previous run
+    videos = build()
+    for video in videos:
+        assert 'rendition' not in video
+        assert (output_dir / video['poster']['file']).is_file()
+
+    assert not list(output_dir.glob('*.web.mp4'))
+
+
+def test_prune_only_deletes_generated_files(tmp_path):
+    blob = 'ab' * 32
+    item_id = '1JWZ4WcU8ZIxZqXa2Xxods5DnjN94O-Ju'
+    kept = [f'{blob}.jpg', 'home.json']
+    generated = [f'{blob[::-1]}.jpg', f'{blob[::-1]}.w640.webp', f'{blob[::-1]}.hero.jpg', f'{item_id}.mp4',
+                 f'{item_id}.poster.jpg']
+    others = ['notes.txt', 'credentials.json', 'download_content.py', 'photo.jpg', '.partial.jpg.part',
+              'background_texture_original.webp', 'background_texture_original.large.jpg', f'{blob[:-1]}.jpg']
+    for file_name in kept + generated + others:
+        (tmp_path / file_name).write_bytes(b'x')
+
+    orphans = download_content._prune_output_dir(str(tmp_path), set(kept), dry_run=False, item_ids={item_id})
+
+    assert sorted(orphans) == sorted(generated)
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(kept + others)
+
+
+def test_versions_of_the_same_size_are_encoded_once(monkeypatch, tmp_path):
+    image_file = tmp_path / 'image.jpg'
+    Image.new('RGB', (2000, 1000), 'white').save(image_file)
+
+    saves = []
+    save = Image.Image.save
+    monkeypatch.setattr(Image.Image, 'save', lambda image, file, *args, **kwargs: (
+        saves.append(os.path.basename(file)), save(image, file, *args, **kwargs)
+    ))
+
+    output_files = download_content._generate_resized_images(str(image_file), ['webp'], [640, 1280, 1920])
+
+    # The large and medium versions are 1920 and 640 pixels wide, so only those and w1280 are encoded
+    assert len(output_files) == 12
+    assert len(saves) == 8
+    for tag, width_tag in [('large', 'w1920'), ('medium', 'w640')]:
+        for extension in ['jpg', 'webp']:
+            assert (tmp_path / f'image.{tag}.{extension}').read_bytes() == \
+                   (tmp_path / f'image.{width_tag}.{extension}').read_bytes()
+
+
+@pytest.mark.filterwarnings('error:.*fork:DeprecationWarning')
+def test_processing_on_a_pool_matches_processing_serially(monkeypatch, tmp_path, drive_content):
+    with FakeDriveServer(FakeDrive(drive_content)) as server:
+        _build(monkeypatch, server, tmp_path / 'serial' / 'content', '--workers', '1')
+        _build(monkeypatch, server, tmp_path / 'pool' / 'content', '--workers', '3')
+
+    serial = _output_files(tmp_path / 'serial' / 'content')
+    assert any(name.endswith('.medium.webp') for name in serial)
+    assert _output_files(tmp_path / 'pool' / 'content') == serial
+
+
+def test_asyncio_transport_matches_httplib2(monkeypatch, tmp_path, drive_content):
+    with FakeDriveServer(FakeDrive(drive_content)) as server:
+        _build(monkeypatch, server, tmp_path / 'httplib2' / 'content', '--transport', 'httplib2')
+        _build(monkeypatch, server, tmp_path / 'asyncio' / 'content', '--transport', 'asyncio')
+
+    assert _output_files(tmp_path / 'asyncio' / 'content') == _output_files(tmp_path / 'httplib2' / 'content')
+
+
+def _processed(output_dir) -> set[str]:
+    """
+    Gets the IDs of the media items whose derived files were created by the last build
+    """
+    report = json.loads((output_dir / download_content.BUILD_REPORT_FILE).read_text())
+    return {
+        media_item['file_id']
+        for media_item in report['media']
+        if 'process' in media_item
+    }
+
+
+def test_only_out_of_date_images_are_resized_again(monkeypatch, tmp_path, drive_content):
+    content_dir = tmp_path / 'drive'
+    shutil.copytree(drive_content, content_dir)
+    output_dir = tmp_path / 'content'
+
+    drive = FakeDrive(str(content_dir))
+    images = {
+        item_id
+        for item_id, item in drive.items.items()
+        if item.resource['mimeType'].startswith('image/')
+    }
+
+    def build(*args: str) -> set[str]:
+        with FakeDriveServer(FakeDrive(str(content_dir))) as server:
+            _build(monkeypatch, server, output_dir, '--formats', 'webp', *args)
+
+        return _processed(output_dir)
+
+    assert build() == images
+
+    # Nothing has changed
+    assert build() == set()
+    report = json.loads((output_dir / download_content.BUILD_REPORT_FILE).read_text())
+    assert report['caches']['resized_images']['misses'] == 0
+
+    # The quality of a format that is not saved
+    formats = {**download_content.IMAGE_FORMATS, 'avif': {'large': 10, 'medium': 10, 'preview': 10}}
+    monkeypatch.setattr(download_content, 'IMAGE_FORMATS', formats)
+    assert build() == set()
+
+    formats = {**formats, 'webp': {'large': 10, 'medium': 10, 'preview': 10}}
+    monkeypatch.setattr(download_content, 'IMAGE_FORMATS', formats)
+    assert build() == images
+
+    assert build('--widths', '160', '320') == images
+    assert build('--widths', '160', '320') == set()
+
+    # A new version of one photo
+    photo = next(
+        item
+        for item in drive.items.values()
+        if item.resource['mimeType'].startswith('image/') and f'{os.sep}portfolio{os.sep}' in item.path
+    )
+    Image.new('RGB', (200, 100), 'red').save(photo.path)
+    assert build('--widths', '160', '320') == {photo.resource['id']}
+
+
+def test_incremental_build_picks_up_a_changed_focus_point(monkeypatch, tmp_path, drive_content):
+    content_dir = tmp_path / 'drive'
+    shutil.copytree(drive_content, content_dir)
+    output_dir = tmp_path / 'content'
+
+    photo_path = sorted((content_dir / 'home' / 'images').glob('*.jpg'))[0]
+    comments_path = str(photo_path) + fake_drive.COMMENTS_SUFFIX
+
+    def write_focus_comment(x: float, modified: float, deleted: bool = False):
+        anchor = json.dumps([None, [None, [x, x, x, x]], None, 'anchor'])
+        with open(comments_path, 'w') as file:
+            json.dump([{'id': 'focus', 'content': 'focus', 'anchor': anchor, 'deleted': deleted}], file)
+
+        os.utime(comments_path, (modified, modified))
+
+    def build() -> tuple[dict, bytes, set[str]]:
+        with FakeDriveServer(FakeDrive(str(content_dir))) as server:
+            _build(monkeypatch, server, output_dir, '--incremental', '--formats', 'webp', '--crops', 'tile')
+
+        home = json.loads((output_dir / 'home.json').read_text())
+        photo = next(photo for photo in home['photos'] if photo['name'] == photo_path.name)
+        return photo, (output_dir / f'{photo["blob"]}.tile.jpg').read_bytes(), _processed(output_dir)
+
+    write_focus_comment(0.25, 1_700_000_000)
+    photo, tile, _ = build()
+    assert photo['focus'] == [0.25, 0.25]
+
+    # Nothing has changed, in the items or their comments
+    assert build() == (photo, tile, set())
+
+    # Editing a comment is not a change to the photo, but its focus point and crops are updated
+    write_focus_comment(0.75, 1_700_000_100)
+    photo, edited_tile, processed = build()
+    assert photo['focus'] == [0.75, 0.75]
+    assert edited_tile != tile
+    assert processed == {photo['file_id']}
+
+    # Once the comment is deleted, the crops are centred again
+    write_focus_comment(0.75, 1_700_000_200, deleted=True)
+    photo, _, processed = build()
+    assert 'focus' not in photo
+    assert processed == {photo['file_id']}
+
+
+def _media(output_dir) -> list[dict]:
+    """
+    Gets the media data of every photo and video in the content written by a build
+    """
+    return download_content._get_media(*[
+        json.loads((output_dir / name).read_text())
+        for name in ['home.json', 'portfolio.json', 'video.json']
+    ])
+
+
+def test_copies_of_the_same_photo_share_one_download(monkeypatch, tmp_path, drive_content):
+    content_dir = tmp_path / 'drive'
+    shutil.copytree(drive_content, content_dir)
+    output_dir = tmp_path / 'content'
+
+    photo = next((content_dir / 'portfolio' / 'album 0').iterdir())
+    (content_dir / 'portfolio' / 'album copy').mkdir()
+    shutil.copy(photo, content_dir / 'portfolio' / 'album copy' / 'copy.jpg')
+
+    with FakeDriveServer(FakeDrive(str(content_dir))) as server:
+        _build(monkeypatch, server, output_dir)
+
+    media = _media(output_dir)
+    copies = [media_item for media_item in media if media_item['name'] in (photo.name, 'copy.jpg')]
+    blobs = {media_item['blob'] for media_item in media}
+
+    assert len(copies) == 2
+    assert copies[0]['blob'] == copies[1]['blob'] and copies[0]['file_id'] != copies[1]['file_id']
+    assert copies[0]['srcset'] == copies[1]['srcset']
+    assert server.requests['/files/{id}'] == len(blobs) == len(media) - 1
+
+    report = json.loads((output_dir / download_content.BUILD_REPORT_FILE).read_text())
+    assert report['deduplication']['items'] == len(media)
+    assert report['deduplication']['blobs'] == len(blobs)
+
+
+def test_media_named_after_item_ids_is_reused(monkeypatch, tmp_path, drive_content):
+    output_dir = tmp_path / 'content'
+    drive = FakeDrive(drive_content)
+
+    with FakeDriveServer(drive) as server:
+        _build(monkeypatch, server, output_dir)
+
+    # Earlier versions named each downloaded file after its item ID
+    media = _media(output_dir)
+    for media_item in media:
+        os.replace(output_dir / f'{media_item["blob"]}.{media_item["extension"]}',
+                   output_dir / f'{media_item["file_id"]}.{media_item["extension"]}')
+
+    with FakeDriveServer(drive) as server:
+        _build(monkeypatch, server, output_dir)
+
+    assert '/files/{id}' not in server.requests
+    for media_item in media:
+        assert (output_dir / f'{media_item["blob"]}.{media_item["extension"]}').is_file()
+        assert not (output_dir / f'{media_item["file_id"]}.{media_item["extension"]}').exists()
+
+
+def test_plan_matches_the_work_of_the_build(monkeypatch, tmp_path, drive_content):
+    output_dir = tmp_path / 'content'
+    plan_file = tmp_path / 'plan.json'
+    drive = FakeDrive(drive_content)
+
+    def plan() -> tuple[dict, dict[str, int]]:
+        with FakeDriveServer(drive) as server, monkeypatch.context() as context:
+            context.setattr(Image, 'open', lambda *args, **kwargs: pytest.fail('An image was opened'))
+            _build(monkeypatch, server, output_dir, '--ffmpeg', 'no-such-ffmpeg', '--plan', str(plan_file))
+
+        return json.loads(plan_file.read_text()), server.requests
+
+    # Only the listing is requested, as nothing is cached
+    first_plan, requests = plan()
+    assert set(requests) == {'/files', '/changes/startPageToken'}
+    assert not output_dir.exists() and not (tmp_path / 'cache').exists()
+
+    with FakeDriveServer(drive) as server:
+        _build(monkeypatch, server, output_dir, '--ffmpeg', 'no-such-ffmpeg')
+
+    report = json.loads((output_dir / download_content.BUILD_REPORT_FILE).read_text())
+    downloads = [media_item['download'] for media_item in report['media'] if 'download' in media_item]
+
+    assert len(first_plan['exports']) == server.requests['/files/{id}/export']
+    assert len(first_plan['comments']) == server.requests['/files/{id}/comments']
+    assert len(first_plan['downloads']) == server.requests['/files/{id}'] == len(downloads)
+    assert first_plan['download_bytes'] == sum(download['received_bytes'] for download in downloads)
+    assert {item['file_id'] for item in first_plan['derived_files']} == _processed(output_dir)
+
+    # Cached comments are checked for changes, but nothing is downloaded or exported
+    last_plan, requests = plan()
+    assert last_plan['up_to_date']
+    assert set(requests) <= {'/files', '/changes/startPageToken', '/files/{id}/comments'}
+
+
+def test_memory_of_a_jpeg_is_estimated_at_the_size_it_is_decoded_to(tmp_path):
+    image_file = tmp_path / 'image.jpg'
+    Image.new('L', (8000, 6000)).save(image_file)
+
+    # As in _generate_resized_images, where the large version is 1920 x 1440
+    with Image.open(image_file) as image:
+        image.draft(image.mode, download_content._image_versions(image.size, [], [], [0.5, 0.5])[2])
+        decoded_pixels = image.width * image.height
+
+    assert decoded_pixels < 8000 * 6000
+    # The large version is also held by the encoder, and the medium version is scaled down from it
+    bytes_per_pixel = download_content.IMAGE_MEMORY_OVERHEAD * download_content.IMAGE_BYTES_PER_PIXEL
+    assert download_content._estimated_image_memory((8000, 6000), 'jpg', [], []) == \
+           round(bytes_per_pixel * (decoded_pixels + 2 * 1920 * 1440 + 640 * 480))
+    assert download_content._estimated_image_memory((8000, 6000), 'png', [], []) == \
+           round(bytes_per_pixel * (8000 * 6000 + 2 * 1920 * 1440 + 640 * 480))
+
+
+@pytest.mark.skipif(not os.path.isfile('/proc/self/clear_refs'), reason='The peak memory cannot be reset')
+@pytest.mark.parametrize('widths, crops', [
+    ([], []),
+    (download_content.IMAGE_WIDTHS, []),
+    (download_content.IMAGE_WIDTHS, list(download_content.IMAGE_CROPS)),
+])
+def test_memory_estimate_covers_the_memory_used(tmp_path, widths, crops):
+    image_file = str(tmp_path / 'image.jpg')
+    fake_drive.write_image(image_file, 12, random.Random(0))
+    with Image.open(image_file) as image:
+        size = image.size
+
+    widths = download_content._responsive_widths(size[0], widths)
+    function = functools.partial(download_content._generate_resized_images,
+                                 image_formats=['webp'], widths=widths, image_crops=crops)
+
+    # The decoders and encoders are loaded by a small image first, as in a worker that has already processed one
+    small_image_file = str(tmp_path / 'small.jpg')
+    fake_drive.write_image(small_image_file, 0.05, random.Random(0))
+
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        executor.submit(function, small_image_file).result()
+        _, peak_rss = executor.submit(benchmark._time_in_process, function, image_file).result()
+
+    assert download_content._estimated_image_memory(size, 'jpg', widths, crops) >= peak_rss * 1024 * 1024
+
+
+def test_jpeg_is_decoded_at_a_reduced_size_for_the_default_widths(tmp_path):
+    image_file = tmp_path / 'image.jpg'
+    Image.new('L', (7745, 5163)).save(image_file)
+    widths = download_content._responsive_widths(7745, download_content.IMAGE_WIDTHS)
+
+    # Half the size is still wider than the largest width, 2560
+    with Image.open(image_file) as image:
+        image.draft(image.mode, download_content._image_versions(image.size, widths, [], [0.5, 0.5])[2])
+        assert image.size == (3873, 2582)
+
+
+def test_image_larger_than_the_memory_budget_waits_then_runs_alone():
+    memory_budget = download_content.MemoryBudget(100)
+    memory_budget.acquire(60)
+
+    def acquire(amount: int) -> threading.Event:
+        acquired = threading.Event()
+        threading.Thread(target=lambda: (memory_budget.acquire(amount), acquired.set()), daemon=True).start()
+        return acquired
+
+    large_acquired = acquire(500)
+    assert not large_acquired.wait(0.1)
+
+    memory_budget.release(60)
+    assert large_acquired.wait(5)
+    assert memory_budget.peak == 500
+
+    # Nothing else runs alongside it
+    small_acquired = acquire(10)
+    assert not small_acquired.wait(0.1)
+
+    memory_budget.release(500)
+    assert small_acquired.wait(5)
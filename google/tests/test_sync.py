@@ -0,0 +1,141 @@
+import os
+import shutil
+
+import pytest
+
+import download_content
+from download_content import DriveItemType, DriveTree, PARENT_DIRECTORY_ID
+from fake_drive import FakeDrive, FakeDriveServer
+
+
+def _folder(item_id: str, parent_id: str) -> dict:
+    return {
+        'id': item_id,
+        'name': item_id,
+        'mimeType': 'application/vnd.google-apps.folder',
+        'parents': [parent_id]
+    }
+
+
+def _photo(item_id: str, parent_id: str) -> dict:
+    return {
+        'id': item_id,
+        'name': f'{item_id}.jpg',
+        'mimeType': 'image/jpeg',
+        'parents': [parent_id],
+        'imageMediaMetadata': {'width': 100, 'height': 100},
+        'fileExtension': 'jpg',
+        'size': '1000',
+        'sha256Checksum': item_id * 8
+    }
+
+
+def test_drive_tree_resolves_paths_and_rejects_duplicate_names():
+    items = {
+        item['id']: download_content._parse_drive_item(item)
+        for item in [
+            _folder('portfolio', PARENT_DIRECTORY_ID),
+            _folder('album_a', 'portfolio'),
+            _folder('album_b', 'portfolio'),
+            _photo('x', 'album_a'),
+            _photo('y', 'album_a'),
+            _photo('z', 'album_b'),
+            # Two directories, and two files, with the same name in the same directory
+            {**_folder('copy_1', 'portfolio'), 'name': 'copy'},
+            {**_folder('copy_2', 'portfolio'), 'name': 'copy'},
+            {**_photo('w_1', 'album_b'), 'name': 'w.jpg'},
+            {**_photo('w_2', 'album_b'), 'name': 'w.jpg'},
+        ]
+    }
+    tree = DriveTree(items)
+
+    assert download_content._get_directory_id(tree, ['portfolio', 'album_b']) == 'album_b'
+    assert download_content._get_file_id(tree, ['portfolio', 'album_a', 'y.jpg']) == 'y'
+    assert download_content._get_items_in_dir(tree, ['portfolio', 'album_a']) == ['x', 'y']
+    assert download_content._get_items_in_dir(tree, ['portfolio', 'album_b']) == ['z', 'w_1', 'w_2']
+    assert tree.children('x') == []
+
+    with pytest.raises(RuntimeError, match='Found 2 directories'):
+        download_content._get_items_in_dir(tree, ['portfolio', 'copy'])
+
+    with pytest.raises(RuntimeError, match='Found 2 files'):
+        download_content._get_file_id(tree, ['portfolio', 'album_b', 'w.jpg'])
+
+    with pytest.raises(RuntimeError, match='Found 0 directories'):
+        download_content._get_file_id(tree, ['portfolio', 'album_c', 'x.jpg'])
+
+    with pytest.raises(RuntimeError, match='Found 0 files'):
+        download_content._get_file_id(tree, ['portfolio', 'album_b', 'x.jpg'])
+
+
+def test_apply_changes_moves_files_between_albums(monkeypatch):
+    previous = [
+        _folder('portfolio', PARENT_DIRECTORY_ID),
+        _folder('album_a', 'portfolio'),
+        _folder('album_b', 'portfolio'),
+        _photo('x', 'album_a'),
+        _photo('y', 'album_b'),
+    ]
+    items = {
+        item['id']: download_content._parse_drive_item(item)
+        for item in previous
+    }
+
+    # x is moved to album B, and y to album A, so whichever album is listed first, the other holds a moved photo
+    listings = {
+        'album_a': [_photo('y', 'album_a')],
+        'album_b': [_photo('x', 'album_b')],
+    }
+    monkeypatch.setattr(download_content, '_list_directory',
+                        lambda service, directory_id: (listings[directory_id], 1))
+
+    changes = [
+        {'fileId': 'x', 'file': _photo('x', 'album_b')},
+        {'fileId': 'y', 'file': _photo('y', 'album_a')},
+    ]
+    updated = download_content._apply_changes(None, items, changes)
+
+    assert updated['x'].parent_id == 'album_b'
+    assert updated['y'].parent_id == 'album_a'
+    assert updated['x'].item_type == DriveItemType.IMAGE
+    assert set(updated) == set(items)
+
+
+def test_sync_drive_items_leaves_state_to_be_saved(monkeypatch, tmp_path):
+    items = {'portfolio': download_content._parse_drive_item(_folder('portfolio', PARENT_DIRECTORY_ID))}
+    monkeypatch.setattr(download_content, '_get_start_page_token', lambda service: '5')
+    monkeypatch.setattr(download_content, '_get_drive_items', lambda service: items)
+
+    synced, changed, state = download_content._sync_drive_items(None, str(tmp_path), True)
+
+    # Nothing is stored until the content has been written, so a failed run is repeated in full
+    assert synced == items and changed
+    assert not (tmp_path / download_content.SYNC_STATE_FILE).exists()
+
+    download_content._save_sync_state(str(tmp_path), state)
+    assert download_content._previous_drive_items(str(tmp_path)) == {
+        'portfolio': download_content._drive_item_to_json(items['portfolio'])
+    }
+
+
+def test_incremental_sync_matches_a_full_listing(tmp_path, drive_content):
+    content_dir = tmp_path / 'drive'
+    shutil.copytree(drive_content, content_dir)
+    cache_dir = str(tmp_path / 'cache')
+
+    with FakeDriveServer(FakeDrive(str(content_dir))) as server:
+        service = download_content._drive_service(None, api_endpoint=server.url)
+        _, _, state = download_content._sync_drive_items(service, cache_dir, True)
+        download_content._save_sync_state(cache_dir, state)
+
+        album = content_dir / 'portfolio' / 'album 0'
+        photos = sorted(album.iterdir())
+        shutil.copy(photos[0], album / 'new photo.jpg')
+        os.remove(photos[1])
+        shutil.move(content_dir / 'home' / 'images', album / 'images')
+
+        items, changed, _ = download_content._sync_drive_items(service, cache_dir, True)
+        expected = download_content._get_drive_items(service)
+
+    assert changed
+    assert items == expected
@@ -0,0 +1,143 @@
+import gzip
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from download_content import AsyncHttp
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """
+    Sends the responses, written out by hand, that AsyncHttp must be able to read
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, headers: dict | None = None):
+        self.send_response(status)
+        for name, value in {'Content-Length': str(len(body)), **(headers or {})}.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/text':
+            self._send(200, b'hello world')
+
+        elif self.path == '/chunked':
+            self.wfile.write(b'HTTP/1.1 200 OK\r\n'
+                             b'Transfer-Encoding: chunked\r\n'
+                             b'\r\n'
+                             b'5\r\nhello\r\n'
+                             b'6;name=value\r\n world\r\n'
+                             b'0\r\n'
+                             b'Trailer: value\r\n'
+                             b'\r\n')
+
+        elif self.path == '/gzip':
+            self._send(200, gzip.compress(b'hello world'), {'Content-Encoding': 'gzip'})
+
+        elif self.path == '/redirect':
+            self._send(302, b'', {'Location': '/text'})
+
+        elif self.path == '/no-content':
+            self.send_response(204)
+            self.end_headers()
+
+        # Neither a length nor chunks, so the body ends when the connection is closed
+        elif self.path == '/until-closed':
+            self.wfile.write(b'HTTP/1.1 200 OK\r\n\r\nhello world')
+            self.close_connection = True
+
+        # The connection is closed without saying so, as a server does when a kept-alive connection times out
+        elif self.path == '/then-close':
+            self._send(200, b'hello world')
+            self.close_connection = True
+
+        else:
+            self._send(404, b'')
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _RequestHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    host, port = server.server_address[:2]
+    yield f'http://{host}:{port}'
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def http():
+    http = AsyncHttp()
+    yield http
+    http.close()
+
+
+def test_chunked_response_is_joined(http, server_url):
+    response, content = http.request(f'{server_url}/chunked')
+
+    assert response.status == 200
+    assert content == b'hello world'
+
+    # The connection is kept alive, once the trailers have been read
+    assert http.request(f'{server_url}/text')[1] == b'hello world'
+    assert http.opened_connections == 1
+
+
+def test_gzip_response_is_decompressed(http, server_url):
+    response, content = http.request(f'{server_url}/gzip')
+
+    assert content == b'hello world'
+    assert response['-content-encoding'] == 'gzip'
+    assert response['content-length'] == str(len(content))
+
+
+def test_redirect_is_followed(http, server_url):
+    response, content = http.request(f'{server_url}/redirect')
+
+    assert response.status == 200
+    assert content == b'hello world'
+    assert response['content-location'] == f'{server_url}/text'
+
+
+def test_no_content_response_has_no_body(http, server_url):
+    response, content = http.request(f'{server_url}/no-content')
+
+    assert response.status == 204
+    assert content == b''
+
+    # Had a body been expected, the next response would have been read as it
+    assert http.request(f'{server_url}/text')[1] == b'hello world'
+    assert http.opened_connections == 1
+
+
+def test_response_without_length_is_read_until_closed(http, server_url):
+    response, content = http.request(f'{server_url}/until-closed')
+
+    assert response.status == 200
+    assert content == b'hello world'
+
+    assert http.request(f'{server_url}/text')[1] == b'hello world'
+    assert http.opened_connections == 2
+
+
+def test_request_on_closed_connection_is_made_again(http, server_url):
+    assert http.request(f'{server_url}/then-close')[1] == b'hello world'
+
+    # The connection was kept, as the server did not say it would close it
+    response, content = http.request(f'{server_url}/text')
+
+    assert response.status == 200
+    assert content == b'hello world'
+    assert http.opened_connections == 2
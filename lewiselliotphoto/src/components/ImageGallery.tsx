@@ -1,7 +1,7 @@
 import { useEffect, useState } from "react";
 
 import LazyLoadImage from "./LazyLoadImage";
-import ImageData from "./imageData";
+import ImageData, { imageFileName } from "./imageData";
 import AnimateOnScroll from "./AnimateOnScroll";
 import ImageSlideshow from '../components/ImageSlideshow';
 
@@ -61,10 +61,14 @@ const ImageGallery = (
                             style={{}}
                         >
                             <LazyLoadImage
-                                preview={`${photoData.file_id}.preview.${photoData.extension}`}
-                                medium={`${photoData.file_id}.medium.${photoData.extension}`}
-                                large={`${photoData.file_id}.large.${photoData.extension}`}
+                                preview={imageFileName(photoData, 'preview')}
+                                medium={imageFileName(photoData, 'medium')}
+                                large={imageFileName(photoData, 'large')}
                                 description={photoData.description}
+                                formats={photoData.formats}
+                                srcset={photoData.srcset}
+                                placeholder={photoData.placeholder}
+                                color={photoData.color}
                                 style={{
                                     width: '100%',
                                     aspectRatio: aspectRatio // photoData.width / photoData.height,
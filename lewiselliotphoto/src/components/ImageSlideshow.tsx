@@ -1,7 +1,7 @@
 import { Dispatch, SetStateAction, useCallback, useEffect, useRef, useState } from "react";
 
 import LazyLoadImage from "./LazyLoadImage";
-import ImageData from "./imageData";
+import ImageData, { imageFileName } from "./imageData";
 
 import './imageSlideshow.css'
 
@@ -144,10 +144,14 @@ const ImageSlideshow = (
                             key={`photo${index}`}
                         >
                             <LazyLoadImage
-                                preview={`${photoData.file_id}.preview.${photoData.extension}`}
-                                medium={`${photoData.file_id}.medium.${photoData.extension}`}
-                                large={`${photoData.file_id}.large.${photoData.extension}`}
+                                preview={imageFileName(photoData, 'preview')}
+                                medium={imageFileName(photoData, 'medium')}
+                                large={imageFileName(photoData, 'large')}
                                 description={photoData.description}
+                                formats={photoData.formats}
+                                srcset={photoData.srcset}
+                                placeholder={photoData.placeholder}
+                                color={photoData.color}
                                 focus={photoData?.focus?.length === 2 ? [photoData.focus[0], photoData.focus[1]] : undefined}
                                 currentIndex={currentIndex}
                                 onMediumLoaded={() => {
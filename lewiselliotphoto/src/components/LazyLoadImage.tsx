@@ -12,8 +12,22 @@ interface LazyLoadImageProps {
     maxMediumSize?: number; ///< The size above which the large version of the image should be used
     currentIndex?: number; ///< The (optional) current index of a parent slideshow  
     onMediumLoaded?: () => void; ///< Callback function when the medium image is loaded
+    formats?: string[]; ///< Other formats in which each image is available, in order of preference (e.g. webp)
+    srcset?: { width: number }[]; ///< Widths at which the large image is also available (as FILE.w{width}.EXT)
+    placeholder?: string; ///< A tiny version of the image (as a data URI), shown instead of loading the preview
+    color?: string; ///< The dominant colour of the image, shown until the placeholder or preview is drawn
 }
 
+interface ImageSources {
+    src: string; ///< The URL of the image in its original format
+    srcSet?: string; ///< The URLs of the image at each width in its original format
+    sources: { type: string, srcSet: string }[]; ///< The URLs of the image in other formats
+}
+
+const noFormats: string[] = []; ///< The default formats, which is a constant so that it is not a new dependency on every render
+const noSrcset: { width: number }[] = []; ///< The default widths, which is a constant for the same reason
+const largeVersion = /\.(?:large|w\d+)\.[^.]+$/; ///< The large version of an image, and its versions at each width (as in the imports below)
+const mediumVersion = /\.medium\.[^.]+$/; ///< The medium version of an image (as in the imports below)
 
 const LazyLoadImage = (
     {
@@ -25,7 +39,11 @@ const LazyLoadImage = (
         focus = [0.5, 0.5],
         maxMediumSize = 300,
         currentIndex = 0,
-        onMediumLoaded = undefined
+        onMediumLoaded = undefined,
+        formats = noFormats,
+        srcset = noSrcset,
+        placeholder = undefined,
+        color = '#EEEEEE'
     }: LazyLoadImageProps
 ) => {
 
@@ -40,9 +58,11 @@ const LazyLoadImage = (
 
     const [inViewport, setInViewport] = useState<boolean>(false);
 
-    const [previewImage, setPreviewImage] = useState<any>(null);
-    const [mediumImage, setMediumImage] = useState<any>(null);
-    const [largeImage, setLargeImage] = useState<any>(null);
+    const [previewImage, setPreviewImage] = useState<ImageSources | null>(
+        placeholder ? { src: placeholder, sources: [] } : null
+    );
+    const [mediumImage, setMediumImage] = useState<ImageSources | null>(null);
+    const [largeImage, setLargeImage] = useState<ImageSources | null>(null);
     
     const [previewActive, setPreviewActive] = useState<boolean>(false);
     const [mediumActive, setMediumActive] = useState<boolean>(false);
@@ -127,11 +147,73 @@ const LazyLoadImage = (
 
     useEffect(() => {
 
+        // Each preview (and original) is in a chunk of its own, as small images are inlined
+        const importImage = async (imageFile: string) => {
+            const response = await import(
+                /* webpackExclude: /\.(?:large|medium|w\d+)\.[^.]+$/ */
+                `../content/${imageFile}`
+            );
+            return response.default;
+        }
+
+        // The URLs of the medium versions, in every format, are all in one chunk that is loaded once, so that each
+        // format does not cost a request for every image in a gallery
+        const importMediumVersion = async (imageFile: string) => {
+            const response = await import(
+                /* webpackInclude: /\.medium\.[^.]+$/ */
+                /* webpackMode: "lazy-once" */
+                /* webpackChunkName: "medium-images" */
+                `../content/${imageFile}`
+            );
+            return response.default;
+        }
+
+        // The URLs of the large versions, at every width and in every format, are all in one chunk that is loaded once,
+        // so that the browser can choose between them without a request for each
+        const importLargeVersion = async (imageFile: string) => {
+            const response = await import(
+                /* webpackInclude: /\.(?:large|w\d+)\.[^.]+$/ */
+                /* webpackMode: "lazy-once" */
+                /* webpackChunkName: "large-images" */
+                `../content/${imageFile}`
+            );
+            return response.default;
+        }
+
+        const importFile = (imageFile: string) => largeVersion.test(imageFile)
+            ? importLargeVersion(imageFile)
+            : mediumVersion.test(imageFile)
+                ? importMediumVersion(imageFile)
+                : importImage(imageFile);
+
         const fetchImage = async (imageFile: string,
-                                  callback: (image: any) => void) => {
-            await import(`../content/${imageFile}`)
-                .then((response) => {
-                    callback(response.default);
+                                  callback: (image: ImageSources) => void,
+                                  widths: number[] = []) => {
+
+            // Either the file itself, or the file at each width
+            const importVersions = (file: string) => Promise.all(
+                widths.length === 0
+                    ? [importFile(file)]
+                    : widths.map((width) => importFile(file.replace(/\.large\.([^.]+)$/, `.w${width}.$1`)))
+            );
+
+            const toSrcSet = (urls: string[]) => widths.length === 0
+                ? urls[0]
+                : urls.map((url, index) => `${url} ${widths[index]}w`).join(', ');
+
+            await Promise.all([
+                importVersions(imageFile),
+                ...formats.map((format) => importVersions(imageFile.replace(/\.[^.]+$/, `.${format}`)))
+            ])
+                .then(([urls, ...formatUrls]) => {
+                    callback({
+                        src: urls[urls.length - 1],
+                        srcSet: widths.length === 0 ? undefined : toSrcSet(urls),
+                        sources: formatUrls.map((versionUrls, index) => ({
+                            type: `image/${formats[index]}`,
+                            srcSet: toSrcSet(versionUrls)
+                        }))
+                    });
                 })
                 .catch((err) => {
                     console.error(err);
@@ -139,23 +221,23 @@ const LazyLoadImage = (
         }
 
         if (previewImage === null && inViewport) {
-            fetchImage(preview, (image: any) => {
+            fetchImage(preview, (image: ImageSources) => {
                 setPreviewImage(image);
             });
             return;
         }
 
         if (mediumImage === null && inViewport) {
-            fetchImage(medium, (image: any) => {
+            fetchImage(medium, (image: ImageSources) => {
                 setMediumImage(image);
             });
             return;
         }
 
         if (largeImage === null && inViewport && dimensions.width > maxMediumSize) {
-            fetchImage(large, (image: any) => {
+            fetchImage(large, (image: ImageSources) => {
                 setLargeImage(image);
-            });
+            }, srcset.map((version) => version.width));
             return;
         }
 
@@ -163,39 +245,53 @@ const LazyLoadImage = (
         dimensions,
         inViewport,
         maxMediumSize,
+        formats,
+        srcset,
         preview, previewImage, setPreviewImage,
         medium, mediumImage, setMediumImage,
         large, largeImage, setLargeImage,
     ]);
 
     const makeImage = (
-        src: string,
+        image: ImageSources,
         zIndex: number,
         active: boolean,
         setActive: any,
         className: string = ''
     ) => {
         return (
-            <img
-                src={src}
-                alt={description}
-                onLoad={setActive}
-                onContextMenu={(e) => {e.preventDefault()}}
-                className={className}
-                style={{
-                    position: 'absolute',
-                    top: 0,
-                    left: 0,
-                    width: '100%',
-                    height: '100%',
-                    zIndex: zIndex,
-                    opacity: active ? 1 : 0,
-                    transition: 'opacity 1s',
-                    objectFit: 'cover',
-                    userSelect: 'none',
-                    objectPosition: `${100 * focus[0]}% ${100 * focus[1]}%`
-                }}
-            />
+            <picture>
+                {image.sources.map((source) => (
+                    <source
+                        key={source.type}
+                        type={source.type}
+                        srcSet={source.srcSet}
+                        sizes={image.srcSet && `${dimensions.width}px`}
+                    />
+                ))}
+                <img
+                    src={image.src}
+                    srcSet={image.srcSet}
+                    sizes={image.srcSet && `${dimensions.width}px`}
+                    alt={description}
+                    onLoad={setActive}
+                    onContextMenu={(e) => {e.preventDefault()}}
+                    className={className}
+                    style={{
+                        position: 'absolute',
+                        top: 0,
+                        left: 0,
+                        width: '100%',
+                        height: '100%',
+                        zIndex: zIndex,
+                        opacity: active ? 1 : 0,
+                        transition: 'opacity 1s',
+                        objectFit: 'cover',
+                        userSelect: 'none',
+                        objectPosition: `${100 * focus[0]}% ${100 * focus[1]}%`
+                    }}
+                />
+            </picture>
         )
     };
 
@@ -210,10 +306,10 @@ const LazyLoadImage = (
                     transition: 'opacity 0.5s'
                 };
                 
-                if (!previewImage) {
+                if (!previewImage || !previewActive) {
                     theStyle = {
                         ...theStyle,
-                        backgroundColor: '#EEEEEE',
+                        backgroundColor: color,
                     }
                 }
                 
@@ -1,10 +1,24 @@
 interface ImageData {
     file_id: string;
+    blob?: string; ///< Content hash the media files are stored under, shared by duplicates
     extension: string;
     description: string;
     width: number;
     height: number;
     focus?: number[];
+    formats?: string[];
+    srcset?: { width: number, height: number, bytes: { [format: string]: number } }[];
+    placeholder?: string;
+    color?: string;
+    crops?: { [crop: string]: { width: number, height: number } };
 }
 
+/**
+ * Get the name of a downloaded image file, or one of its derivatives
+ * @param image The image to get the file name of
+ * @param tag The derivative to get (e.g. "large"), or the original if not given
+ */
+export const imageFileName = (image: { file_id: string, blob?: string, extension: string }, tag?: string) =>
+    `${image.blob ?? image.file_id}${tag ? `.${tag}` : ''}.${image.extension}`;
+
 export default ImageData;
\ No newline at end of file
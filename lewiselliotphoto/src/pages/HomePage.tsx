@@ -3,6 +3,7 @@ import { useEffect, useRef, useState } from "react";
 import AnimateOnScroll from "../components/AnimateOnScroll";
 import ImageSlideshow from "../components/ImageSlideshow";
 import LazyLoadImage from "../components/LazyLoadImage";
+import { imageFileName } from "../components/imageData";
 import Footer from "../components/Footer";
 
 import homeContent from "../content/home.json"
@@ -107,9 +108,9 @@ const HomePage = () => {
                   rel="noreferrer"
                 >
                   <LazyLoadImage
-                    preview={`${quote.photo.file_id}.${quote.photo.extension}`}
-                    medium={`${quote.photo.file_id}.${quote.photo.extension}`}
-                    large={`${quote.photo.file_id}.${quote.photo.extension}`}
+                    preview={imageFileName(quote.photo)}
+                    medium={imageFileName(quote.photo)}
+                    large={imageFileName(quote.photo)}
                     description={quote.photo.description}
                     style={{
                         width: '50px',
@@ -154,9 +155,9 @@ const HomePage = () => {
                   }}
                 >
                   <LazyLoadImage
-                    preview={`${nameCheck.photo.file_id}.${nameCheck.photo.extension}`}
-                    medium={`${nameCheck.photo.file_id}.${nameCheck.photo.extension}`}
-                    large={`${nameCheck.photo.file_id}.${nameCheck.photo.extension}`}
+                    preview={imageFileName(nameCheck.photo)}
+                    medium={imageFileName(nameCheck.photo)}
+                    large={imageFileName(nameCheck.photo)}
                     description={nameCheck.photo.name}
                     style={{
                       width: '100%',